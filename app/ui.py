@@ -12,13 +12,13 @@ import sys
 import time
 from typing import Optional, Tuple
 import io
-import zipfile
 
 # Добавляем путь к модулям проекта
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.processors.background import BackgroundRemover
 from src.utils.image_helpers import calculate_image_complexity
+from src.utils.zip_policy import open_zip, write_entry
 
 
 class ImageProcessorUI:
@@ -122,7 +122,7 @@ class ImageProcessorUI:
             # Создаем временный zip архив
             zip_buffer = io.BytesIO()
             
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            with open_zip(zip_buffer) as zip_file:
                 processed = 0
                 errors = 0
                 
@@ -139,7 +139,7 @@ class ImageProcessorUI:
                         result.save(img_buffer, format='PNG')
                         
                         filename = Path(file.name).stem + '_no_bg.png'
-                        zip_file.writestr(filename, img_buffer.getvalue())
+                        write_entry(zip_file, filename, img_buffer.getvalue())
                         
                         processed += 1
                         
@@ -5,14 +5,19 @@ YM Image Processor - версия с внешним API (Fal.ai)
 import os
 import io
 import base64
-import requests
 from flask import Flask, render_template_string, request, jsonify, send_file
 from PIL import Image
 import time
 from src.models.model_registry import ModelRegistry
+from src.processors.inference_backends import SegmentationBackends, FAL_PROVIDER
+from src.utils.concurrency import AdaptiveConcurrencyLimiter
+from src.utils.rate_limit import rate_limiters, request_priority, retry_rate_limited, INTERACTIVE
 
 app = Flask(__name__)
 model_registry = ModelRegistry()
+segmentation_backends = SegmentationBackends()  # Изображения передаются как data URL
+# Общий с пакетной обработкой лимит запросов к fal; запросы этого API обслуживаются в первую очередь
+fal_limiter = AdaptiveConcurrencyLimiter('fal', rate_limiter=rate_limiters['fal'])
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max
 
 # API ключ из переменной окружения
@@ -506,39 +511,33 @@ def process():
                                      status=f'Ошибка: {str(e)}',
                                      status_class='error')
 
+def call_model(backend, endpoint, image, arguments):
+    """Вызов модели через общий лимит fal (после 429 ждём Retry-After и повторяем)"""
+    def call():
+        with fal_limiter.slot(endpoint=endpoint):
+            return backend.remove_background(endpoint, image, arguments)
+    return retry_rate_limited(call)
+
+@request_priority(INTERACTIVE)
 def remove_background_fal(image):
     """
     Удаление фона через вашу натренированную LoRA модель на Fal.ai
-    Используем FLUX Kontext для умного редактирования с правильным fal_client
+    Используем FLUX Kontext через backend удаления фона (SEGMENTATION_BACKEND=rembg — без сети)
     """
     try:
-        import fal_client
-        print("✅ fal_client импортирован успешно")
+        backend = segmentation_backends.get(FAL_PROVIDER)
         
         # Проверяем переменные окружения
-        if not os.environ.get('FAL_KEY') and not os.environ.get('FAL_API_KEY'):
+        if not backend.is_configured():
             print("❌ Ни FAL_KEY, ни FAL_API_KEY не настроены в переменных окружения")
             return None
         
-        # Конвертируем изображение в base64 для отправки
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
-        
         # Получаем путь к вашей LoRA модели из переменных окружения
         lora_path = os.environ.get('LORA_PATH', 
             'https://v3.fal.media/files/rabbit/McQtMDl9HQ2cKh0_E-CrO_adapter_model.safetensors')
         
-        # Настройка для отладки прогресса
-        def on_queue_update(update):
-            if isinstance(update, fal_client.InProgress):
-                print(f"Processing: {len(update.logs)} logs received")
-                for log in update.logs:
-                    print(f"  {log.get('message', '')}")
-        
-        # Используем FLUX Kontext с вашей LoRA моделью через официальный клиент
+        # Используем FLUX Kontext с вашей LoRA моделью, изображение передаётся как data URL
         arguments = {
-            "image_url": f"data:image/png;base64,{img_base64}",
             "prompt": "remove background, place product on pure white background, keep shadows for realism, professional product photography",
             "num_inference_steps": 30,
             "guidance_scale": 2.5,
@@ -553,25 +552,9 @@ def remove_background_fal(image):
             "resolution_mode": "match_input"
         }
         
-        # Отправляем запрос с подпиской на обновления
-        print("🔄 Отправляем запрос к FLUX Kontext LoRA...")
-        result = fal_client.subscribe(
-            "fal-ai/flux-kontext-lora",
-            arguments=arguments,
-            with_logs=True,
-            on_queue_update=on_queue_update,
-        )
-        
-        # Обрабатываем результат
-        print(f"📋 Результат API: {type(result)}")
-        if result:
-            print(f"📋 Ключи в результате: {list(result.keys()) if isinstance(result, dict) else 'не dict'}")
-        
-        if result and 'images' in result and len(result['images']) > 0:
-            img_url = result['images'][0]['url']
-            # Загружаем результат
-            img_response = requests.get(img_url)
-            result_image = Image.open(io.BytesIO(img_response.content))
+        print(f"🔄 Отправляем запрос к FLUX Kontext LoRA ({backend.name})...")
+        result_image = call_model(backend, "fal-ai/flux-kontext-lora", image, arguments)
+        if result_image is not None:
             print("✅ Успешно обработано с FLUX Kontext LoRA")
             return result_image
         
@@ -579,19 +562,8 @@ def remove_background_fal(image):
         
         # Fallback на обычное удаление фона если LoRA не сработала
         print("🔄 Пробуем fallback на BiRefNet...")
-        
-        fallback_result = fal_client.subscribe(
-            "fal-ai/birefnet",
-            arguments={
-                "image_url": f"data:image/png;base64,{img_base64}"
-            },
-            with_logs=True,
-            on_queue_update=on_queue_update,
-        )
-        
-        if fallback_result and 'image' in fallback_result:
-            img_response = requests.get(fallback_result['image']['url'])
-            result_image = Image.open(io.BytesIO(img_response.content))
+        result_image = call_model(backend, "fal-ai/birefnet", image, {})
+        if result_image is not None:
             print("✅ Успешно обработано с BiRefNet fallback")
             return result_image
         
@@ -9,7 +9,7 @@ import json
 import time
 import base64
 from pathlib import Path
-from flask import Flask, render_template_string, request, jsonify, send_file
+from flask import Flask, Response, render_template_string, request, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
 from PIL import Image
 import threading
@@ -18,6 +18,11 @@ from queue import Queue
 # Import our processors
 from src.processors.batch_processor import BatchProcessor
 from src.processors.smart_positioning import SmartPositioning
+from src.utils.rate_limit import request_priority, INTERACTIVE
+from app_progress import (
+    progress_data, single_progress_data, open_batch_progress, make_progress_callback,
+    complete_progress, fail_progress, open_single_progress, update_single_progress, event_stream_response
+)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max for batch
@@ -26,10 +31,6 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-change-in-produ
 # Initialize batch processor
 batch_processor = BatchProcessor()
 
-# Progress tracking
-progress_data = {}
-single_progress_data = {}
-
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
 <html>
@@ -573,8 +574,8 @@ HTML_TEMPLATE = '''
                 if (response.ok) {
                     const result = await response.json();
                     
-                    // Start polling for progress
-                    pollProgress(result.batch_id);
+                    // Subscribe to progress events
+                    streamProgress(result.batch_id, result.total);
                 } else {
                     alert('Ошибка при обработке');
                     processBtn.disabled = false;
@@ -586,22 +587,36 @@ HTML_TEMPLATE = '''
             }
         });
         
-        async function pollProgress(batchId) {
-            const interval = setInterval(async () => {
-                try {
-                    const response = await fetch(`/progress/${batchId}`);
-                    const data = await response.json();
-                    
-                    updateProgress(data);
-                    
-                    if (data.completed) {
-                        clearInterval(interval);
-                        showDownloadSection(data);
-                    }
-                } catch (error) {
-                    console.error('Error polling progress:', error);
+        function streamProgress(batchId, total) {
+            // EventSource reconnects on its own and resumes from Last-Event-ID
+            const state = { total: total, processed: 0, files: [] };
+            const source = new EventSource(`/progress_stream/${batchId}`);
+            
+            source.addEventListener('file', (event) => {
+                const file = JSON.parse(event.data);
+                state.processed = file.processed;
+                state.total = file.total;
+                
+                const existing = state.files.findIndex(f => f.name === file.name);
+                if (existing >= 0) {
+                    state.files[existing] = file;
+                } else {
+                    state.files.push(file);
                 }
-            }, 1000);
+                updateProgress(state);
+            });
+            
+            source.addEventListener('done', (event) => {
+                source.close();
+                showDownloadSection(Object.assign(state, JSON.parse(event.data)));
+            });
+            
+            source.addEventListener('failed', (event) => {
+                source.close();
+                console.error('Batch failed:', JSON.parse(event.data).error);
+                alert('Ошибка при обработке');
+                processBtn.disabled = false;
+            });
         }
         
         function updateProgress(data) {
@@ -703,12 +718,7 @@ def process_batch():
         
         # Generate batch ID
         batch_id = f"batch_{int(time.time())}"
-        progress_data[batch_id] = {
-            'total': len(files),
-            'processed': 0,
-            'files': [],
-            'completed': False
-        }
+        open_batch_progress(batch_id, len(files))
         
         # Convert files to data before background processing
         file_data = []
@@ -747,46 +757,45 @@ def process_files_background(file_data_list, batch_id, enhance, debug):
         # Set debug mode if requested
         batch_processor.positioner.set_debug_mode(debug)
         
-        def progress_callback(data):
-            progress_data[batch_id]['processed'] = data['processed']
-            progress_data[batch_id]['current_file'] = data['current_file']
-            
-            # Update file status
-            file_status = {
-                'name': data['current_file'],
-                'status': data['status'],
-                'index': data['processed'] - 1
-            }
-            
-            # Update or append file status
-            existing = False
-            for i, f in enumerate(progress_data[batch_id]['files']):
-                if f['name'] == data['current_file']:
-                    progress_data[batch_id]['files'][i] = file_status
-                    existing = True
-                    break
-            
-            if not existing:
-                progress_data[batch_id]['files'].append(file_status)
-        
-        # Process batch
-        result = batch_processor.process_batch(files, progress_callback)
+        # Process batch under the same ID the client polls
+        result = batch_processor.process_batch(files, make_progress_callback(batch_id), batch_id=batch_id)
         
         # Mark as completed
-        progress_data[batch_id]['completed'] = True
-        progress_data[batch_id]['result'] = result
-        progress_data[batch_id]['successful'] = result['successful']
-        progress_data[batch_id]['failed'] = result['failed']
-        progress_data[batch_id]['zip_path'] = result['zip_path']
-        progress_data[batch_id]['batch_id'] = result['batch_id']  # Add batch_id to progress data
-        progress_data[batch_id]['processing_time'] = time.time() - int(batch_id.split('_')[1])
+        complete_progress(batch_id, result)
         
         print(f"Batch {batch_id} completed. ZIP path: {result['zip_path']}")  # Debug log
         
     except Exception as e:
         print(f"Error in background processing: {e}")
-        progress_data[batch_id]['completed'] = True
-        progress_data[batch_id]['error'] = str(e)
+        fail_progress(batch_id, str(e))
+
+@app.route('/resume/<batch_id>', methods=['POST'])
+def resume_batch(batch_id):
+    """Resume interrupted batch from its checkpoints"""
+    if batch_id in progress_data and not progress_data[batch_id].get('completed'):
+        return jsonify({'error': 'Batch is already running'}), 409
+    
+    files = batch_processor.checkpoints.get_files(batch_id)
+    if not files:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    open_batch_progress(batch_id, len(files))
+    
+    thread = threading.Thread(target=resume_batch_background, args=(batch_id,))
+    thread.start()
+    
+    return jsonify({'batch_id': batch_id, 'total': len(files)})
+
+def resume_batch_background(batch_id):
+    """Background resume of an interrupted batch"""
+    try:
+        result = batch_processor.resume_batch(batch_id, make_progress_callback(batch_id))
+        complete_progress(batch_id, result)
+        print(f"Batch {batch_id} resumed and completed. ZIP path: {result['zip_path']}")
+        
+    except Exception as e:
+        print(f"Error resuming batch: {e}")
+        fail_progress(batch_id, str(e))
 
 @app.route('/progress/<batch_id>')
 def get_progress(batch_id):
@@ -795,9 +804,28 @@ def get_progress(batch_id):
         return jsonify(progress_data[batch_id])
     return jsonify({'error': 'Batch not found'}), 404
 
+@app.route('/progress_stream/<batch_id>')
+def progress_stream(batch_id):
+    """Stream per-file progress events (Server-Sent Events)"""
+    return event_stream_response(batch_id)
+
+@app.route('/metrics')
+def metrics():
+    """Runtime metrics: adaptive concurrency limits and their signals"""
+    return jsonify(batch_processor.get_metrics())
+
 @app.route('/download/<batch_id>')
 def download_results(batch_id):
-    """Download ZIP archive of results"""
+    """Download ZIP archive of results (streamed while the batch is still running)"""
+    if batch_id in progress_data and not progress_data[batch_id].get('completed'):
+        stream = batch_processor.stream_batch_archive(
+            batch_id, lambda: not progress_data[batch_id].get('completed'))
+        return Response(
+            stream_with_context(stream),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename={batch_id}_results.zip'}
+        )
+    
     # First check in-memory progress data
     if batch_id in progress_data and progress_data[batch_id].get('completed'):
         zip_path = progress_data[batch_id].get('zip_path')
@@ -1482,8 +1510,8 @@ SINGLE_TEMPLATE = '''
                     const result = await response.json();
                     currentProcessingId = result.processing_id;
                     
-                    // Poll for results
-                    pollSingleProgress(result.processing_id);
+                    // Subscribe to progress events
+                    streamSingleProgress(result.processing_id);
                 } else {
                     throw new Error('Processing failed');
                 }
@@ -1494,24 +1522,20 @@ SINGLE_TEMPLATE = '''
             }
         });
         
-        async function pollSingleProgress(processingId) {
-            const interval = setInterval(async () => {
-                try {
-                    const response = await fetch(`/single_progress/${processingId}`);
-                    const data = await response.json();
-                    
-                    updateSingleProgress(data);
-                    
-                    if (data.completed) {
-                        clearInterval(interval);
-                        processBtn.disabled = false;
-                    }
-                } catch (error) {
-                    console.error('Error polling progress:', error);
-                    clearInterval(interval);
+        function streamSingleProgress(processingId) {
+            // Each event carries only the changed fields, merged into local state
+            const state = {};
+            const source = new EventSource(`/single_progress_stream/${processingId}`);
+            
+            source.addEventListener('update', (event) => {
+                Object.assign(state, JSON.parse(event.data));
+                updateSingleProgress(state);
+                
+                if (state.completed) {
+                    source.close();
                     processBtn.disabled = false;
                 }
-            }, 1000);
+            });
         }
         
         function updateSingleProgress(data) {
@@ -1765,17 +1789,7 @@ def process_single():
         
         # Generate processing ID
         processing_id = f"single_{int(time.time())}"
-        single_progress_data[processing_id] = {
-            'processing_id': processing_id,
-            'current_step': 'analysis',
-            'analysis_completed': False,
-            'background_processing': False,
-            'background_completed': False,
-            'final_processing': False,
-            'final_completed': False,
-            'completed': False,
-            'error': None
-        }
+        open_single_progress(processing_id)
         
         # Read file content
         file_content = file.stream.read()
@@ -1804,6 +1818,11 @@ def get_single_progress(processing_id):
         return jsonify(single_progress_data[processing_id])
     return jsonify({'error': 'Processing not found'}), 404
 
+@app.route('/single_progress_stream/<processing_id>')
+def single_progress_stream(processing_id):
+    """Stream single processing step updates (Server-Sent Events)"""
+    return event_stream_response(processing_id)
+
 @app.route('/single_image/<processing_id>/<step>')
 def get_single_image(processing_id, step):
     """Get processed image from specific step"""
@@ -1818,8 +1837,10 @@ def get_single_image(processing_id, step):
     
     return "Image not found", 404
 
+@request_priority(INTERACTIVE)
 def process_single_background(file_data, processing_id, enhance, debug, custom_prompt, custom_prompt_text, model_id=None):
-    """Background processing for single image"""
+    """Background processing for single image (its provider calls go ahead of queued batch calls)"""
+    speculation = None
     try:
         # Create processing directory
         process_dir = Path(f"processed/single_{processing_id}")
@@ -1836,45 +1857,57 @@ def process_single_background(file_data, processing_id, enhance, debug, custom_p
         image = Image.open(file_wrapper.stream).convert('RGBA')
         image.save(original_path, 'PNG')
         
-        # Step 2: GPT Analysis
-        single_progress_data[processing_id]['current_step'] = 'analysis'
-        analysis = batch_processor.gpt_analyzer.analyze_image(image)
-        single_progress_data[processing_id]['analysis_data'] = analysis
-        single_progress_data[processing_id]['analysis_completed'] = True
-        
-        # Determine prompt to use
+        # Background removal starts before analysis finishes: a custom prompt does
+        # not depend on it, otherwise LoRA runs with a guessed prompt meanwhile
+        background = speculation = None
         if custom_prompt and custom_prompt_text:
             prompt_to_use = custom_prompt_text
         elif custom_prompt and not custom_prompt_text:
             prompt_to_use = "Clean product photo: keep only the main item and its natural shadow on pure #FFFFFF background; remove any extra elements (text, frames, logos, graphics); keep original resolution, no upscaling."
+        if custom_prompt:
+            background = batch_processor.speculation.start_background(image, prompt_to_use, model_id)
         else:
-            prompt_to_use = batch_processor.gpt_analyzer.create_lora_prompt(analysis)
+            speculation = batch_processor.speculation.start(image, file_wrapper.filename, model_id)
+        
+        # Step 2: GPT Analysis
+        update_single_progress(processing_id, current_step='analysis')
+        analysis = batch_processor.gpt_analyzer.analyze_image(image)
+        update_single_progress(processing_id, analysis_data=analysis, analysis_completed=True)
+        product_analysis = analysis['analysis'] if analysis.get('success') else analysis.get('fallback', {})
+        
+        if not custom_prompt:
+            prompt_to_use = batch_processor.gpt_analyzer.create_lora_prompt(product_analysis)
         
-        single_progress_data[processing_id]['prompt_used'] = prompt_to_use
-        single_progress_data[processing_id]['model_id'] = model_id
+        update_single_progress(processing_id, prompt_used=prompt_to_use, model_id=model_id)
         
         # Step 3: Background removal
-        single_progress_data[processing_id]['current_step'] = 'background'
-        single_progress_data[processing_id]['background_processing'] = True
+        update_single_progress(processing_id, current_step='background', background_processing=True)
         
-        no_bg_image = batch_processor._remove_background_fal_v2(image, prompt_to_use, model_id)
+        if background is not None:
+            no_bg_image = background.result()
+        else:
+            no_bg_image = None
+            if speculation is not None:
+                no_bg_image = batch_processor.speculation.result(
+                    speculation, product_analysis, prompt_to_use)
+                speculation = None
+            if no_bg_image is None:
+                no_bg_image = batch_processor._remove_background_fal_v2(image, prompt_to_use, model_id)
         if no_bg_image:
             no_bg_path = process_dir / "background.png"
             no_bg_image.save(no_bg_path, 'PNG')
-            single_progress_data[processing_id]['background_image_url'] = f"/single_image/{processing_id}/background"
+            update_single_progress(processing_id, background_image_url=f"/single_image/{processing_id}/background")
         else:
             raise Exception("Background removal failed")
             
-        single_progress_data[processing_id]['background_processing'] = False
-        single_progress_data[processing_id]['background_completed'] = True
+        update_single_progress(processing_id, background_processing=False, background_completed=True)
         
         # Step 4: Smart positioning (if enhance is enabled)
-        single_progress_data[processing_id]['current_step'] = 'final'
-        single_progress_data[processing_id]['final_processing'] = True
+        update_single_progress(processing_id, current_step='final', final_processing=True)
         
         if enhance:
             # Apply smart positioning
-            canvas_settings = analysis.get('canvas_settings', {})
+            canvas_settings = product_analysis.get('canvas_settings', {})
             size = canvas_settings.get('size', '1600x1600')
             positioning = canvas_settings.get('positioning', 'centered')
             
@@ -1890,16 +1923,16 @@ def process_single_background(file_data, processing_id, enhance, debug, custom_p
         # Save final image
         final_path = process_dir / "final.png"
         final_image.save(final_path, 'PNG')
-        single_progress_data[processing_id]['final_image_url'] = f"/single_image/{processing_id}/final"
+        update_single_progress(processing_id, final_image_url=f"/single_image/{processing_id}/final")
         
-        single_progress_data[processing_id]['final_processing'] = False
-        single_progress_data[processing_id]['final_completed'] = True
-        single_progress_data[processing_id]['completed'] = True
+        update_single_progress(processing_id, final_processing=False, final_completed=True, completed=True)
         
     except Exception as e:
         print(f"Error in single processing: {e}")
-        single_progress_data[processing_id]['error'] = str(e)
-        single_progress_data[processing_id]['completed'] = True
+        if speculation is not None:
+            # Processing stopped before the speculative LoRA result was used
+            batch_processor.speculation.discard(speculation)
+        update_single_progress(processing_id, error=str(e), completed=True)
 
 @app.route('/health')
 def health():
@@ -0,0 +1,116 @@
+"""
+Progress tracking for the batch web app
+In-memory progress of batches and single processing, published as Server-Sent Events
+"""
+
+import time
+from flask import Response, request, jsonify, stream_with_context
+
+from src.utils.progress_events import ProgressEventLog
+
+# Progress tracking (progress_events carries per-file deltas for SSE clients)
+progress_data = {}
+single_progress_data = {}
+progress_events = ProgressEventLog()
+
+def open_batch_progress(batch_id, total):
+    """Start progress of a batch and its event stream"""
+    progress_data[batch_id] = {
+        'total': total,
+        'processed': 0,
+        'files': [],
+        'completed': False
+    }
+    progress_events.open(batch_id)
+
+def make_progress_callback(batch_id):
+    """Create progress callback that updates progress_data of a batch"""
+    def progress_callback(data):
+        progress_data[batch_id]['processed'] = data['processed']
+        progress_data[batch_id]['current_file'] = data['current_file']
+        progress_data[batch_id]['concurrency'] = data.get('concurrency')
+
+        # Update file status
+        file_status = {
+            'name': data['current_file'],
+            'status': data['status'],
+            'index': data['processed'] - 1
+        }
+
+        # Update or append file status
+        existing = False
+        for i, f in enumerate(progress_data[batch_id]['files']):
+            if f['name'] == data['current_file']:
+                progress_data[batch_id]['files'][i] = file_status
+                existing = True
+                break
+
+        if not existing:
+            progress_data[batch_id]['files'].append(file_status)
+
+        progress_events.publish(batch_id, 'file', dict(file_status, processed=data['processed'], total=data['total']))
+
+    return progress_callback
+
+def complete_progress(batch_id, result):
+    """Store final batch result in progress_data"""
+    progress_data[batch_id]['completed'] = True
+    progress_data[batch_id]['result'] = result
+    progress_data[batch_id]['successful'] = result['successful']
+    progress_data[batch_id]['failed'] = result['failed']
+    progress_data[batch_id]['zip_path'] = result['zip_path']
+    progress_data[batch_id]['batch_id'] = result['batch_id']  # Add batch_id to progress data
+    progress_data[batch_id]['processing_time'] = time.time() - int(batch_id.split('_')[1])
+
+    progress_events.publish(batch_id, 'done', {
+        key: progress_data[batch_id][key]
+        for key in ('batch_id', 'total', 'processed', 'successful', 'failed', 'processing_time')
+    })
+    progress_events.close(batch_id)
+
+def fail_progress(batch_id, error):
+    """Store batch failure in progress_data"""
+    progress_data[batch_id]['completed'] = True
+    progress_data[batch_id]['error'] = error
+    progress_events.publish(batch_id, 'failed', {'error': error})
+    progress_events.close(batch_id)
+
+def open_single_progress(processing_id):
+    """Start progress of single processing and its event stream"""
+    single_progress_data[processing_id] = {
+        'processing_id': processing_id,
+        'current_step': 'analysis',
+        'analysis_completed': False,
+        'background_processing': False,
+        'background_completed': False,
+        'final_processing': False,
+        'final_completed': False,
+        'completed': False,
+        'error': None
+    }
+    progress_events.open(processing_id)
+    progress_events.publish(processing_id, 'update', single_progress_data[processing_id])
+
+def update_single_progress(processing_id, **fields):
+    """Update single processing progress and publish changed fields"""
+    single_progress_data[processing_id].update(fields)
+    progress_events.publish(processing_id, 'update', fields)
+    if fields.get('completed'):
+        progress_events.close(processing_id)
+
+def event_stream_response(stream_id):
+    """SSE response for a progress stream, resuming after Last-Event-ID"""
+    if not progress_events.has_stream(stream_id):
+        return jsonify({'error': 'Not found'}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '0')
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+
+    return Response(
+        stream_with_context(progress_events.stream(stream_id, last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк CPU-стадий (позиционирование + кодирование)
+Сравнивает пул потоков и пул процессов с передачей пикселей через shared memory
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.processors.cpu_offload import ProcessOffload, position_and_encode
+from src.processors.smart_positioning import SmartPositioning
+
+
+def make_image(index, size):
+    """Создать RGBA-изображение товара на прозрачном фоне"""
+    image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    margin = size // 8 + index % 50
+    draw.ellipse([margin, margin, size - margin, size - margin // 2], fill=(200, 60 + index % 150, 40, 255))
+    return image
+
+
+ANALYSIS = {'geometry': {'orientation': 'standard'}, 'canvas_settings': {'positioning': 'centered'}}
+
+
+def run_threads(images, workers, jpeg):
+    """Позиционирование и кодирование в пуле потоков"""
+    positioner = SmartPositioning()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda img: position_and_encode(img, ANALYSIS, positioner, jpeg), images))
+
+
+def run_processes(images, workers, jpeg):
+    """Позиционирование и кодирование в пуле процессов"""
+    offload = ProcessOffload(workers)
+    try:
+        # Прогрев: запуск процессов не входит в замер
+        offload.position_and_encode(images[0], ANALYSIS, jpeg)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda img: offload.position_and_encode(img, ANALYSIS, jpeg), images))
+        return time.perf_counter() - start
+    finally:
+        offload.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк CPU-стадий: потоки против процессов')
+    parser.add_argument('--images', type=int, default=32, help='Количество изображений')
+    parser.add_argument('--size', type=int, default=1600, help='Сторона исходного изображения')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Количество воркеров')
+    parser.add_argument('--jpeg', action='store_true', help='Кодировать результат в JPEG')
+    args = parser.parse_args()
+
+    images = [make_image(i, args.size) for i in range(args.images)]
+    print(f"🖼️ {args.images} изображений {args.size}×{args.size}, воркеров: {args.workers}")
+
+    start = time.perf_counter()
+    run_threads(images, args.workers, args.jpeg)
+    threads_time = time.perf_counter() - start
+    print(f"🧵 Потоки:   {threads_time:.2f}s ({args.images / threads_time:.1f} изобр/с)")
+
+    processes_time = run_processes(images, args.workers, args.jpeg)
+    print(f"⚙️ Процессы: {processes_time:.2f}s ({args.images / processes_time:.1f} изобр/с)")
+    print(f"📊 Ускорение: x{threads_time / processes_time:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк уменьшения входа до max_resolution модели
+Сравнивает размер загрузки и время подготовки/восстановления по размеру входа;
+с --live дополнительно замеряет полный вызов BiRefNet на fal.ai (нужен FAL_KEY)
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.inference_resize import DEFAULT_MAX_RESOLUTION, fit_within, restore_resolution
+
+
+def make_photo(side):
+    """Создать «фото» товара заданного размера"""
+    image = Image.new('RGB', (side, side), (235, 235, 230))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, side, max(1, side // 64)):
+        draw.line([(i, 0), (side - i, side)], fill=(i % 255, 90, 160), width=2)
+    draw.ellipse([side // 4, side // 5, side * 3 // 4, side * 4 // 5], fill=(180, 40, 40))
+    # Шум сенсора: без него PNG синтетики сжимается нереалистично хорошо
+    noise = Image.effect_noise((side, side), 12).convert('RGB')
+    return Image.blend(image, noise, 0.15)
+
+
+def png_size(image):
+    """Размер PNG в байтах и время кодирования"""
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return len(buffer.getvalue()), time.perf_counter() - start
+
+
+def run_live(image, downscale):
+    """Полный вызов BiRefNet через BatchProcessor"""
+    os.environ['INFERENCE_DOWNSCALE'] = '1' if downscale else '0'
+    from src.processors.batch_processor import BatchProcessor
+    processor = BatchProcessor()
+    start = time.perf_counter()
+    processor._remove_background_birefnet(image)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк уменьшения входа перед инференсом')
+    parser.add_argument('--sizes', default='1024,2048,3000,4096', help='Стороны входа через запятую')
+    parser.add_argument('--live', action='store_true', help='Замерить реальный вызов BiRefNet (FAL_KEY)')
+    args = parser.parse_args()
+
+    print(f"{'Вход':>10} | {'PNG полный':>11} | {'PNG уменьш.':>11} | {'кодир. полн.':>12} | "
+          f"{'уменьш.+кодир.':>14} | {'восстановл.':>11}")
+    for side in (int(s) for s in args.sizes.split(',')):
+        image = make_photo(side)
+        full_bytes, full_time = png_size(image)
+
+        start = time.perf_counter()
+        small = fit_within(image, DEFAULT_MAX_RESOLUTION)
+        small_bytes, small_encode = png_size(small)
+        small_time = time.perf_counter() - start
+
+        mask = small.convert('RGBA')
+        start = time.perf_counter()
+        restore_resolution(image, mask)
+        restore_time = time.perf_counter() - start
+
+        print(f"{side:>5}×{side:<4} | {full_bytes / 1e6:>9.2f}MB | {small_bytes / 1e6:>9.2f}MB | "
+              f"{full_time * 1000:>10.0f}ms | {small_time * 1000:>12.0f}ms | {restore_time * 1000:>9.0f}ms")
+
+        if args.live:
+            print(f"   🌐 BiRefNet: полный {run_live(image, False):.2f}s, "
+                  f"уменьшенный {run_live(image, True):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Офлайн нагрузочный тест пакетной обработки
+Весь конвейер (анализ, удаление фона, позиционирование, кодирование, запись)
+работает на mock backend'ах с заданными задержками и долей ошибок — без сети и ключей API
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+class Upload:
+    """Загрузка в формате Flask FileStorage"""
+
+    def __init__(self, filename, image):
+        self.filename = filename
+        self.content_type = 'image/png'
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        self.stream = io.BytesIO(buffer.getvalue())
+
+
+def make_product(index, side):
+    """Создать изображение товара на белом фоне"""
+    image = Image.new('RGB', (side, int(side * 1.4)), 'white')
+    color = ((index * 53) % 255, (index * 97) % 255, 160)
+    ImageDraw.Draw(image).rectangle([side // 5, side // 4, side * 4 // 5, int(side * 1.3)], fill=color)
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн нагрузочный тест на mock backend')
+    parser.add_argument('--images', type=int, default=50, help='Число изображений в пакете')
+    parser.add_argument('--side', type=int, default=800, help='Ширина изображения')
+    parser.add_argument('--latency', type=float, default=2.0, help='Медианная задержка вызова, с')
+    parser.add_argument('--jitter', type=float, default=0.5, help='Sigma лог-нормального разброса задержки')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='Доля ошибок вызовов')
+    args = parser.parse_args()
+
+    os.environ.update({
+        'ANALYSIS_BACKEND': 'mock',
+        'SEGMENTATION_BACKEND': 'mock',
+        'MOCK_LATENCY': str(args.latency),
+        'MOCK_LATENCY_JITTER': str(args.jitter),
+        'MOCK_ERROR_RATE': str(args.error_rate),
+        'UPLOAD_MODE': 'inline',
+        'FAL_KEY': os.environ.get('FAL_KEY', 'mock'),
+    })
+
+    import tests.mock_backends  # noqa: F401 — регистрирует backend'ы 'mock'
+    from src.processors.batch_processor import BatchProcessor
+
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    os.chdir(workdir)
+    processor = BatchProcessor(db_path=os.path.join(workdir, 'database', 'history.db'))
+    processor.model_registry.db_manager.initialize_database()
+
+    files = [Upload(f"product_{i:04d}.png", make_product(i, args.side)) for i in range(args.images)]
+
+    start = time.perf_counter()
+    result = processor.process_batch(files)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n📊 BatchProcessor: {args.images} изображений за {elapsed:.1f}s "
+          f"({args.images / elapsed:.2f} изобр./с)")
+    print(f"   Успешно: {result['successful']}, ошибок: {result['failed']}")
+    metrics = processor.get_metrics()
+    print(f"   Цепи моделей: {metrics['circuit_breakers']}")
+    print(f"   Хеджирование: {metrics['hedging']}")
+    print(f"   Рабочая директория: {workdir}")
+
+
+if __name__ == '__main__':
+    main()
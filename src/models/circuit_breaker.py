@@ -0,0 +1,224 @@
+"""
+Circuit Breaker for K+ Content Service V2.0
+Tracks runtime health of each model and stops sending work to failing ones
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+class CircuitState:
+    """Circuit breaker states"""
+    CLOSED = "closed"        # Healthy, all calls allowed
+    OPEN = "open"            # Failing, calls rejected until cool-down passes
+    HALF_OPEN = "half_open"  # Cool-down passed, a few probe calls allowed
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker for one model
+
+    The circuit opens when the failure rate over the last `window` calls
+    reaches `failure_threshold` (calls slower than `slow_call_seconds`
+    count as failures). After `open_seconds` it becomes half-open and lets
+    `probe_calls` requests through; a successful probe closes it, a failed
+    one opens it again.
+    """
+
+    def __init__(self,
+                 model_id: str,
+                 failure_threshold: float = 0.5,
+                 window: int = 20,
+                 min_calls: int = 5,
+                 slow_call_seconds: float = 90.0,
+                 open_seconds: float = 30.0,
+                 probe_calls: int = 1):
+        """
+        Initialize circuit breaker
+
+        Args:
+            model_id: Model ID the breaker guards
+            failure_threshold: Failure rate (0-1) that opens the circuit
+            window: Number of recent calls the rate is computed over
+            min_calls: Calls needed before the circuit can open
+            slow_call_seconds: Latency counted as failure
+            open_seconds: Time the circuit stays open before probing
+            probe_calls: Concurrent probe calls allowed while half-open
+        """
+        self.model_id = model_id
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.probe_calls = probe_calls
+
+        self._outcomes = deque(maxlen=window)
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self) -> str:
+        """Current state (open turns half-open once the cool-down passed)"""
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def is_available(self) -> bool:
+        """Check whether a call would be allowed, without taking a probe slot"""
+        with self._lock:
+            self._refresh()
+            if self._state == CircuitState.OPEN:
+                return False
+            if self._state == CircuitState.HALF_OPEN:
+                return self._probes_in_flight < self.probe_calls
+            return True
+
+    def allow_request(self) -> bool:
+        """
+        Ask to send a call to the model
+
+        Returns:
+            True if the call may proceed (takes a probe slot when half-open)
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CircuitState.CLOSED:
+                return True
+            if self._state == CircuitState.HALF_OPEN and self._probes_in_flight < self.probe_calls:
+                self._probes_in_flight += 1
+                self._probe_started_at = time.time()
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self, latency: float = 0.0):
+        """Record finished call (a call slower than slow_call_seconds counts as failure)"""
+        if latency > self.slow_call_seconds:
+            self.record_failure()
+            return
+
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._state = CircuitState.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        """Record failed call"""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._open()
+                return
+
+            self._outcomes.append(False)
+            if len(self._outcomes) >= self.min_calls and self._failure_rate() >= self.failure_threshold:
+                self._open()
+
+    def release_probe(self):
+        """Give back a probe slot whose call reports no outcome (answered from cache or by another call)"""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get state and counters for metrics"""
+        with self._lock:
+            self._refresh()
+            return {
+                'state': self._state,
+                'failure_rate': round(self._failure_rate(), 3),
+                'calls': len(self._outcomes),
+                **self._stats
+            }
+
+    def _open(self):
+        """Open circuit (lock must be held)"""
+        if self._state != CircuitState.OPEN:
+            self._stats['opened'] += 1
+            print(f"🔌 Цепь {self.model_id} разомкнута: запросы идут в fallback")
+        self._state = CircuitState.OPEN
+        self._opened_at = time.time()
+        self._outcomes.clear()
+
+    def _refresh(self):
+        """Move open circuit to half-open after cool-down (lock must be held)"""
+        now = time.time()
+        if self._state == CircuitState.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = CircuitState.HALF_OPEN
+            self._probes_in_flight = 0
+        elif (self._state == CircuitState.HALF_OPEN and self._probes_in_flight
+              and now - self._probe_started_at > self.slow_call_seconds):
+            # Probe never reported back (e.g. the call hung): free its slot
+            self._probes_in_flight = 0
+
+    def _failure_rate(self) -> float:
+        """Share of failed calls in window (lock must be held)"""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers keyed by model ID, created on first use"""
+
+    def __init__(self, **breaker_settings: Any):
+        """
+        Initialize registry
+
+        Args:
+            **breaker_settings: CircuitBreaker keyword arguments
+                (default open time from CIRCUIT_OPEN_SECONDS)
+        """
+        breaker_settings.setdefault('open_seconds', float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30)))
+        self.breaker_settings = breaker_settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_id: str) -> CircuitBreaker:
+        """Get breaker of a model"""
+        with self._lock:
+            if model_id not in self._breakers:
+                self._breakers[model_id] = CircuitBreaker(model_id, **self.breaker_settings)
+            return self._breakers[model_id]
+
+    def is_available(self, model_id: str) -> bool:
+        """Check whether model may receive calls"""
+        return self.get(model_id).is_available()
+
+    def allow_request(self, model_id: str) -> bool:
+        """Ask to send a call to model (takes a probe slot when half-open)"""
+        return self.get(model_id).allow_request()
+
+    def record(self, model_id: str, success: bool, latency: float = 0.0):
+        """
+        Record call outcome of a model
+
+        Args:
+            model_id: Model ID
+            success: Whether the call returned a usable result
+            latency: Call duration in seconds
+        """
+        breaker = self.get(model_id)
+        if success:
+            breaker.record_success(latency)
+        else:
+            breaker.record_failure()
+
+    def release_probe(self, model_id: str):
+        """Give back the probe slot of a call that reports no outcome"""
+        self.get(model_id).release_probe()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Get state of every breaker"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.model_id: breaker.snapshot() for breaker in breakers}
@@ -8,6 +8,7 @@ from dataclasses import dataclass
 from enum import Enum
 
 from .model_registry import ModelRegistry, ModelInfo
+from .circuit_breaker import CircuitBreakerRegistry
 
 
 class SelectionReason(Enum):
@@ -43,9 +44,15 @@ class SelectionResult:
 class ModelSelectionPolicy:
     """Implements model selection and fallback logic"""
     
-    def __init__(self):
-        """Initialize selection policy"""
+    def __init__(self, *, breakers: Optional[CircuitBreakerRegistry] = None):
+        """
+        Initialize selection policy
+        
+        Args:
+            breakers: Circuit breakers fed with runtime model health (created if not given)
+        """
         self.registry = ModelRegistry()
+        self.breakers = breakers or CircuitBreakerRegistry()
         
         # Default fallback chain: V2 → V1 → BiRefNet
         self.default_fallback_chain = [
@@ -79,6 +86,15 @@ class ModelSelectionPolicy:
         # 1. User explicitly chose model
         if user_model_id:
             model = self.registry.get_model_by_id(user_model_id)
+            if model and not self.breakers.allow_request(model.id):
+                # Model is failing right now, auto-select among healthy ones
+                return self._auto_select_model(
+                    marketplace=marketplace,
+                    image_complexity=image_complexity,
+                    require_fast=require_fast,
+                    require_high_quality=require_high_quality,
+                    selection_metadata={'user_specified_circuit_open': user_model_id}
+                )
             if model:
                 return SelectionResult(
                     model=model,
@@ -121,14 +137,18 @@ class ModelSelectionPolicy:
         if selection_metadata is None:
             selection_metadata = {}
         
-        # Get available models
+        # Get available models, skipping those with an open circuit
         all_models = self.registry.get_all_models(active_only=True)
+        open_models = [m.id for m in all_models if not self.breakers.is_available(m.id)]
+        if open_models:
+            selection_metadata['circuit_open'] = open_models
+            all_models = [m for m in all_models if m.id not in open_models]
         
         if not all_models:
             return SelectionResult(
                 model=None,
                 reason=SelectionReason.DEFAULT,
-                explanation="No models available in registry",
+                explanation="All models have open circuits" if open_models else "No models available in registry",
                 fallback_chain=[],
                 selection_metadata=selection_metadata
             )
@@ -142,12 +162,19 @@ class ModelSelectionPolicy:
                 selection_metadata['marketplace_filter'] = marketplace
         
         # Apply selection logic based on requirements
-        selected_model = self._apply_selection_logic(
-            candidate_models,
-            image_complexity=image_complexity,
-            require_fast=require_fast,
-            require_high_quality=require_high_quality
-        )
+        selected_model = None
+        while candidate_models:
+            selected_model = self._apply_selection_logic(
+                candidate_models,
+                image_complexity=image_complexity,
+                require_fast=require_fast,
+                require_high_quality=require_high_quality
+            )
+            # Half-open model whose probe slot was just taken by another call
+            if selected_model is None or self.breakers.allow_request(selected_model.id):
+                break
+            candidate_models = [m for m in candidate_models if m.id != selected_model.id]
+            selected_model = None
         
         if selected_model:
             explanation = self._build_explanation(
@@ -255,7 +282,7 @@ class ModelSelectionPolicy:
         
         for model_id in self.default_fallback_chain:
             model = self.registry.get_model_by_id(model_id)
-            if model:
+            if model and self.breakers.allow_request(model_id):
                 return SelectionResult(
                     model=model,
                     reason=SelectionReason.DEFAULT,
@@ -296,7 +323,7 @@ class ModelSelectionPolicy:
         # Try each fallback model
         for model_id in fallback_chain:
             model = self.registry.get_model_by_id(model_id)
-            if model:
+            if model and self.breakers.allow_request(model_id):
                 return SelectionResult(
                     model=model,
                     reason=SelectionReason.FALLBACK_ERROR,
@@ -322,6 +349,29 @@ class ModelSelectionPolicy:
             }
         )
     
+    def record_result(self, model_id: str, success: bool, latency: float = 0.0):
+        """
+        Feed call outcome of a model into its circuit breaker
+        
+        Args:
+            model_id: Model that handled the call
+            success: Whether it returned a usable result
+            latency: Call duration in seconds
+        """
+        self.breakers.record(model_id, success, latency)
+    
+    def release_probe(self, model_id: str):
+        """
+        Give back the half-open probe slot taken when the model was selected
+        
+        Used when the selected model is not called (result cache hit, identical
+        call already in flight), so the breaker does not wait for an outcome.
+        
+        Args:
+            model_id: Model that was selected
+        """
+        self.breakers.release_probe(model_id)
+    
     def explain_selection_policy(self) -> Dict[str, Any]:
         """Get explanation of selection policy for documentation"""
         
@@ -346,6 +396,11 @@ class ModelSelectionPolicy:
                 'on_user_choice_unavailable': 'Fall back to auto-selection',
                 'on_model_failure': 'Move to next model in fallback chain',
                 'on_no_models': 'Return error with explanation'
+            },
+            'circuit_breaker': {
+                'open': 'Model skipped after failure rate ≥50% of recent calls (slow calls count as failures)',
+                'half_open': 'After cool-down a single probe call is allowed',
+                'closed': 'Probe succeeded, model receives calls again'
             }
         }
 
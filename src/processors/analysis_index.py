@@ -0,0 +1,183 @@
+"""
+Analysis Reuse Module
+Serves GPT analyses of near-duplicate uploads from processing history
+"""
+
+import os
+import json
+import math
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Union
+
+from PIL import Image, ImageStat
+
+from ..utils.perceptual_hash import HammingIndex, dhash, hash_to_hex, hash_from_hex
+
+
+class AnalysisIndex:
+    """
+    Perceptual-hash index over stored GPT analyses
+
+    History rows are indexed by row id and their analysis is read from
+    SQLite on a hit. Analyses produced by this process are indexed by their
+    stored hash; the most recent ones are kept in memory (LRU) so
+    duplicates inside a running batch are found before they are recorded,
+    older ones are read back from history like loaded rows.
+
+    dHash is grayscale, so the stored hash also carries the image's mean
+    colour and a match must be close in colour as well: colour variants of
+    one product do not share an analysis.
+    """
+
+    def __init__(self, db_path: str, max_distance: Optional[int] = None,
+                 max_color_distance: Optional[float] = None, max_recent: Optional[int] = None):
+        """
+        Initialize index and load hashes from processing_history
+
+        Args:
+            db_path: Path to SQLite database
+            max_distance: Max Hamming distance of dHash treated as the same product
+                (default ANALYSIS_REUSE_DISTANCE or 6, negative disables reuse)
+            max_color_distance: Max RGB distance of mean colours treated as the same product
+                (default ANALYSIS_REUSE_COLOR_DISTANCE or 20, negative disables the check)
+            max_recent: Analyses of this process kept in memory
+                (default ANALYSIS_INDEX_RECENT or 512)
+        """
+        self.db_path = db_path
+        if max_distance is None:
+            max_distance = int(os.environ.get('ANALYSIS_REUSE_DISTANCE', 6))
+        if max_color_distance is None:
+            max_color_distance = float(os.environ.get('ANALYSIS_REUSE_COLOR_DISTANCE', 20))
+        if max_recent is None:
+            max_recent = int(os.environ.get('ANALYSIS_INDEX_RECENT', 512))
+        self.index = HammingIndex(max_distance=max_distance)
+        self.max_color_distance = max_color_distance
+        self.max_recent = max_recent
+        self.hits = 0
+        self.misses = 0
+        self._recent: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def image_hash(self, image: Image.Image) -> str:
+        """Compute stored form of image hash: dHash and mean RGB colour"""
+        red, green, blue = (round(channel) for channel in
+                            ImageStat.Stat(image.convert('RGB').resize((16, 16))).mean)
+        return f"{hash_to_hex(dhash(image))}-{red:02x}{green:02x}{blue:02x}"
+
+    def find(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Find analysis of a near-duplicate image
+
+        Args:
+            image_hash: Hash from image_hash()
+
+        Returns:
+            Copy of stored analysis or None
+        """
+        analysis = self.peek(image_hash)
+        with self._lock:
+            if analysis is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return analysis
+
+    def peek(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        """Find analysis like find() without counting a hit or miss (e.g. for a guess)"""
+        value, color = self._parse(image_hash)
+        with self._lock:
+            match = self.index.find(value, lambda candidate: self._color_matches(color, candidate[1]))
+            if match is None:
+                return None
+            source = match[1][0]
+            if source in self._recent:
+                self._recent.move_to_end(source)
+                return json.loads(json.dumps(self._recent[source]))
+        return self._load_analysis(source)
+
+    def add(self, image_hash: str, analysis: Dict[str, Any]):
+        """
+        Remember analysis produced by GPT
+
+        Args:
+            image_hash: Hash from image_hash()
+            analysis: GPT analysis
+        """
+        value, color = self._parse(image_hash)
+        with self._lock:
+            self.index.add(value, (image_hash, color))
+            self._recent[image_hash] = analysis
+            self._recent.move_to_end(image_hash)
+            while len(self._recent) > self.max_recent:
+                self._recent.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get index size and hit/miss counters"""
+        with self._lock:
+            return {
+                'entries': len(self.index),
+                'in_memory': len(self._recent),
+                'hits': self.hits,
+                'misses': self.misses,
+                'max_distance': self.index.max_distance,
+                'max_color_distance': self.max_color_distance
+            }
+
+    @staticmethod
+    def _parse(image_hash: str) -> Tuple[int, Optional[Tuple[int, int, int]]]:
+        """Split stored hash into dHash and mean colour (None for hashes stored without it)"""
+        value, _, color = image_hash.partition('-')
+        if len(color) != 6:
+            return hash_from_hex(value), None
+        return hash_from_hex(value), (int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16))
+
+    def _color_matches(self, color: Optional[Tuple[int, int, int]],
+                       other: Optional[Tuple[int, int, int]]) -> bool:
+        """Whether two mean colours are close enough to reuse an analysis"""
+        if self.max_color_distance < 0 or color is None or other is None:
+            return True
+        return math.dist(color, other) <= self.max_color_distance
+
+    def _load(self):
+        """Index hashes of successful history rows"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            rows = conn.execute('''
+                SELECT id, image_hash FROM processing_history
+                WHERE image_hash IS NOT NULL AND status = 'success'
+            ''').fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Error loading analysis index: {e}")
+            return
+
+        for row_id, image_hash in rows:
+            value, color = self._parse(image_hash)
+            self.index.add(value, (row_id, color))
+
+    def _load_analysis(self, source: Union[int, str]) -> Optional[Dict[str, Any]]:
+        """
+        Read stored analysis from history
+
+        Args:
+            source: History row id, or stored hash of an analysis made by this process
+
+        Returns:
+            Analysis, or None if it is not recorded (yet)
+        """
+        conn = sqlite3.connect(self.db_path)
+        if isinstance(source, int):
+            row = conn.execute(
+                "SELECT gpt_analysis FROM processing_history WHERE id = ?", (source,)
+            ).fetchone()
+        else:
+            row = conn.execute('''
+                SELECT gpt_analysis FROM processing_history
+                WHERE image_hash = ? AND status = 'success'
+                ORDER BY id DESC LIMIT 1
+            ''', (source,)).fetchone()
+        conn.close()
+        return json.loads(row[0]) if row and row[0] else None
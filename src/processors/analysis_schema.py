@@ -0,0 +1,163 @@
+"""
+Compact structured-output schema for GPT product analysis
+Short keys and enum codes requested through strict JSON schema, expanded to the analysis dict shape
+"""
+
+from typing import Dict, Any
+
+
+# Enum codes of the compact schema
+CATEGORIES = {'el': 'electronics', 'ho': 'home', 'di': 'diy', 'fa': 'fashion', 'ap': 'appliances', 'fm': 'fmcg'}
+MATERIALS = {'pl': 'plastic', 'me': 'metal', 'fa': 'fabric', 'le': 'leather', 'wo': 'wood', 'gl': 'glass', 'mi': 'mixed'}
+TEXTURES = {'sm': 'smooth', 'ro': 'rough', 'gl': 'glossy', 'ma': 'matte'}
+TRANSPARENCY = {'op': 'opaque', 'tl': 'translucent', 'tp': 'transparent'}
+PHYSICAL_PROPERTIES = {'st': 'stands', 'ha': 'hangs', 'fl': 'floats', 'lf': 'lies_flat'}
+SPECIAL_INSTRUCTIONS = {'rf': 'handle reflections', 'lg': 'preserve logo', 'tx': 'keep texture details', 'no': 'none'}
+SHADOW_HANDLING = {'pr': 'preserve', 'en': 'enhance', 'mi': 'minimize'}
+POSITIONING = {'b': 'bottom_aligned', 'c': 'centered', 'f': 'fill_vertical'}
+
+ENUM_FIELDS = {
+    'c': CATEGORIES, 'mt': MATERIALS, 'tx': TEXTURES, 'tr': TRANSPARENCY,
+    'pp': PHYSICAL_PROPERTIES, 'si': SPECIAL_INSTRUCTIONS, 'sw': SHADOW_HANDLING, 'po': POSITIONING
+}
+STRING_FIELDS = ('t', 'br', 'mo', 'pc', 'd')
+
+# Orientation, aspect ratio and canvas size are not requested: apply_geometry computes them from the image
+COMPACT_PROMPT = """
+Analyze product for marketplace photography processing. Answer with the JSON schema fields:
+c category: el electronics, ho home, di diy, fa fashion, ap appliances, fm fmcg
+t product name; br brand, mo model if visible, else ""
+pc primary color; sc secondary colors
+mt material: pl plastic, me metal, fa fabric, le leather, wo wood, gl glass, mi mixed
+tx texture: sm smooth, ro rough, gl glossy, ma matte
+tr transparency: op opaque, tl translucent, tp transparent
+sh whether the product casts a shadow
+pp physical property: st stands (items with base: shoes, bottles), ha hangs (clothing), fl floats (accessories), lf lies flat (books, tablets)
+d highly specific description of the exact product for an image model prompt
+si special instructions: rf handle reflections, lg preserve logo, tx keep texture details, no none
+sw shadow handling: pr preserve, en enhance, mi minimize
+po positioning: b bottom aligned (stands items), c centered (floats/hangs/lies flat), f fill vertical (tall stands items)
+"""
+
+
+def _item_schema() -> Dict[str, Any]:
+    """JSON schema of one compact analysis"""
+    properties = {key: {'type': 'string'} for key in STRING_FIELDS}
+    properties.update({key: {'type': 'string', 'enum': list(codes)} for key, codes in ENUM_FIELDS.items()})
+    properties['sc'] = {'type': 'array', 'items': {'type': 'string'}}
+    properties['sh'] = {'type': 'boolean'}
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(properties),
+        'additionalProperties': False
+    }
+
+
+def _batch_schema() -> Dict[str, Any]:
+    """JSON schema of a multi-image answer (strict mode needs an object root)"""
+    item = _item_schema()
+    item['properties'] = {'index': {'type': 'integer'}, **item['properties']}
+    item['required'] = list(item['properties'])
+    return {
+        'type': 'object',
+        'properties': {'items': {'type': 'array', 'items': item}},
+        'required': ['items'],
+        'additionalProperties': False
+    }
+
+
+# Responses API text.format values
+ANALYSIS_FORMAT = {'type': 'json_schema', 'name': 'product_analysis', 'strict': True, 'schema': _item_schema()}
+BATCH_ANALYSIS_FORMAT = {'type': 'json_schema', 'name': 'product_analyses', 'strict': True, 'schema': _batch_schema()}
+
+
+def expand_analysis(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate compact analysis and expand it to the analysis dict shape
+
+    Geometry fields that depend on the image (orientation, aspect ratio,
+    canvas size) get placeholders for apply_geometry to fill.
+
+    Args:
+        data: Compact analysis from the model
+
+    Returns:
+        Analysis dict in the shape of the verbose prompt's answer
+
+    Raises:
+        ValueError: If a field is missing or has an unknown code
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Compact analysis must be an object, got {type(data).__name__}")
+
+    values = {}
+    for key, codes in ENUM_FIELDS.items():
+        value = data.get(key)
+        if value not in codes:
+            raise ValueError(f"Invalid analysis field {key}: {value!r}")
+        values[key] = codes[value]
+    for key in STRING_FIELDS:
+        value = data.get(key)
+        if not isinstance(value, str):
+            raise ValueError(f"Invalid analysis field {key}: {value!r}")
+        values[key] = value
+    secondary_colors = data.get('sc')
+    if not isinstance(secondary_colors, list):
+        raise ValueError(f"Invalid analysis field sc: {secondary_colors!r}")
+
+    return {
+        'category': values['c'],
+        'product_identification': {
+            'type': values['t'],
+            'brand': values['br'] or 'unknown',
+            'model': values['mo'] or 'unknown'
+        },
+        'visual_properties': {
+            'primary_color': values['pc'],
+            'secondary_colors': [str(color) for color in secondary_colors],
+            'material': values['mt'],
+            'texture': values['tx'],
+            'transparency': values['tr']
+        },
+        'geometry': {
+            'orientation': 'standard',
+            'aspect_ratio': 0.0,
+            'has_shadow': bool(data.get('sh', True)),
+            'physical_property': values['pp']
+        },
+        'lora_optimization': {
+            'main_object_description': values['d'],
+            'special_instructions': values['si'],
+            'shadow_handling': values['sw']
+        },
+        'canvas_settings': {
+            'size': '1200x1600',
+            'positioning': values['po']
+        }
+    }
+
+
+def is_full_analysis(data: Any) -> bool:
+    """Check that data already has the analysis dict shape (verbose prompt answer)"""
+    return (isinstance(data, dict) and isinstance(data.get('category'), str)
+            and all(isinstance(data.get(key), dict)
+                    for key in ('geometry', 'lora_optimization', 'canvas_settings')))
+
+
+def decode_analysis(data: Any) -> Dict[str, Any]:
+    """
+    Get analysis dict from a model answer in either schema
+
+    Args:
+        data: Compact analysis, or full analysis from the verbose prompt
+
+    Returns:
+        Analysis dict
+
+    Raises:
+        ValueError: If data is neither a valid compact nor a full analysis
+    """
+    if is_full_analysis(data):
+        return data
+    return expand_analysis(data)
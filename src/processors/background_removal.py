@@ -0,0 +1,415 @@
+"""
+Background Removal Module
+LoRA background removal with result cache, hedging and BiRefNet fallback
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, Optional, Callable, Tuple
+from PIL import Image
+
+from .inference_backends import SegmentationBackend, SegmentationBackends, FAL_PROVIDER
+from .lora_arguments import build_lora_arguments, lora_cache_settings
+from ..models.model_registry import ModelRegistry, ModelInfo
+from ..models.selection_policy import ModelSelectionPolicy
+from ..utils.concurrency import AdaptiveConcurrencyLimiter
+from ..utils.rate_limit import retry_rate_limited
+from ..utils.result_cache import ResultCache
+from ..utils.upload_manager import UploadManager, content_hash
+from ..utils.single_flight import SingleFlight
+from ..utils.speculation import on_discard
+from ..utils.hedging import LatencyTracker, hedged_call, PRIMARY, BACKUP
+from ..utils.inference_resize import DEFAULT_MAX_RESOLUTION, parse_resolution, fit_within
+
+
+class BackgroundRemover:
+    """
+    Remove background of one image with the selected model
+
+    Shared by the batch engines and single-image mode: model selection and
+    circuit breakers, result cache, single-flight of identical requests,
+    429 retries, hedging of slow LoRA calls and the BiRefNet fallback.
+    """
+
+    def __init__(self, model_registry: ModelRegistry, selection_policy: ModelSelectionPolicy,
+                 upload_manager: UploadManager, limiter: AdaptiveConcurrencyLimiter,
+                 result_cache: ResultCache, inflight: SingleFlight,
+                 batch_model_id: Callable[[], Optional[str]] = lambda: None):
+        """
+        Initialize background remover
+
+        Args:
+            model_registry: Registry of background removal models
+            selection_policy: Model selection policy with circuit breakers
+            upload_manager: Upload manager providing image URLs
+            limiter: Concurrency limiter for fal calls
+            result_cache: Cache of background removal results
+            inflight: Single-flight group of background removal calls
+            batch_model_id: Returns the model chosen for the running batch (None = auto-select)
+        """
+        self.model_registry = model_registry
+        self.selection_policy = selection_policy
+        self.upload_manager = upload_manager
+        self.limiter = limiter
+        self.result_cache = result_cache
+        self.inflight = inflight
+        self.batch_model_id = batch_model_id
+
+        # Segmentation providers (SEGMENTATION_BACKEND, 'rembg' runs offline)
+        self.segmentation = SegmentationBackends(image_url=self.image_url)
+
+        self.lora_path = os.environ.get('LORA_PATH',
+            'https://v3.fal.media/files/rabbit/McQtMDl9HQ2cKh0_E-CrO_adapter_model.safetensors')
+
+        # Downscale inference inputs to the model's max_resolution
+        self.downscale_inputs = os.environ.get('INFERENCE_DOWNSCALE', '1') != '0'
+
+        # LoRA latencies: calls past the percentile are hedged with BiRefNet
+        self.lora_latency = LatencyTracker(percentile=float(os.environ.get('HEDGE_PERCENTILE', 0.9)))
+
+    def select_model(self, model_id: Optional[str] = None) -> Tuple[Optional[ModelInfo], str]:
+        """
+        Select background removal model
+
+        Args:
+            model_id: Model ID to use (if None, uses batch model or selection policy)
+
+        Returns:
+            Tuple of (selected model or None, selection reason)
+        """
+        breakers = self.selection_policy.breakers
+        batch_model_id = self.batch_model_id()
+        if model_id:
+            model_info = self.model_registry.get_model_by_id(model_id)
+            if model_info and breakers.allow_request(model_info.id):
+                return model_info, f"Specified by user: {model_id}"
+            if model_info:
+                print(f"🔌 Модель {model_id} сейчас недоступна (цепь разомкнута), используем автовыбор")
+            else:
+                print(f"❌ Модель {model_id} не найдена, используем автовыбор")
+        elif batch_model_id:
+            model_info = self.model_registry.get_model_by_id(batch_model_id)
+            if model_info and breakers.allow_request(model_info.id):
+                return model_info, f"Batch model: {batch_model_id}"
+
+        selection = self.selection_policy.select_model()
+        return selection.model, selection.explanation
+
+    def lora_arguments(self, selected_model: ModelInfo, prompt: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Build LoRA request arguments (image URL unset) and their result cache settings
+
+        Args:
+            selected_model: Selected LoRA model
+            prompt: Optimized prompt from GPT
+
+        Returns:
+            Tuple of (arguments, result cache settings)
+        """
+        arguments = build_lora_arguments(selected_model, None, prompt, self.lora_path)
+        return arguments, lora_cache_settings(selected_model, arguments)
+
+    def image_url(self, image: Image.Image, max_size: Tuple[int, int] = DEFAULT_MAX_RESOLUTION) -> str:
+        """
+        Get source image URL for inference requests (uploaded once per image)
+
+        Args:
+            image: Full-resolution source image
+            max_size: Model input limit, larger images are downscaled before upload
+
+        Returns:
+            Image URL
+        """
+        # Images within the limit are sent as-is and share the plain content-hash entry
+        if not self.downscale_inputs or image.width * image.height <= max_size[0] * max_size[1]:
+            return self.upload_manager.url_for(image)
+
+        # Keyed by source pixels and limit, so a repeated upload skips the resize
+        key = f"{content_hash(image)}:{max_size[0]}x{max_size[1]}"
+        return self.upload_manager.url_for(image, key=key, prepare=lambda source: fit_within(source, max_size))
+
+    def remove_background(self, image: Image.Image, prompt: str,
+                          model_id: Optional[str] = None) -> Optional[Image.Image]:
+        """
+        Remove background with the selected LoRA model, BiRefNet if none is usable
+
+        Args:
+            image: Input image
+            prompt: Optimized prompt from GPT
+            model_id: Model ID to use (if None, uses selection policy)
+
+        Returns:
+            Image with removed background or None if failed
+        """
+        lora_version = 'unknown'
+        try:
+            # Select model using policy or provided model_id
+            selected_model, reason = self.select_model(model_id)
+
+            if not selected_model or selected_model.id == 'birefnet-fallback':
+                # Use BiRefNet fallback
+                return self.remove_background_birefnet(image)
+
+            backend = self.segmentation.get(selected_model.provider)
+            if not backend.is_configured():
+                self.selection_policy.release_probe(selected_model.id)
+                print(f"❌ Backend {backend.name} не настроен (FAL_KEY/FAL_API_KEY)")
+                return None
+
+            lora_version = selected_model.version
+            print(f"✅ Выбрана модель: {selected_model.name} {selected_model.version}")
+            print(f"   Причина: {reason}")
+
+            arguments, settings = self.lora_arguments(selected_model, prompt)
+
+            # Same source and settings were processed before: skip the network call
+            cache_key = self.result_cache.make_key(image, settings)
+            cached_image = self.result_cache.get(cache_key)
+            if cached_image is not None:
+                self.selection_policy.release_probe(selected_model.id)
+                print(f"⚡ Результат LoRA {lora_version} взят из кэша")
+                return cached_image
+
+            # The same image with the same settings may already be in flight for another file
+            max_size = parse_resolution(selected_model.spec.max_resolution)
+            result_image, shared = self.inflight.do(
+                cache_key, lambda: self._call_lora(image, backend, selected_model, arguments, max_size, cache_key))
+            if shared:
+                # The outcome is recorded by the call this one joined
+                self.selection_policy.release_probe(selected_model.id)
+                print(f"🔗 Результат LoRA {lora_version} получен одновременным запросом того же изображения")
+                return result_image.copy() if result_image is not None else None
+            return result_image
+
+        except ImportError:
+            print("❌ fal_client не установлен")
+            return self.remove_background_birefnet(image)
+        except Exception as e:
+            print(f"❌ Error in LoRA {lora_version} background removal: {e}")
+            # Fallback to BiRefNet
+            try:
+                return self.remove_background_birefnet(image)
+            except Exception as fallback_error:
+                print(f"❌ BiRefNet fallback также провалился: {fallback_error}")
+                return None
+
+    def _call_lora(self, image: Image.Image, backend: SegmentationBackend, selected_model: ModelInfo,
+                   arguments: Dict[str, Any], max_size: Tuple[int, int], cache_key: str) -> Optional[Image.Image]:
+        """
+        Call LoRA model (hedged when slow), falling back to BiRefNet
+
+        Args:
+            image: Input image
+            backend: Segmentation backend of the model provider
+            selected_model: LoRA model to call
+            arguments: LoRA request arguments
+            max_size: Model input limit
+            cache_key: Result cache key of the LoRA result
+
+        Returns:
+            Image with removed background or None if failed
+        """
+        lora_version = selected_model.version
+
+        # Slow LoRA calls race a BiRefNet request once past the latency percentile
+        hedge_after = self.lora_latency.hedge_threshold()
+        if hedge_after is not None:
+            return self._remove_background_hedged(image, arguments, max_size, cache_key, hedge_after,
+                                                  selected_model)
+
+        print(f"🔄 Отправляем запрос к FLUX Kontext LoRA {lora_version} ({backend.name})...")
+
+        timing = {}
+
+        def call() -> Optional[Image.Image]:
+            with self.limiter.slot(endpoint=selected_model.endpoint):
+                # Timed inside the slot: local queueing and 429 waits are not model latency
+                started = time.time()
+                try:
+                    return backend.remove_background(selected_model.endpoint, image, arguments, max_size)
+                finally:
+                    timing['latency'] = time.time() - started
+
+        try:
+            # Rejected with 429: wait for Retry-After and send again instead of falling back
+            result_image = retry_rate_limited(call)
+            latency = timing['latency']
+            self.lora_latency.record(latency)
+
+            if result_image is not None:
+                self.result_cache.put(cache_key, result_image)
+                self.selection_policy.record_result(selected_model.id, True, latency)
+                print(f"✅ Успешно обработано с LoRA {lora_version}")
+                return result_image
+            else:
+                self.selection_policy.record_result(selected_model.id, False)
+                print(f"❌ LoRA {lora_version} не вернул изображения")
+
+        except Exception as api_error:
+            self.selection_policy.record_result(selected_model.id, False)
+            print(f"❌ Ошибка API запроса: {api_error}")
+            print(f"❌ Тип ошибки: {type(api_error)}")
+            if hasattr(api_error, 'response'):
+                print(f"❌ HTTP статус: {api_error.response.status_code if api_error.response else 'нет'}")
+                print(f"❌ HTTP тело: {api_error.response.text if api_error.response else 'нет'}")
+
+        # Fallback to BiRefNet if LoRA fails
+        print(f"🔄 LoRA {lora_version} failed, trying BiRefNet fallback")
+        return self.remove_background_birefnet(image)
+
+    def _remove_background_hedged(self, image: Image.Image, arguments: Dict[str, Any],
+                                  max_size: Tuple[int, int], cache_key: str,
+                                  hedge_after: float, selected_model: ModelInfo) -> Optional[Image.Image]:
+        """
+        LoRA call hedged with BiRefNet
+
+        BiRefNet is requested once the LoRA request has been sent for
+        `hedge_after` seconds (or fails earlier); the first usable image
+        wins and the other fal request is cancelled. Both requests retry
+        after 429 like the unhedged call.
+
+        Args:
+            image: Input image
+            arguments: LoRA request arguments
+            max_size: LoRA model input limit
+            cache_key: Result cache key of the LoRA result
+            hedge_after: Seconds before BiRefNet is fired
+            selected_model: LoRA model being called
+
+        Returns:
+            Image with removed background or None if both failed
+        """
+        lora_version = selected_model.version
+        handles = {}
+        cancelled = set()
+        sent_at = {}
+        primary_sent = threading.Event()
+        outcome = {'recorded': False}
+        outcome_lock = threading.Lock()
+
+        def record_lora(success: Optional[bool], latency: Optional[float] = None):
+            # Only the first outcome counts: the finished call or its cancellation
+            with outcome_lock:
+                if outcome['recorded']:
+                    return
+                outcome['recorded'] = True
+            if latency is not None:
+                self.lora_latency.record(latency)
+            if success is None:
+                # Lost the race: says nothing about the model's health
+                self.selection_policy.release_probe(selected_model.id)
+            else:
+                self.selection_policy.record_result(selected_model.id, success, latency or 0.0)
+
+        def run(name: str, provider: str, endpoint: str, request_arguments: Dict[str, Any],
+                request_max_size: Optional[Tuple[int, int]] = None) -> Optional[Image.Image]:
+            def call() -> Optional[Image.Image]:
+                with self.limiter.slot(endpoint=endpoint):
+                    # Cancelled while waiting for a slot: the request is not sent
+                    if name in cancelled:
+                        return None
+                    # Latency counts from here, not from local queueing
+                    sent_at[name] = time.time()
+                    handle = self.segmentation.get(provider).submit(endpoint, image, request_arguments,
+                                                                    request_max_size)
+                    handles[name] = handle
+                    if name == PRIMARY:
+                        # Accepted (not rejected with 429): the hedge delay starts
+                        primary_sent.set()
+                    on_discard(handle.cancel)
+                    if name in cancelled:
+                        handle.cancel()
+                        return None
+                    return handle.get()
+
+            # Rejected with 429: wait for Retry-After and send again instead of losing the call
+            return retry_rate_limited(call)
+
+        def elapsed(name: str) -> Optional[float]:
+            return time.time() - sent_at[name] if name in sent_at else None
+
+        def lora() -> Optional[Image.Image]:
+            try:
+                result_image = run(PRIMARY, selected_model.provider, selected_model.endpoint, arguments, max_size)
+            except Exception:
+                record_lora(False)
+                raise
+            record_lora(result_image is not None, elapsed(PRIMARY))
+            return result_image
+
+        def birefnet() -> Optional[Image.Image]:
+            print(f"⏱️ LoRA {lora_version} дольше {hedge_after:.1f}s, параллельно запускаем BiRefNet")
+            return run(BACKUP, FAL_PROVIDER, "fal-ai/birefnet", {})
+
+        def cancel(name: str) -> Callable[[], None]:
+            def cancel_request():
+                # Flag first: a call still waiting for its slot checks it before sending
+                cancelled.add(name)
+                if name == PRIMARY:
+                    # Abandoned call still counts in the percentile, otherwise it drifts down;
+                    # for the circuit breaker it is neither a success nor a failure
+                    record_lora(None, elapsed(PRIMARY))
+                if name in handles:
+                    handles[name].cancel()
+            return cancel_request
+
+        result_image, winner, hedged = hedged_call(lora, birefnet, hedge_after, cancel(PRIMARY), cancel(BACKUP),
+                                                   primary_sent=primary_sent)
+        self.lora_latency.note_outcome(winner, hedged)
+
+        if winner == PRIMARY:
+            self.result_cache.put(cache_key, result_image)
+            print(f"✅ Успешно обработано с LoRA {lora_version}")
+        elif winner == BACKUP:
+            print(f"✅ BiRefNet ответил раньше LoRA {lora_version}")
+        else:
+            print(f"❌ Ни LoRA {lora_version}, ни BiRefNet не вернули изображение")
+        return result_image
+
+    def remove_background_birefnet(self, image: Image.Image) -> Optional[Image.Image]:
+        """
+        Fallback background removal using BiRefNet API
+
+        Args:
+            image: Input image
+
+        Returns:
+            Image with removed background or None if failed
+        """
+        try:
+            print("🔄 Используем BiRefNet fallback...")
+
+            # Use BiRefNet for background removal, once per image in flight
+            def call() -> Optional[Image.Image]:
+                with self.limiter.slot(endpoint="fal-ai/birefnet"):
+                    return self.segmentation.get(FAL_PROVIDER).remove_background("fal-ai/birefnet", image, {})
+
+            result_image, shared = self.inflight.do(('birefnet', content_hash(image)),
+                                                    lambda: retry_rate_limited(call))
+            if shared and result_image is not None:
+                result_image = result_image.copy()
+
+            if result_image is not None:
+                print("✅ Успешно обработано с BiRefNet")
+                return result_image
+            else:
+                print("❌ BiRefNet также не смог обработать изображение")
+                return None
+
+        except ImportError:
+            print("❌ fal_client не установлен для BiRefNet fallback")
+            return None
+        except Exception as e:
+            print(f"❌ Ошибка в BiRefNet fallback: {e}")
+            return None
+
+
+def apply_background(job: Dict[str, Any], no_bg_image: Optional[Image.Image]):
+    """Store background removal result in a pipeline job"""
+    if not no_bg_image:
+        raise Exception("Failed to remove background")
+
+    # Release the source pixels, only the result is needed downstream
+    job['image'] = None
+    job['no_bg_image'] = no_bg_image
@@ -0,0 +1,132 @@
+"""
+Batch Analysis Module
+Analysis of a pipeline job: reuse of near-duplicates, local heuristics, shared and batched GPT calls
+"""
+
+import copy
+from typing import Dict, Any, Optional
+
+from .analysis_index import AnalysisIndex
+from .local_analyzer import LocalHeuristicAnalyzer
+from ..utils.micro_batch import MicroBatcher
+from ..utils.single_flight import SingleFlight
+from ..utils.upload_manager import content_hash
+
+
+class BatchAnalysis:
+    """
+    Analyze job images with the cheapest source that is good enough
+
+    A near-duplicate's GPT analysis is reused first, then a confident
+    local heuristic analysis; only the rest goes to GPT, joined with
+    identical requests in flight and packed into multi-image requests.
+    """
+
+    def __init__(self, gpt_analyzer: Any, local_analyzer: LocalHeuristicAnalyzer,
+                 analysis_index: AnalysisIndex, inflight: SingleFlight, batcher: MicroBatcher):
+        """
+        Initialize job analysis
+
+        Args:
+            gpt_analyzer: Analysis provider (create_lora_prompt, apply_geometry)
+            local_analyzer: Local heuristic analyzer
+            analysis_index: Index of GPT analyses by perceptual hash
+            inflight: Single-flight group joining identical analyses
+            batcher: Micro-batcher of GPT analysis requests
+        """
+        self.gpt_analyzer = gpt_analyzer
+        self.local_analyzer = local_analyzer
+        self.analysis_index = analysis_index
+        self.inflight = inflight
+        self.batcher = batcher
+
+    def analyze(self, job: Dict[str, Any]):
+        """
+        Store analysis and LoRA prompt of a decoded job
+
+        Args:
+            job: Job with decoded image
+        """
+        gpt_result = self._find_similar(job) or self._local(job)
+        if gpt_result is None:
+            gpt_result = self._gpt(job)
+            self._remember(job, gpt_result)
+
+        if gpt_result['success']:
+            analysis = gpt_result['analysis']
+        else:
+            # Use fallback analysis
+            analysis = gpt_result.get('fallback', {})
+
+        job['analysis'] = analysis
+        job['lora_prompt'] = self.gpt_analyzer.create_lora_prompt(analysis)
+
+    def _find_similar(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Reuse GPT analysis of a near-duplicate image
+
+        Only geometry (aspect ratio, orientation, canvas size) depends on the
+        exact frame, so it is recomputed for this image.
+
+        Args:
+            job: Job with decoded image
+
+        Returns:
+            Analysis result in analyze_image format, or None if no match
+        """
+        job['image_hash'] = self.analysis_index.image_hash(job['image'])
+        analysis = self.analysis_index.find(job['image_hash'])
+        if analysis is None:
+            return None
+
+        print(f"♻️ {job['filename']}: анализ взят у похожего изображения")
+        self.gpt_analyzer.apply_geometry(analysis, job['image'])
+        return {'success': True, 'analysis': analysis, 'reused': True}
+
+    def _local(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Analyze job image locally if the heuristics are confident
+
+        Args:
+            job: Job with decoded image
+
+        Returns:
+            Local analysis result, or None if GPT is needed
+        """
+        result = self.local_analyzer.analyze(job['image'], job['filename'])
+        if not result['confident']:
+            return None
+
+        # Heuristic analysis must not be served as a GPT analysis to near-duplicates
+        job['image_hash'] = None
+        print(f"⚡ {job['filename']}: локальный анализ (уверенность {result['confidence']:.2f}), GPT не нужен")
+        return result
+
+    def _gpt(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        GPT analysis of job image, shared with jobs analyzing the same pixels at the same time
+
+        Args:
+            job: Job with decoded image
+
+        Returns:
+            Analysis result in analyze_image format
+        """
+        image = job['image']
+        gpt_result, shared = self.inflight.do(
+            job.get('content_hash') or content_hash(image), lambda: self.batcher.submit(image))
+        if not shared:
+            return gpt_result
+
+        print(f"🔗 {job['filename']}: анализ получен одновременным запросом того же изображения")
+        return {**copy.deepcopy(gpt_result), 'shared': True}
+
+    def _remember(self, job: Dict[str, Any], gpt_result: Dict[str, Any]):
+        """Index successful GPT analysis for later near-duplicates"""
+        if gpt_result['success']:
+            if not gpt_result.get('shared'):
+                # Shared results are indexed by the job that made the request
+                self.analysis_index.add(job['image_hash'], gpt_result['analysis'])
+        else:
+            # Fallback analysis must not be reused or stored with the hash
+            job['image_hash'] = None
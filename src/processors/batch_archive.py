@@ -0,0 +1,194 @@
+"""
+Batch Archive Module
+Builds result ZIP archives entry by entry while a batch is still running
+"""
+
+import os
+import json
+import time
+import zipfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .checkpoint import DONE
+from ..utils.zip_policy import open_zip, write_entry
+
+
+REPORT_NAME = 'processing_report.json'
+
+
+def result_arcname(result: Dict[str, Any]) -> str:
+    """Archive name of a result's final image"""
+    return f"final/{os.path.basename(result['paths']['final'])}"
+
+
+class BatchArchive:
+    """
+    ZIP archive of a batch that grows as results land
+
+    Final images are appended as soon as their file is processed (from the
+    encoded bytes when available, so outputs are not read back from disk);
+    closing writes processing_report.json and the central directory.
+    Entries follow the zip_policy compression rules.
+    """
+
+    def __init__(self, zip_path: Union[str, Path]):
+        """
+        Open archive for writing
+
+        Args:
+            zip_path: Path of ZIP file to create
+        """
+        self.zip_path = str(zip_path)
+        self._zip = open_zip(self.zip_path)
+        self._added = set()
+        self._lock = threading.Lock()
+
+    def add_result(self, result: Dict[str, Any], data: Optional[bytes] = None):
+        """
+        Append final image of a successful result
+
+        Args:
+            result: Result dict from processing
+            data: Encoded final image (read from result path if None)
+        """
+        if result['status'] != 'success':
+            return
+
+        arcname = result_arcname(result)
+        with self._lock:
+            if arcname in self._added or self._zip.fp is None:
+                return
+            if data is not None:
+                write_entry(self._zip, arcname, data)
+            elif os.path.exists(result['paths']['final']):
+                write_entry(self._zip, arcname, result['paths']['final'])
+            else:
+                return
+            self._added.add(arcname)
+
+    def close(self, report: Dict[str, Any]) -> str:
+        """
+        Write processing report and finish archive
+
+        Args:
+            report: Processing report
+
+        Returns:
+            Path to ZIP file
+        """
+        with self._lock:
+            if self._zip.fp is not None:
+                write_entry(self._zip, REPORT_NAME, json.dumps(report, indent=2).encode())
+                self._zip.close()
+        return self.zip_path
+
+    def finish(self, batch_id: str, results: List[Dict[str, Any]]) -> str:
+        """
+        Add results not archived yet and close archive with processing report
+
+        Args:
+            batch_id: Batch ID
+            results: Processing results
+
+        Returns:
+            Path to ZIP file
+        """
+        # Files completed before a resume
+        for result in results:
+            self.add_result(result)
+
+        return self.close({
+            'batch_id': batch_id,
+            'timestamp': datetime.now().isoformat(),
+            'total_files': len(results),
+            'successful': len([r for r in results if r['status'] == 'success']),
+            'failed': len([r for r in results if r['status'] == 'error']),
+            'results': results
+        })
+
+
+class _StreamBuffer:
+    """Write-only file object collecting ZIP bytes between yields"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        """Return and clear buffered bytes"""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(entries: Iterable[Tuple[str, Union[str, bytes]]]) -> Iterator[bytes]:
+    """
+    Generate ZIP archive as a byte stream
+
+    Entries are written with data descriptors (no seeking), so the archive
+    can be sent with chunked transfer encoding while entries are still
+    being produced.
+
+    Args:
+        entries: Iterable of (arcname, file path or bytes); may block
+            waiting for new entries
+
+    Yields:
+        Chunks of ZIP data
+    """
+    buffer = _StreamBuffer()
+    with open_zip(buffer) as zipf:
+        for arcname, source in entries:
+            write_entry(zipf, arcname, source)
+            yield buffer.take()
+    yield buffer.take()
+
+
+def stream_running_batch(get_files: Callable[[], List[Dict[str, Any]]], is_running: Callable[[], bool],
+                         get_zip_path: Callable[[], Optional[str]], poll_interval: float = 0.5) -> Iterator[bytes]:
+    """
+    Stream ZIP of a batch that is still processing
+
+    Final images are sent as files finish; the stream ends when the
+    batch stops running, with the processing report of the finished
+    archive appended if it is available.
+
+    Args:
+        get_files: Returns checkpoint rows of the batch files
+        is_running: Returns False once the batch has finished
+        get_zip_path: Returns path of the finished archive (None if not stored)
+        poll_interval: Seconds between checks for new finished files
+
+    Yields:
+        Chunks of ZIP data
+    """
+    def entries():
+        sent = set()
+        while True:
+            running = is_running()
+            for row in get_files():
+                final_path = row['final_path']
+                if row['stage'] != DONE or final_path in sent or not os.path.exists(final_path):
+                    continue
+                sent.add(final_path)
+                yield result_arcname({'paths': {'final': final_path}}), final_path
+            if not running:
+                break
+            time.sleep(poll_interval)
+
+        zip_path = get_zip_path()
+        if zip_path and os.path.exists(zip_path):
+            with zipfile.ZipFile(zip_path) as zipf:
+                if REPORT_NAME in zipf.namelist():
+                    yield REPORT_NAME, zipf.read(REPORT_NAME)
+
+    return stream_zip(entries())
@@ -0,0 +1,271 @@
+"""
+Batch History Module
+SQLite history of batches and processed files
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+
+class BatchHistoryStore:
+    """SQLite store of batch summaries and per-file processing records"""
+
+    def __init__(self, db_path: str):
+        """
+        Initialize history store
+
+        Args:
+            db_path: Path to SQLite database
+        """
+        self.db_path = db_path
+        self._init_tables()
+
+    def _init_tables(self):
+        """Create history tables and columns if missing"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        # Create processing_history table for individual files
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS processing_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+                -- GPT Analysis
+                category TEXT,
+                product_type TEXT,
+                orientation TEXT,
+                aspect_ratio REAL,
+                gpt_analysis TEXT,  -- Full JSON analysis
+                gpt_prompt TEXT,
+
+                -- File paths
+                original_path TEXT,
+                no_bg_path TEXT,
+                final_path TEXT,
+
+                -- Metrics
+                processing_time REAL,
+                status TEXT,
+                error_message TEXT
+            )
+        ''')
+
+        # Create batches table for batch summaries
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id TEXT NOT NULL UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP,
+                total_files INTEGER NOT NULL,
+                successful INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                zip_path TEXT,
+                processing_time REAL,
+                status TEXT DEFAULT 'processing'
+            )
+        ''')
+
+        # Model used by the batch, needed to resume it with the same model
+        batch_columns = [row[1] for row in cursor.execute("PRAGMA table_info(batches)")]
+        if 'model_id' not in batch_columns:
+            cursor.execute("ALTER TABLE batches ADD COLUMN model_id TEXT")
+
+        # Perceptual hash of the original, used to reuse analyses of near-duplicates
+        history_columns = [row[1] for row in cursor.execute("PRAGMA table_info(processing_history)")]
+        if 'image_hash' not in history_columns:
+            cursor.execute("ALTER TABLE processing_history ADD COLUMN image_hash TEXT")
+        # Analyses evicted from the in-memory index are read back by hash
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_image_hash ON processing_history (image_hash)")
+
+        conn.commit()
+        conn.close()
+
+    def save_batch(self, batch_data: Dict[str, Any]):
+        """Save batch information to database"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO batches 
+                (batch_id, total_files, successful, failed, zip_path, processing_time, status, completed_at, model_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                batch_data['batch_id'],
+                batch_data['total_files'],
+                batch_data.get('successful', 0),
+                batch_data.get('failed', 0),
+                batch_data.get('zip_path'),
+                batch_data.get('processing_time'),
+                batch_data.get('status', 'completed'),
+                datetime.now().isoformat(),
+                batch_data.get('model_id')
+            ))
+
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error saving batch to database: {e}")
+
+    def save_record(self, data: Dict[str, Any]):
+        """Save processing record to database"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO processing_history 
+            (batch_id, filename, category, product_type, orientation, 
+             aspect_ratio, gpt_analysis, gpt_prompt, original_path, 
+             no_bg_path, final_path, processing_time, status, error_message, image_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            data.get('batch_id'),
+            data.get('filename'),
+            data.get('category'),
+            data.get('product_type'),
+            data.get('orientation'),
+            data.get('aspect_ratio'),
+            data.get('gpt_analysis'),
+            data.get('gpt_prompt'),
+            data.get('original_path'),
+            data.get('no_bg_path'),
+            data.get('final_path'),
+            data.get('processing_time'),
+            data.get('status'),
+            data.get('error_message'),
+            data.get('image_hash')
+        ))
+
+        conn.commit()
+        conn.close()
+
+    def get_batch_history(self, limit: int = 50) -> List[Dict]:
+        """Get batch processing history"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT batch_id, created_at, total_files, successful, failed, 
+                       zip_path, processing_time, status
+                FROM batches 
+                ORDER BY created_at DESC 
+                LIMIT ?
+            ''', (limit,))
+
+            records = cursor.fetchall()
+            conn.close()
+
+            return [{
+                'batch_id': record[0],
+                'created_at': record[1],
+                'total_files': record[2],
+                'successful': record[3],
+                'failed': record[4],
+                'zip_path': record[5],
+                'processing_time': record[6],
+                'status': record[7]
+            } for record in records]
+
+        except Exception as e:
+            print(f"Error getting batch history: {e}")
+            return []
+
+    def get_batch_by_id(self, batch_id: str) -> Optional[Dict]:
+        """Get batch information by ID"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT batch_id, created_at, total_files, successful, failed, 
+                       zip_path, processing_time, status, model_id
+                FROM batches 
+                WHERE batch_id = ?
+            ''', (batch_id,))
+
+            record = cursor.fetchone()
+            conn.close()
+
+            if record:
+                return {
+                    'batch_id': record[0],
+                    'created_at': record[1],
+                    'total_files': record[2],
+                    'successful': record[3],
+                    'failed': record[4],
+                    'zip_path': record[5],
+                    'processing_time': record[6],
+                    'status': record[7],
+                    'model_id': record[8]
+                }
+            return None
+
+        except Exception as e:
+            print(f"Error getting batch: {e}")
+            return None
+
+    def get_incomplete_batches(self) -> List[str]:
+        """Get IDs of batches left in 'processing' state (e.g. after a restart)"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT batch_id FROM batches 
+                WHERE status = 'processing' 
+                ORDER BY created_at
+            ''')
+
+            batch_ids = [record[0] for record in cursor.fetchall()]
+            conn.close()
+            return batch_ids
+
+        except Exception as e:
+            print(f"Error getting incomplete batches: {e}")
+            return []
+
+    def get_history(self, batch_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """
+        Get processing history from database
+
+        Args:
+            batch_id: Optional batch ID to filter by
+            limit: Maximum number of records
+
+        Returns:
+            List of processing records
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        if batch_id:
+            cursor.execute('''
+                SELECT * FROM processing_history 
+                WHERE batch_id = ? 
+                ORDER BY upload_time DESC 
+                LIMIT ?
+            ''', (batch_id, limit))
+        else:
+            cursor.execute('''
+                SELECT * FROM processing_history 
+                ORDER BY upload_time DESC 
+                LIMIT ?
+            ''', (limit,))
+
+        columns = [description[0] for description in cursor.description]
+        results = []
+
+        for row in cursor.fetchall():
+            results.append(dict(zip(columns, row)))
+
+        conn.close()
+        return results
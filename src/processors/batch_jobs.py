@@ -0,0 +1,170 @@
+"""
+Batch Jobs Module
+Pipeline job dicts: created from uploads or rebuilt from checkpoints on resume
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from .checkpoint import checkpoint_reached, QUEUED, ANALYZED, BG_REMOVED, POSITIONED, DONE
+
+
+def stored_names(filenames: List[str]) -> List[str]:
+    """
+    Pick on-disk names for the files of a batch
+
+    A batch may hold several uploads with the same name (or names that
+    differ only in extension, which collide once finals are saved as
+    PNG); repeats get the file index appended so no output overwrites
+    another.
+
+    Args:
+        filenames: Upload names in batch order
+
+    Returns:
+        Stored name per file, the upload name when it is unique
+    """
+    taken = set()
+    names = []
+    for index, filename in enumerate(filenames):
+        path = Path(filename)
+        if path.stem.lower() in taken:
+            path = path.with_name(f"{path.stem}_{index}{path.suffix}")
+        taken.add(path.stem.lower())
+        names.append(path.name)
+    return names
+
+
+def file_row(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Checkpoint row of a new job"""
+    return {'index': job['index'], 'filename': job['filename'], 'original_path': str(job['original_path'])}
+
+
+def new_job(file: Any, batch_dir: Path, batch_id: str, index: int = 0,
+            stored_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Create pipeline job dict for a single file
+
+    The upload is written to originals/ as-is right away, so the batch
+    can be resumed even if the process stops before the file is decoded.
+
+    Args:
+        file: Uploaded file
+        batch_dir: Batch directory
+        batch_id: Batch ID
+        index: Position of the file in the batch
+        stored_name: Name for the files on disk (upload name if None)
+
+    Returns:
+        Job dict
+    """
+    stored_name = stored_name or file.filename
+    original_path = batch_dir / "originals" / stored_name
+    os.makedirs(original_path.parent, exist_ok=True)
+    with open(original_path, 'wb') as f:
+        f.write(file.stream.read())
+
+    return {
+        'index': index,
+        'filename': file.filename,
+        'stored_name': stored_name,
+        'batch_dir': batch_dir,
+        'batch_id': batch_id,
+        'start_time': time.time(),
+        'status': 'processing',
+        'original_path': original_path,
+        'checkpoint': QUEUED
+    }
+
+
+def new_jobs(files: List[Any], batch_dir: Path, batch_id: str) -> List[Dict[str, Any]]:
+    """Create pipeline jobs for the uploads of a new batch, in batch order"""
+    names = stored_names([file.filename for file in files])
+    return [new_job(file, batch_dir, batch_id, index, names[index]) for index, file in enumerate(files)]
+
+
+def jobs_from_checkpoints(rows: List[Dict[str, Any]],
+                          batch_dir: Path) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split checkpoint rows of a resumed batch into remaining jobs and finished results
+
+    Args:
+        rows: batch_files rows
+        batch_dir: Batch directory
+
+    Returns:
+        (jobs to run, results of files that are already done)
+    """
+    jobs = []
+    results = []
+    for row in rows:
+        job = job_from_checkpoint(row, batch_dir)
+        if job:
+            jobs.append(job)
+        else:
+            results.append(result_from_checkpoint(row))
+    return jobs, results
+
+
+def job_from_checkpoint(row: Dict[str, Any], batch_dir: Path) -> Optional[Dict[str, Any]]:
+    """
+    Rebuild pipeline job from checkpoint row
+
+    Args:
+        row: batch_files row
+        batch_dir: Batch directory
+
+    Returns:
+        Job dict, or None if the file is already done
+    """
+    stage = row['stage']
+    final_exists = bool(row['final_path']) and os.path.exists(row['final_path'])
+    no_bg_exists = bool(row['no_bg_path']) and os.path.exists(row['no_bg_path'])
+
+    if checkpoint_reached(stage, DONE) and final_exists:
+        return None
+
+    # Step back if a stored output went missing
+    if checkpoint_reached(stage, POSITIONED) and not final_exists:
+        stage = BG_REMOVED
+    if checkpoint_reached(stage, BG_REMOVED) and not no_bg_exists:
+        stage = ANALYZED
+
+    job = {
+        'index': row['file_index'],
+        'filename': row['filename'],
+        'stored_name': Path(row['original_path']).name,
+        'batch_dir': batch_dir,
+        'batch_id': row['batch_id'],
+        'start_time': time.time(),
+        'status': 'processing',
+        'original_path': Path(row['original_path']),
+        'checkpoint': stage
+    }
+    if checkpoint_reached(stage, ANALYZED):
+        job['analysis'] = json.loads(row['analysis'])
+        job['lora_prompt'] = row['prompt']
+    if checkpoint_reached(stage, BG_REMOVED):
+        job['no_bg_path'] = Path(row['no_bg_path'])
+    if checkpoint_reached(stage, POSITIONED):
+        job['final_path'] = Path(row['final_path'])
+
+    return job
+
+
+def result_from_checkpoint(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Build result dict for a file completed before the restart"""
+    return {
+        'filename': row['filename'],
+        'status': 'success',
+        'processing_time': 0.0,
+        'analysis': json.loads(row['analysis']) if row['analysis'] else {},
+        'paths': {
+            'original': row['original_path'],
+            'no_bg': row['no_bg_path'],
+            'final': row['final_path']
+        }
+    }
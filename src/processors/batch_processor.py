@@ -4,218 +4,323 @@ Handles multiple image processing with progress tracking
 """
 
 import os
-import io
-import json
 import time
-import zipfile
-import sqlite3
-import base64
-from datetime import datetime
-from typing import List, Dict, Any, Optional, Callable
+from typing import List, Dict, Any, Optional, Callable, Iterator
 from PIL import Image
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from .gpt_analyzer import GPTProductAnalyzer
 from .smart_positioning import SmartPositioning
+from .pipeline import StagedPipeline
+from .analysis_index import AnalysisIndex
+from .batch_analysis import BatchAnalysis
+from .batch_archive import BatchArchive, stream_running_batch
+from .batch_history import BatchHistoryStore
+from .batch_jobs import file_row, jobs_from_checkpoints, new_job, new_jobs
+from .batch_speculation import SpeculativeBackground
+from .batch_stages import BatchStages
+from .background_removal import BackgroundRemover
+from .cpu_offload import ProcessOffload
+from .fal_queue import FalJobStore, FalJobQueue
+from .fal_queue_stages import FalQueueStages
+from .local_analyzer import LocalHeuristicAnalyzer
+from .inference_backends import create_analyzer
+from ..utils.http_client import http_client
+from .checkpoint import BatchCheckpointStore
 from ..models.model_registry import ModelRegistry
 from ..models.selection_policy import ModelSelectionPolicy
+from ..utils.concurrency import AdaptiveConcurrencyLimiter
+from ..utils.rate_limit import rate_limiters
+from ..utils.result_cache import ResultCache
+from ..utils.upload_manager import UploadManager
+from ..utils.single_flight import SingleFlight
+from ..utils.micro_batch import MicroBatcher
+
+# Worker counts per pipeline stage: network stages keep many requests
+# in flight (the effective limit is set by the adaptive limiters),
+# CPU stages stay at core count
+CPU_WORKERS = os.cpu_count() or 2
 
 
 class BatchProcessor:
-    """Process multiple images with progress tracking and history"""
+    """
+    Process multiple images with progress tracking and history
+    
+    Orchestrates batches: stage handlers live in BatchStages, job
+    analysis in BatchAnalysis, speculative background removal in
+    SpeculativeBackground and job creation/resume in batch_jobs.
+    """
+    
+    DEFAULT_STAGE_WORKERS = {
+        'decode': CPU_WORKERS,
+        'analyze': int(os.environ.get('OPENAI_MAX_CONCURRENCY', 64)),
+        'remove_background': int(os.environ.get('FAL_MAX_CONCURRENCY', 64)),
+        'fetch_background': 16,  # Queue mode only: result downloads
+        'position': CPU_WORKERS,
+        'encode': CPU_WORKERS,
+        'record': 1  # Single writer keeps SQLite free of lock contention
+    }
+    NETWORK_STAGES = ('analyze', 'remove_background')
     
-    def __init__(self, db_path: str = "database/history.db"):
+    def __init__(self, db_path: str = "database/history.db", cpu_mode: Optional[str] = None):
         """
         Initialize batch processor
         
         Args:
             db_path: Path to SQLite database
+            cpu_mode: 'threads' or 'processes' for positioning and encoding
+                (default CPU_STAGE_MODE or 'threads')
         """
         self.db_path = db_path
-        self.gpt_analyzer = GPTProductAnalyzer()
+        
+        # Adaptive concurrency limits for remote providers, on top of the
+        # process-wide request/token budgets shared with single-image mode
+        self.limiters = {
+            'openai': AdaptiveConcurrencyLimiter(
+                'openai', max_limit=int(os.environ.get('OPENAI_MAX_CONCURRENCY', 64)),
+                rate_limiter=rate_limiters['openai']),
+            'fal': AdaptiveConcurrencyLimiter(
+                'fal', max_limit=int(os.environ.get('FAL_MAX_CONCURRENCY', 64)),
+                rate_limiter=rate_limiters['fal'])
+        }
+        
+        # Source images are uploaded once and shared by GPT, LoRA, fallback and retries
+        self.upload_manager = UploadManager()
+        
+        # Analysis providers (ANALYSIS_BACKEND)
+        self.gpt_analyzer = create_analyzer(limiter=self.limiters['openai'], upload_manager=self.upload_manager)
+        # Local analysis from pixels and filename; GPT only runs below LOCAL_ANALYSIS_THRESHOLD
+        self.local_analyzer = LocalHeuristicAnalyzer()
         self.positioner = SmartPositioning()
+        
+        # Optional process pool for positioning and encoding (frees the GIL for network stages)
+        self.cpu_mode = cpu_mode or os.environ.get('CPU_STAGE_MODE', 'threads')
+        self.cpu_offload = ProcessOffload(CPU_WORKERS) if self.cpu_mode == 'processes' else None
         # Support both FAL_KEY (official) and FAL_API_KEY (legacy) 
         self.fal_api_key = os.environ.get('FAL_KEY') or os.environ.get('FAL_API_KEY', '')
-        self.lora_path = os.environ.get('LORA_PATH', 
-            'https://v3.fal.media/files/rabbit/McQtMDl9HQ2cKh0_E-CrO_adapter_model.safetensors')
+        
+        # Background removal results reused across batches
+        self.result_cache = ResultCache()
+        
+        # Identical requests already in flight (same pixels and settings) are joined, not repeated
+        self.inflight = {
+            'analysis': SingleFlight('analysis'),
+            'background': SingleFlight('background')
+        }
+        
+        # Concurrent analyses are packed into one multi-image GPT request (OPENAI_ANALYSIS_BATCH)
+        self.analysis_batcher = MicroBatcher(
+            lambda images: self.gpt_analyzer.analyze_images(images),
+            max_batch=self.gpt_analyzer.batch_size,
+            max_wait=float(os.environ.get('OPENAI_ANALYSIS_BATCH_WAIT', 0.2)),
+            name='analysis')
         
         # Model registry and selection policy
         self.model_registry = ModelRegistry()
         self.selection_policy = ModelSelectionPolicy()
         
-        # Initialize database
-        self._init_database()
+        # Model calls: selection, cache, hedging and BiRefNet fallback (uses the batch model if set)
+        self.background = BackgroundRemover(
+            self.model_registry, self.selection_policy, self.upload_manager, self.limiters['fal'],
+            self.result_cache, self.inflight['background'], batch_model_id=lambda: self.current_model_id)
+        
+        # History and per-file checkpoints
+        self.history = BatchHistoryStore(self.db_path)
+        self.checkpoints = BatchCheckpointStore(self.db_path)
+        
+        # Queue mode: submit all fal jobs up front, one poller collects them
+        self.fal_queue_mode = os.environ.get('FAL_QUEUE_MODE', '0') == '1'
+        self.fal_queue = FalQueueStages(
+            FalJobQueue(FalJobStore(self.db_path), poll_interval=float(os.environ.get('FAL_POLL_INTERVAL', 2.0))),
+            self.background, self.limiters['fal'])
+        
+        # Job analysis: near-duplicate reuse, local heuristics, then shared and batched GPT calls
+        self.analysis_index = AnalysisIndex(self.db_path)
+        self.analysis = BatchAnalysis(self.gpt_analyzer, self.local_analyzer, self.analysis_index,
+                                      self.inflight['analysis'], self.analysis_batcher)
+        
+        # Single-image paths start LoRA with a guessed prompt while GPT runs (SPECULATIVE_BACKGROUND=0 disables)
+        self.speculation = SpeculativeBackground(
+            self.gpt_analyzer, self.local_analyzer, self.analysis_index,
+            lambda image, prompt, model_id: self._remove_background_fal(image, prompt, model_id),
+            enabled=os.environ.get('SPECULATIVE_BACKGROUND', '1') != '0')
+        
+        self.stages = BatchStages(self)
         
         # Processing state
         self.current_batch_id = None
+        self.current_model_id = None
         self.progress_callback = None
         
-    def _init_database(self):
-        """Initialize SQLite database for processing history"""
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create processing_history table for individual files
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS processing_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                batch_id TEXT NOT NULL,
-                filename TEXT NOT NULL,
-                upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                
-                -- GPT Analysis
-                category TEXT,
-                product_type TEXT,
-                orientation TEXT,
-                aspect_ratio REAL,
-                gpt_analysis TEXT,  -- Full JSON analysis
-                gpt_prompt TEXT,
-                
-                -- File paths
-                original_path TEXT,
-                no_bg_path TEXT,
-                final_path TEXT,
-                
-                -- Metrics
-                processing_time REAL,
-                status TEXT,
-                error_message TEXT
-            )
-        ''')
-        
-        # Create batches table for batch summaries
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS batches (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                batch_id TEXT NOT NULL UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                total_files INTEGER NOT NULL,
-                successful INTEGER DEFAULT 0,
-                failed INTEGER DEFAULT 0,
-                zip_path TEXT,
-                processing_time REAL,
-                status TEXT DEFAULT 'processing'
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def _save_batch_to_database(self, batch_data: Dict[str, Any]):
-        """Save batch information to database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO batches 
-                (batch_id, total_files, successful, failed, zip_path, processing_time, status, completed_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                batch_data['batch_id'],
-                batch_data['total_files'],
-                batch_data.get('successful', 0),
-                batch_data.get('failed', 0),
-                batch_data.get('zip_path'),
-                batch_data.get('processing_time'),
-                batch_data.get('status', 'completed'),
-                datetime.now().isoformat()
-            ))
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Error saving batch to database: {e}")
-    
     def get_batch_history(self, limit: int = 50) -> List[Dict]:
         """Get batch processing history"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT batch_id, created_at, total_files, successful, failed, 
-                       zip_path, processing_time, status
-                FROM batches 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ''', (limit,))
-            
-            records = cursor.fetchall()
-            conn.close()
-            
-            return [{
-                'batch_id': record[0],
-                'created_at': record[1],
-                'total_files': record[2],
-                'successful': record[3],
-                'failed': record[4],
-                'zip_path': record[5],
-                'processing_time': record[6],
-                'status': record[7]
-            } for record in records]
-            
-        except Exception as e:
-            print(f"Error getting batch history: {e}")
-            return []
+        return self.history.get_batch_history(limit)
     
     def get_batch_by_id(self, batch_id: str) -> Optional[Dict]:
         """Get batch information by ID"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT batch_id, created_at, total_files, successful, failed, 
-                       zip_path, processing_time, status
-                FROM batches 
-                WHERE batch_id = ?
-            ''', (batch_id,))
-            
-            record = cursor.fetchone()
-            conn.close()
-            
-            if record:
-                return {
-                    'batch_id': record[0],
-                    'created_at': record[1],
-                    'total_files': record[2],
-                    'successful': record[3],
-                    'failed': record[4],
-                    'zip_path': record[5],
-                    'processing_time': record[6],
-                    'status': record[7]
-                }
-            return None
-            
-        except Exception as e:
-            print(f"Error getting batch: {e}")
-            return None
+        return self.history.get_batch_by_id(batch_id)
+    
+    def get_incomplete_batches(self) -> List[str]:
+        """Get IDs of batches left in 'processing' state (e.g. after a restart)"""
+        return self.history.get_incomplete_batches()
+    
+    def get_history(self, batch_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Get processing history from database, optionally of one batch"""
+        return self.history.get_history(batch_id, limit)
     
     def process_batch(self, 
                      files: List[Any],
                      progress_callback: Optional[Callable] = None,
-                     max_workers: int = 3,
-                     model_id: Optional[str] = None) -> Dict[str, Any]:
+                     max_workers: Optional[int] = None,
+                     model_id: Optional[str] = None,
+                     stage_workers: Optional[Dict[str, int]] = None,
+                     batch_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Process multiple images in batch
         
+        Images flow through a staged pipeline (decode → analyze →
+        remove_background → position → encode → record), every stage
+        with its own bounded queue and worker count.
+        
         Args:
             files: List of file objects
             progress_callback: Function to call with progress updates
-            max_workers: Number of parallel workers
+            max_workers: Legacy cap for the network stages (analyze, remove_background)
             model_id: Model ID to use for processing (if None, auto-select)
+            stage_workers: Optional per-stage worker counts overriding DEFAULT_STAGE_WORKERS
+            batch_id: Batch ID to use (generated if None)
             
         Returns:
             Dict with batch results
         """
-        self.current_batch_id = f"batch_{int(time.time())}"
         self.progress_callback = progress_callback
+        batch_dir = self._start_batch(files, model_id, batch_id)
+        
+        jobs = new_jobs(files, batch_dir, self.current_batch_id)
+        self.checkpoints.register_files(self.current_batch_id, [file_row(job) for job in jobs])
+        
+        results = []
+        self._run_pipeline(jobs, results, len(files), max_workers, stage_workers)
+        
+        return self._finish_batch(batch_dir, results)
+    
+    def resume_batch(self,
+                     batch_id: str,
+                     progress_callback: Optional[Callable] = None,
+                     stage_workers: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Resume interrupted batch from its per-file checkpoints
+        
+        Files whose final output already exists are skipped; other files
+        restart from their last finished checkpoint, so no GPT or LoRA
+        call is repeated for work that was already stored.
+        
+        Args:
+            batch_id: ID of batch to resume
+            progress_callback: Function to call with progress updates
+            stage_workers: Optional per-stage worker counts overriding DEFAULT_STAGE_WORKERS
+            
+        Returns:
+            Dict with batch results
+        """
+        rows = self.checkpoints.get_files(batch_id)
+        if not rows:
+            raise ValueError(f"No checkpoints found for batch {batch_id}")
+        
+        batch_info = self.get_batch_by_id(batch_id) or {}
+        self.progress_callback = progress_callback
+        self.current_batch_id = batch_id
+        self.current_model_id = batch_info.get('model_id')
+        batch_dir = Path(f"processed/{batch_id}")
+        self._open_archive(batch_dir)
+        
+        jobs, results = jobs_from_checkpoints(rows, batch_dir)
+        
+        print(f"🔄 Возобновление {batch_id}: готово {len(results)}, осталось {len(jobs)}")
+        
+        self._run_pipeline(jobs, results, len(rows), None, stage_workers)
+        
+        return self._finish_batch(batch_dir, results)
+    
+    def _run_pipeline(self, jobs: List[Dict[str, Any]], results: List[Dict],
+                      total_files: int, max_workers: Optional[int] = None,
+                      stage_workers: Optional[Dict[str, int]] = None):
+        """
+        Run jobs through the staged pipeline, appending results as they land
+        
+        Args:
+            jobs: Job dicts to process
+            results: List to append result dicts to (may already hold skipped files)
+            total_files: Total file count reported in progress
+            max_workers: Legacy cap for the network stages
+            stage_workers: Optional per-stage worker counts
+        """
+        workers = dict(self.DEFAULT_STAGE_WORKERS)
+        if max_workers:
+            for name in self.NETWORK_STAGES:
+                workers[name] = max_workers
+        workers.update(stage_workers or {})
+        
+        pipeline = StagedPipeline(self.stages.build(workers))
+        
+        # Collect jobs as they leave the last stage
+        for job in pipeline.run(jobs):
+            result = job['result']
+            results.append(result)
+            self.archive.add_result(result, job.pop('final_bytes', None))
+            
+            # Update progress
+            if self.progress_callback:
+                self.progress_callback({
+                    'processed': len(results),
+                    'total': total_files,
+                    'current_file': result['filename'],
+                    'status': result['status'],
+                    'stages': pipeline.get_stats(),
+                    'concurrency': self.get_concurrency_snapshot()
+                })
+    
+    def get_concurrency_snapshot(self) -> Dict[str, Any]:
+        """Get current limit and decision signals of every provider limiter"""
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get runtime metrics of the processor
+        
+        Returns:
+            Dict with metrics sections
+        """
+        return {
+            'concurrency': self.get_concurrency_snapshot(),
+            'result_cache': self.result_cache.stats(),
+            'http': http_client.stats(),
+            'uploads': self.upload_manager.stats(),
+            'analysis_index': self.analysis_index.stats(),
+            'fal_queue': self.fal_queue.jobs.stats(),
+            'hedging': self.background.lora_latency.stats(),
+            'circuit_breakers': self.selection_policy.breakers.snapshot(),
+            'single_flight': {name: group.stats() for name, group in self.inflight.items()},
+            'analysis_batches': self.analysis_batcher.stats(),
+            'analysis_thumbnails': self.gpt_analyzer.thumbnails.stats(),
+            'local_analysis': self.local_analyzer.stats(),
+            'speculative_background': self.speculation.stats(),
+            'rate_limits': {name: limiter.stats() for name, limiter in rate_limiters.items()}
+        }
+    
+    def _start_batch(self, files: List[Any], model_id: Optional[str] = None,
+                     batch_id: Optional[str] = None) -> Path:
+        """
+        Register new batch and create its directories
+        
+        Args:
+            files: List of file objects
+            model_id: Model ID to use for processing (if None, auto-select)
+            batch_id: Batch ID to use (generated if None)
+            
+        Returns:
+            Batch directory path
+        """
+        self.current_batch_id = batch_id or f"batch_{int(time.time())}"
         self.current_model_id = model_id  # Store model_id for processing
         
         # Save initial batch to database
@@ -225,7 +330,7 @@ class BatchProcessor:
             'status': 'processing',
             'model_id': model_id
         }
-        self._save_batch_to_database(initial_batch_data)
+        self.history.save_batch(initial_batch_data)
         
         # Create batch directories
         batch_dir = Path(f"processed/{self.current_batch_id}")
@@ -234,60 +339,41 @@ class BatchProcessor:
         (batch_dir / "originals").mkdir(exist_ok=True)
         (batch_dir / "no_background").mkdir(exist_ok=True)
         (batch_dir / "final").mkdir(exist_ok=True)
+        self._open_archive(batch_dir)
         
-        results = []
-        total_files = len(files)
-        processed = 0
-        
-        # Process files with thread pool
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            future_to_file = {
-                executor.submit(self._process_single_image, file, batch_dir): file
-                for file in files
-            }
+        return batch_dir
+    
+    def _open_archive(self, batch_dir: Path):
+        """Start result archive that is filled while the batch runs"""
+        self.archive = BatchArchive(batch_dir / f"{self.current_batch_id}.zip")
+    
+    def _finish_batch(self, batch_dir: Path, results: List[Dict]) -> Dict[str, Any]:
+        """
+        Archive results and store batch summary
+        
+        Args:
+            batch_dir: Batch directory
+            results: Processing results
             
-            # Process completed tasks
-            for future in as_completed(future_to_file):
-                file = future_to_file[future]
-                try:
-                    result = future.result()
-                    results.append(result)
-                    processed += 1
-                    
-                    # Update progress
-                    if self.progress_callback:
-                        self.progress_callback({
-                            'processed': processed,
-                            'total': total_files,
-                            'current_file': result['filename'],
-                            'status': result['status']
-                        })
-                        
-                except Exception as e:
-                    print(f"Error processing {file.filename}: {e}")
-                    results.append({
-                        'filename': file.filename,
-                        'status': 'error',
-                        'error': str(e)
-                    })
-                    processed += 1
-        
-        # Create ZIP archive
-        zip_path = self._create_zip_archive(batch_dir, results)
+        Returns:
+            Dict with batch results
+        """
+        # Finish ZIP archive
+        zip_path = self.archive.finish(self.current_batch_id, results)
         
         # Prepare result data
         result_data = {
             'batch_id': self.current_batch_id,
-            'total_files': total_files,
+            'total_files': len(results),
             'successful': len([r for r in results if r['status'] == 'success']),
             'failed': len([r for r in results if r['status'] == 'error']),
             'results': results,
-            'zip_path': zip_path
+            'zip_path': zip_path,
+            'model_id': self.current_model_id
         }
         
         # Save batch to database
-        self._save_batch_to_database(result_data)
+        self.history.save_batch(result_data)
         
         return result_data
     
@@ -295,6 +381,9 @@ class BatchProcessor:
         """
         Process a single image through the full pipeline
         
+        Runs all stage handlers sequentially in the calling thread,
+        with LoRA started on a guessed prompt while the image is analyzed.
+        
         Args:
             file: File object
             batch_dir: Directory for saving processed files
@@ -302,129 +391,12 @@ class BatchProcessor:
         Returns:
             Processing result dict
         """
-        start_time = time.time()
-        filename = file.filename
+        job = new_job(file, batch_dir, self.current_batch_id)
+        self.checkpoints.register_files(self.current_batch_id, [file_row(job)])
+        stages = self.stages.build({name: 1 for name in self.DEFAULT_STAGE_WORKERS})
+        self.speculation.run_stages(job, stages, speculate=not self.fal_queue_mode)
         
-        try:
-            # Save original
-            original_path = batch_dir / "originals" / filename
-            os.makedirs(original_path.parent, exist_ok=True)
-            
-            # Load image directly from stream  
-            image = Image.open(file.stream)
-            
-            # Save image as-is (keep original format)
-            image.save(original_path)
-            
-            # Convert to RGBA for processing only  
-            if image.mode != 'RGBA':
-                image = image.convert('RGBA')
-            
-            # Step 1: GPT Analysis
-            gpt_result = self.gpt_analyzer.analyze_image(image)
-            
-            if gpt_result['success']:
-                analysis = gpt_result['analysis']
-            else:
-                # Use fallback analysis
-                analysis = gpt_result.get('fallback', {})
-            
-            # Step 2: Generate LoRA prompt
-            lora_prompt = self.gpt_analyzer.create_lora_prompt(analysis)
-            
-            # Step 3: Remove background with LoRA
-            no_bg_image = self._remove_background_fal(image, lora_prompt)
-            
-            if no_bg_image:
-                # Save no-background version
-                no_bg_path = batch_dir / "no_background" / filename
-                no_bg_image.save(no_bg_path)
-                
-                # Step 4: Smart positioning
-                final_image = self.positioner.process_image(no_bg_image, analysis)
-                
-                # Save final version
-                final_path = batch_dir / "final" / filename
-                
-                # Convert RGBA to RGB for JPEG, or save as PNG
-                if final_path.suffix.lower() in ['.jpg', '.jpeg']:
-                    # Convert to RGB for JPEG
-                    if final_image.mode == 'RGBA':
-                        rgb_image = Image.new('RGB', final_image.size, (255, 255, 255))
-                        rgb_image.paste(final_image, mask=final_image.split()[-1] if final_image.mode == 'RGBA' else None)
-                        rgb_image.save(final_path, 'JPEG')
-                    else:
-                        final_image.save(final_path)
-                else:
-                    # Save as PNG to preserve transparency
-                    final_path = final_path.with_suffix('.png')
-                    final_image.save(final_path, 'PNG')
-                
-                # Calculate processing time
-                processing_time = time.time() - start_time
-                
-                # Save to database
-                self._save_to_database({
-                    'batch_id': self.current_batch_id,
-                    'filename': filename,
-                    'category': analysis.get('category', 'unknown'),
-                    'product_type': analysis.get('product_identification', {}).get('type', 'unknown'),
-                    'orientation': analysis.get('geometry', {}).get('orientation', 'standard'),
-                    'aspect_ratio': analysis.get('geometry', {}).get('aspect_ratio', 1.0),
-                    'gpt_analysis': json.dumps(analysis),
-                    'gpt_prompt': lora_prompt,
-                    'original_path': str(original_path),
-                    'no_bg_path': str(no_bg_path),
-                    'final_path': str(final_path),
-                    'processing_time': processing_time,
-                    'status': 'success'
-                })
-                
-                return {
-                    'filename': filename,
-                    'status': 'success',
-                    'processing_time': processing_time,
-                    'analysis': analysis,
-                    'paths': {
-                        'original': str(original_path),
-                        'no_bg': str(no_bg_path),
-                        'final': str(final_path)
-                    }
-                }
-            else:
-                raise Exception("Failed to remove background")
-                
-        except Exception as e:
-            # Print detailed error for debugging
-            import traceback
-            error_msg = f"Error processing {filename}: {str(e)}"
-            print(f"ERROR: {error_msg}", flush=True)
-            print(f"TRACEBACK: {traceback.format_exc()}", flush=True)
-            
-            # Also write to file for debugging
-            try:
-                with open('/app/debug.log', 'a') as f:
-                    f.write(f"ERROR: {error_msg}\n")
-                    f.write(f"TRACEBACK: {traceback.format_exc()}\n")
-                    f.write("="*50 + "\n")
-            except:
-                pass
-            
-            # Save error to database
-            self._save_to_database({
-                'batch_id': self.current_batch_id,
-                'filename': filename,
-                'status': 'error',
-                'error_message': str(e),
-                'processing_time': time.time() - start_time
-            })
-            
-            return {
-                'filename': filename,
-                'status': 'error',
-                'error': str(e),
-                'processing_time': time.time() - start_time
-            }
+        return job['result']
     
     def _remove_background_fal_v2(self, image: Image.Image, prompt: str, model_id: Optional[str] = None) -> Optional[Image.Image]:
         """
@@ -439,157 +411,10 @@ class BatchProcessor:
         Returns:
             Image with removed background or None if failed
         """
-        if not self.fal_api_key:
-            print("FAL_API_KEY not configured")
-            return None
-        
-        try:
-            import fal_client
-            
-            # Проверяем переменные окружения
-            if not os.environ.get('FAL_KEY') and not os.environ.get('FAL_API_KEY'):
-                print("❌ Ни FAL_KEY, ни FAL_API_KEY не настроены в переменных окружения")
-                return self._remove_background_birefnet(image)
-            
-            # Select model using policy or provided model_id
-            if model_id:
-                model_info = self.model_registry.get_model_by_id(model_id)
-                if not model_info:
-                    print(f"❌ Модель {model_id} не найдена, используем автовыбор")
-                    selected_model, reason = self.selection_policy.select_model()
-                else:
-                    selected_model = model_info
-                    reason = f"Specified by user: {model_id}"
-            else:
-                # Use current_model_id if set (from batch processing)
-                if hasattr(self, 'current_model_id') and self.current_model_id:
-                    model_info = self.model_registry.get_model_by_id(self.current_model_id)
-                    if model_info:
-                        selected_model = model_info
-                        reason = f"Batch model: {self.current_model_id}"
-                    else:
-                        selected_model, reason = self.selection_policy.select_model()
-                else:
-                    selected_model, reason = self.selection_policy.select_model()
-            
-            print(f"✅ Выбрана модель: {selected_model.name} {selected_model.version}")
-            print(f"   Причина: {reason}")
-            
-            # Convert image to base64
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode()
-            
-            # Get model spec
-            model_spec = selected_model.spec
-            
-            # Configure settings from model spec
-            if selected_model.id == 'birefnet-fallback':
-                # Use BiRefNet fallback
-                return self._remove_background_birefnet(image)
-            
-            # For LoRA models
-            guidance_scale = model_spec.guidance_scale
-            inference_steps = model_spec.num_inference_steps
-            
-            # Use default prompt if not provided
-            if not prompt or prompt.strip() == "":
-                if selected_model.version == 'v2':
-                    prompt = "Isolate the main product from the original image. Remove all text, graphics, watermarks, and extra objects. Replace the background with a pure white background. Keep product colors, proportions, and details. Add a soft realistic shadow for a natural catalog look."
-                else:
-                    prompt = "remove background, place product on pure white background, keep shadows for realism, professional product photography"
-            
-            print(f"🔧 Конфигурация {selected_model.name} {selected_model.version}:")
-            print(f"   Endpoint: {selected_model.endpoint}")
-            print(f"   Шаги: {inference_steps}")
-            print(f"   Guidance Scale: {guidance_scale}")
-            print(f"   Промпт: {prompt[:50]}...")
-            
-            # Get LoRA path from endpoint or environment
-            if selected_model.version == 'v2':
-                lora_path = "https://v3.fal.media/files/zebra/KoeQj8N4bU6OGnPT2VABy_adapter_model.safetensors"
-            else:
-                lora_path = self.lora_path
-            
-            # Progress callback for debugging
-            def on_queue_update(update):
-                if isinstance(update, fal_client.InProgress):
-                    print(f"🔄 Processing {selected_model.name} {selected_model.version}: {len(update.logs)} logs")
-                    for log in update.logs[-2:]:  # Show last 2 logs only
-                        print(f"  {log.get('message', '')}")
-            
-            # Use FLUX Kontext with LoRA via official client
-            arguments = {
-                "image_url": f"data:image/png;base64,{img_base64}",
-                "prompt": prompt,
-                "num_inference_steps": inference_steps,
-                "guidance_scale": guidance_scale,
-                "output_format": "png",
-                "enable_safety_checker": False,
-                "loras": [
-                    {
-                        "path": lora_path,
-                        "scale": 1.0
-                    }
-                ],
-                "resolution_mode": "match_input"
-            }
-            
-            # Make API call with proper subscription handling
-            print(f"🔄 Отправляем запрос к FLUX Kontext LoRA {lora_version}...")
-            print(f"📤 Аргументы API: {arguments}")
-            
-            try:
-                result = fal_client.subscribe(
-                    "fal-ai/flux-kontext-lora",
-                    arguments=arguments,
-                    with_logs=True,
-                    on_queue_update=on_queue_update,
-                )
-                
-                print(f"📋 Результат API: {type(result)}")
-                if result:
-                    print(f"📋 Ключи в результате: {list(result.keys()) if isinstance(result, dict) else 'не dict'}")
-                
-                if result and 'images' in result and len(result['images']) > 0:
-                    img_url = result['images'][0]['url']
-                    print(f"📥 Загружаем результат с {img_url[:50]}...")
-                    img_response = requests.get(img_url)
-                    if img_response.status_code == 200:
-                        result_image = Image.open(io.BytesIO(img_response.content))
-                        print(f"✅ Успешно обработано с LoRA {lora_version}")
-                        return result_image
-                    else:
-                        print(f"❌ Ошибка загрузки изображения: {img_response.status_code}")
-                else:
-                    print(f"❌ LoRA {lora_version} не вернул изображения")
-                    if result:
-                        print(f"📋 Полный результат: {result}")
-                        
-            except Exception as api_error:
-                print(f"❌ Ошибка API запроса: {api_error}")
-                print(f"❌ Тип ошибки: {type(api_error)}")
-                if hasattr(api_error, 'response'):
-                    print(f"❌ HTTP статус: {api_error.response.status_code if api_error.response else 'нет'}")
-                    print(f"❌ HTTP тело: {api_error.response.text if api_error.response else 'нет'}")
-            
-            # Fallback to BiRefNet if LoRA fails
-            print(f"🔄 LoRA {lora_version} failed, trying BiRefNet fallback")
-            return self._remove_background_birefnet(image)
-            
-        except ImportError:
-            print("❌ fal_client не установлен")
-            return self._remove_background_birefnet(image)
-        except Exception as e:
-            print(f"❌ Error in LoRA {lora_version} background removal: {e}")
-            # Fallback to BiRefNet
-            try:
-                return self._remove_background_birefnet(image)
-            except Exception as fallback_error:
-                print(f"❌ BiRefNet fallback также провалился: {fallback_error}")
-                return None
-
-    def _remove_background_fal(self, image: Image.Image, prompt: str) -> Optional[Image.Image]:
+        return self.background.remove_background(image, prompt, model_id)
+    
+    def _remove_background_fal(self, image: Image.Image, prompt: str,
+                               model_id: Optional[str] = None) -> Optional[Image.Image]:
         """
         Remove background using Fal.ai API with LoRA model
         Delegates to _remove_background_fal_v2 with model selection
@@ -597,166 +422,32 @@ class BatchProcessor:
         Args:
             image: Input image
             prompt: Optimized prompt from GPT
+            model_id: Model ID to use (if None, uses selection policy)
             
         Returns:
             Image with removed background or None if failed
         """
         # Use the new method with model selection
-        return self._remove_background_fal_v2(image, prompt)
+        return self._remove_background_fal_v2(image, prompt, model_id)
     
-    def _save_to_database(self, data: Dict[str, Any]):
-        """Save processing record to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO processing_history 
-            (batch_id, filename, category, product_type, orientation, 
-             aspect_ratio, gpt_analysis, gpt_prompt, original_path, 
-             no_bg_path, final_path, processing_time, status, error_message)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('batch_id'),
-            data.get('filename'),
-            data.get('category'),
-            data.get('product_type'),
-            data.get('orientation'),
-            data.get('aspect_ratio'),
-            data.get('gpt_analysis'),
-            data.get('gpt_prompt'),
-            data.get('original_path'),
-            data.get('no_bg_path'),
-            data.get('final_path'),
-            data.get('processing_time'),
-            data.get('status'),
-            data.get('error_message')
-        ))
-        
-        conn.commit()
-        conn.close()
+    def _remove_background_birefnet(self, image: Image.Image) -> Optional[Image.Image]:
+        """Fallback background removal using BiRefNet API"""
+        return self.background.remove_background_birefnet(image)
     
-    def _create_zip_archive(self, batch_dir: Path, results: List[Dict]) -> str:
-        """
-        Create ZIP archive of processed images
-        
-        Args:
-            batch_dir: Directory with processed images
-            results: Processing results
-            
-        Returns:
-            Path to ZIP file
-        """
-        zip_path = batch_dir / f"{self.current_batch_id}.zip"
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Add final images
-            for result in results:
-                if result['status'] == 'success':
-                    final_path = result['paths']['final']
-                    if os.path.exists(final_path):
-                        arcname = f"final/{os.path.basename(final_path)}"
-                        zipf.write(final_path, arcname)
-            
-            # Add processing report
-            report = {
-                'batch_id': self.current_batch_id,
-                'timestamp': datetime.now().isoformat(),
-                'total_files': len(results),
-                'successful': len([r for r in results if r['status'] == 'success']),
-                'failed': len([r for r in results if r['status'] == 'error']),
-                'results': results
-            }
-            
-            report_json = json.dumps(report, indent=2)
-            zipf.writestr('processing_report.json', report_json)
-        
-        return str(zip_path)
     
-    def get_history(self, batch_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+    def stream_batch_archive(self, batch_id: str, is_running: Callable[[], bool],
+                             poll_interval: float = 0.5) -> Iterator[bytes]:
         """
-        Get processing history from database
+        Stream ZIP of a batch that is still processing
         
         Args:
-            batch_id: Optional batch ID to filter by
-            limit: Maximum number of records
+            batch_id: Batch ID
+            is_running: Returns False once the batch has finished
+            poll_interval: Seconds between checks for new finished files
             
-        Returns:
-            List of processing records
-        """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if batch_id:
-            cursor.execute('''
-                SELECT * FROM processing_history 
-                WHERE batch_id = ? 
-                ORDER BY upload_time DESC 
-                LIMIT ?
-            ''', (batch_id, limit))
-        else:
-            cursor.execute('''
-                SELECT * FROM processing_history 
-                ORDER BY upload_time DESC 
-                LIMIT ?
-            ''', (limit,))
-        
-        columns = [description[0] for description in cursor.description]
-        results = []
-        
-        for row in cursor.fetchall():
-            results.append(dict(zip(columns, row)))
-        
-        conn.close()
-        return results
-    
-    def _remove_background_birefnet(self, image: Image.Image) -> Optional[Image.Image]:
-        """
-        Fallback background removal using BiRefNet API
-        
-        Args:
-            image: Input image
-            
-        Returns:
-            Image with removed background or None if failed
+        Yields:
+            Chunks of ZIP data
         """
-        try:
-            import fal_client
-            print("🔄 Используем BiRefNet fallback...")
-            
-            # Convert image to base64
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode()
-            
-            # Progress callback for debugging
-            def on_queue_update(update):
-                if isinstance(update, fal_client.InProgress):
-                    print(f"🔄 Processing BiRefNet: {len(update.logs)} logs")
-                    for log in update.logs[-1:]:  # Show last log only
-                        print(f"  {log.get('message', '')}")
-            
-            # Use BiRefNet for background removal
-            result = fal_client.subscribe(
-                "fal-ai/birefnet",
-                arguments={
-                    "image_url": f"data:image/png;base64,{img_base64}"
-                },
-                with_logs=True,
-                on_queue_update=on_queue_update,
-            )
-            
-            if result and 'image' in result:
-                img_response = requests.get(result['image']['url'])
-                result_image = Image.open(io.BytesIO(img_response.content))
-                print("✅ Успешно обработано с BiRefNet")
-                return result_image
-            else:
-                print("❌ BiRefNet также не смог обработать изображение")
-                return None
-                
-        except ImportError:
-            print("❌ fal_client не установлен для BiRefNet fallback")
-            return None
-        except Exception as e:
-            print(f"❌ Ошибка в BiRefNet fallback: {e}")
-            return None
\ No newline at end of file
+        return stream_running_batch(
+            lambda: self.checkpoints.get_files(batch_id), is_running,
+            lambda: (self.get_batch_by_id(batch_id) or {}).get('zip_path'), poll_interval)
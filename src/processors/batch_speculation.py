@@ -0,0 +1,169 @@
+"""
+Batch Speculation Module
+Background removal started with a guessed LoRA prompt while GPT analysis runs
+"""
+
+import traceback
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Callable
+from PIL import Image
+
+from .analysis_index import AnalysisIndex
+from .background_removal import apply_background
+from .checkpoint import checkpoint_reached, ANALYZED
+from .local_analyzer import LocalHeuristicAnalyzer
+from .pipeline import PipelineStage
+from ..utils.speculation import Speculator, start_call
+
+
+class SpeculativeBackground:
+    """
+    Start background removal before the final prompt is known
+
+    The guess comes from the analysis of a near-duplicate image if one is
+    indexed, otherwise from the local heuristic analysis. Once GPT answers,
+    the speculative result is kept if the real prompt would not materially
+    differ and re-issued otherwise.
+    """
+
+    def __init__(self, gpt_analyzer: Any, local_analyzer: LocalHeuristicAnalyzer, analysis_index: AnalysisIndex,
+                 remove_background: Callable[[Image.Image, str, Optional[str]], Optional[Image.Image]],
+                 enabled: bool = True):
+        """
+        Initialize speculative background removal
+
+        Args:
+            gpt_analyzer: Analysis provider (create_lora_prompt)
+            local_analyzer: Local heuristic analyzer for the guess
+            analysis_index: Index of GPT analyses by perceptual hash
+            remove_background: Removes background of (image, prompt, model_id)
+            enabled: Whether guesses are started at all (SPECULATIVE_BACKGROUND)
+        """
+        self.gpt_analyzer = gpt_analyzer
+        self.local_analyzer = local_analyzer
+        self.analysis_index = analysis_index
+        self.remove_background = remove_background
+        self.enabled = enabled
+        self.speculator = Speculator('background')
+
+    def start_background(self, image: Image.Image, prompt: str, model_id: Optional[str] = None,
+                         speculative: bool = False) -> Future:
+        """
+        Start background removal without waiting for it
+
+        Args:
+            image: Input image
+            prompt: LoRA prompt
+            model_id: Model ID (if None, uses selection policy)
+            speculative: Whether the prompt is a guess (runs in the speculation pool, counted in its metrics)
+
+        Returns:
+            Future of the image with removed background (None if failed)
+        """
+        call = lambda: self.remove_background(image, prompt, model_id)
+        if speculative:
+            return self.speculator.start(call)
+        # Final prompt: not queued behind speculative calls in the speculation pool
+        return start_call(call, name="background-removal")
+
+    def start(self, image: Image.Image, filename: str = '',
+              model_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Start background removal with a prompt guessed before GPT answers
+
+        Args:
+            image: Input image
+            filename: Original filename (local analysis hints)
+            model_id: Model ID (if None, uses selection policy)
+
+        Returns:
+            Speculation dict (guessed analysis, prompt, future), or None if speculation is off
+        """
+        if not self.enabled:
+            return None
+
+        # Peek: the guess must not count as an index hit or miss
+        reused = self.analysis_index.peek(self.analysis_index.image_hash(image))
+        analysis = reused or self.local_analyzer.analyze(image, filename)['analysis']
+        prompt = self.gpt_analyzer.create_lora_prompt(analysis)
+        return {'analysis': analysis, 'prompt': prompt,
+                'future': self.start_background(image, prompt, model_id, speculative=True)}
+
+    def result(self, speculation: Dict[str, Any], analysis: Dict[str, Any],
+               prompt: str) -> Optional[Image.Image]:
+        """
+        Use speculative background removal if the real prompt would not materially differ
+
+        Args:
+            speculation: Dict from start
+            analysis: Final analysis
+            prompt: Final LoRA prompt
+
+        Returns:
+            Image with removed background, or None if the call must be re-issued
+        """
+        guess_ok = self.prompt_equivalent(speculation['analysis'], speculation['prompt'], analysis, prompt)
+        if not guess_ok:
+            print("🔁 Промпт после анализа отличается от предположения, удаление фона запускается заново")
+        return self.speculator.resolve(speculation['future'], guess_ok)
+
+    def run_stages(self, job: Dict[str, Any], stages: List[PipelineStage], speculate: bool = True):
+        """
+        Run stage handlers of one job sequentially in the calling thread
+
+        LoRA starts with a guessed prompt when the analyze stage begins; the
+        remove_background stage uses its result if the guess holds.
+
+        Args:
+            job: New or resumed job
+            stages: Pipeline stages in order
+            speculate: Whether to start the guessed LoRA call (off in queue mode)
+        """
+        speculation = None
+
+        for stage in stages:
+            if job['status'] == 'error' and not stage.run_on_error:
+                continue
+            try:
+                if (stage.name == 'analyze' and speculate
+                        and not checkpoint_reached(job['checkpoint'], ANALYZED)):
+                    # LoRA starts with a guessed prompt while GPT analyzes
+                    speculation = self.start(job['image'], job['filename'])
+                elif stage.name == 'remove_background' and speculation is not None:
+                    no_bg_image = self.result(speculation, job.get('analysis', {}), job.get('lora_prompt', ''))
+                    speculation = None
+                    if no_bg_image is not None:
+                        apply_background(job, no_bg_image)
+                        continue
+                stage.handler(job)
+            except Exception as e:
+                job['status'] = 'error'
+                job['error'] = str(e)
+                job['failed_stage'] = stage.name
+                job['traceback'] = traceback.format_exc()
+                if speculation is not None:
+                    # The job is dropped: do not pay for its speculative LoRA call
+                    self.discard(speculation)
+                    speculation = None
+
+    def discard(self, speculation: Dict[str, Any]):
+        """Drop a speculation whose result will not be used (cancels its remote requests)"""
+        self.speculator.discard(speculation['future'])
+
+    def stats(self) -> Dict[str, Any]:
+        """Get speculation counters"""
+        return self.speculator.stats()
+
+    @staticmethod
+    def prompt_equivalent(guess_analysis: Dict[str, Any], guess_prompt: str,
+                          analysis: Dict[str, Any], prompt: str) -> bool:
+        """
+        Check whether LoRA would get an equivalent prompt
+
+        Same category with no special instructions counts as equivalent:
+        the object description only fine-tunes the segmentation.
+        """
+        if guess_prompt == prompt:
+            return True
+        special = analysis.get('lora_optimization', {}).get('special_instructions', 'none')
+        return guess_analysis.get('category') == analysis.get('category') and special in ('', 'none')
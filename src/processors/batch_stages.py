@@ -0,0 +1,281 @@
+"""
+Batch Stages Module
+Stage handlers of the batch pipeline: decode, analyze, remove background, position, encode, record
+"""
+
+import io
+import json
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from PIL import Image
+
+from .pipeline import PipelineStage
+from .background_removal import apply_background
+from .inference_backends import FAL_PROVIDER
+from .checkpoint import checkpoint_reached, ANALYZED, BG_REMOVED, POSITIONED, DONE
+from ..utils.upload_manager import content_hash
+
+
+class BatchStages:
+    """
+    Stage handlers of a batch processor
+
+    Every handler takes one job dict, skips the work its checkpoint
+    already covers and stores its output in the job. Components and
+    settings are read from the processor at call time, so they can be
+    swapped after it is created.
+    """
+
+    def __init__(self, processor: Any):
+        """
+        Initialize stage handlers
+
+        Args:
+            processor: BatchProcessor whose components the stages use
+        """
+        self.processor = processor
+
+    def build(self, workers: Dict[str, int]) -> List[PipelineStage]:
+        """
+        Build pipeline stages for batch processing
+
+        Args:
+            workers: Worker count per stage name
+
+        Returns:
+            Ordered list of pipeline stages
+        """
+        if self.processor.fal_queue_mode:
+            background_stages = [
+                PipelineStage('remove_background', self.submit_background, workers['remove_background']),
+                PipelineStage('fetch_background', self.fetch_background, workers['fetch_background'])
+            ]
+        else:
+            background_stages = [
+                PipelineStage('remove_background', self.remove_background, workers['remove_background'])
+            ]
+
+        return [
+            PipelineStage('decode', self.decode, workers['decode']),
+            PipelineStage('analyze', self.analyze, workers['analyze']),
+            *background_stages,
+            PipelineStage('position', self.position, workers['position']),
+            PipelineStage('encode', self.encode, workers['encode']),
+            PipelineStage('record', self.record, workers['record'], run_on_error=True)
+        ]
+
+    def checkpoint(self, job: Dict[str, Any], stage: str, **fields: Any):
+        """Persist finished checkpoint of a job"""
+        job['checkpoint'] = stage
+        self.processor.checkpoints.mark(job['batch_id'], job['index'], stage, **fields)
+
+    def decode(self, job: Dict[str, Any]):
+        """Stage 1: decode saved original (or stored no-background result on resume)"""
+        if checkpoint_reached(job['checkpoint'], POSITIONED):
+            return
+
+        if checkpoint_reached(job['checkpoint'], BG_REMOVED):
+            job['no_bg_image'] = Image.open(job['no_bg_path'])
+            return
+
+        image = Image.open(job['original_path'])
+
+        # Convert to RGBA for processing only
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+
+        job['image'] = image
+        job['content_hash'] = content_hash(image)
+
+        thumbnails = self.processor.gpt_analyzer.thumbnails
+        if not checkpoint_reached(job['checkpoint'], ANALYZED) and thumbnails.enabled:
+            # Analysis thumbnail straight from the file (JPEG draft decoding)
+            try:
+                thumbnails.prime(job['content_hash'], job['original_path'])
+            except Exception as e:
+                print(f"⚠️ {job['filename']}: миниатюра для анализа будет создана из изображения: {e}")
+
+    def analyze(self, job: Dict[str, Any]):
+        """Stage 2: GPT analysis and LoRA prompt"""
+        if checkpoint_reached(job['checkpoint'], ANALYZED):
+            return
+
+        self.processor.analysis.analyze(job)
+        self.checkpoint(job, ANALYZED, analysis=json.dumps(job['analysis']), prompt=job['lora_prompt'])
+
+    def remove_background(self, job: Dict[str, Any]):
+        """Stage 3: remove background with LoRA"""
+        if checkpoint_reached(job['checkpoint'], BG_REMOVED):
+            return
+
+        apply_background(job, self.processor._remove_background_fal(job['image'], job['lora_prompt']))
+
+    def submit_background(self, job: Dict[str, Any]) -> Optional[Future]:
+        """Stage 3 in queue mode: put background removal on the fal queue"""
+        if checkpoint_reached(job['checkpoint'], BG_REMOVED):
+            return None
+
+        processor = self.processor
+        if not processor.fal_api_key or not processor.background.segmentation.get(FAL_PROVIDER).supports_fal_queue:
+            self.remove_background(job)
+            return None
+
+        return processor.fal_queue.submit(job)
+
+    def fetch_background(self, job: Dict[str, Any]):
+        """Stage 3b in queue mode: download finished fal result"""
+        if checkpoint_reached(job['checkpoint'], BG_REMOVED) or job.get('no_bg_image') is not None:
+            return
+
+        self.processor.fal_queue.fetch(job)
+
+    def position(self, job: Dict[str, Any]):
+        """Stage 4: smart positioning on canvas"""
+        if checkpoint_reached(job['checkpoint'], POSITIONED):
+            return
+
+        if self.processor.cpu_offload:
+            self._position_offload(job)
+            return
+
+        final_image = self.processor.positioner.process_image(job['no_bg_image'], job['analysis'])
+        final_path = job['batch_dir'] / "final" / job['stored_name']
+
+        # Convert RGBA to RGB for JPEG, or save as PNG
+        if final_path.suffix.lower() in ['.jpg', '.jpeg']:
+            if final_image.mode == 'RGBA':
+                rgb_image = Image.new('RGB', final_image.size, (255, 255, 255))
+                rgb_image.paste(final_image, mask=final_image.split()[-1])
+                final_image = rgb_image
+        else:
+            # Save as PNG to preserve transparency
+            final_path = final_path.with_suffix('.png')
+
+        job['final_image'] = final_image
+        job['final_path'] = final_path
+
+    def _position_offload(self, job: Dict[str, Any]):
+        """Stage 4 in process mode: position and encode both outputs in a worker process"""
+        final_path = job['batch_dir'] / "final" / job['stored_name']
+        jpeg = final_path.suffix.lower() in ['.jpg', '.jpeg']
+        if not jpeg:
+            final_path = final_path.with_suffix('.png')
+
+        # no_background keeps the stored name, only PNG names can take the PNG bytes
+        encode_no_bg = (not checkpoint_reached(job['checkpoint'], BG_REMOVED)
+                        and Path(job['stored_name']).suffix.lower() == '.png')
+
+        job['no_bg_bytes'], job['final_bytes'] = self.processor.cpu_offload.position_and_encode(
+            job['no_bg_image'], job['analysis'], jpeg=jpeg, encode_no_bg=encode_no_bg,
+            debug=self.processor.positioner.debug_mode)
+        job['final_path'] = final_path
+
+    def encode(self, job: Dict[str, Any]):
+        """Stage 5: encode and save no-background and final images"""
+        if not checkpoint_reached(job['checkpoint'], BG_REMOVED):
+            no_bg_path = job['batch_dir'] / "no_background" / job['stored_name']
+            if job.get('no_bg_bytes'):
+                with open(no_bg_path, 'wb') as f:
+                    f.write(job.pop('no_bg_bytes'))
+            else:
+                job['no_bg_image'].save(no_bg_path)
+            job['no_bg_path'] = no_bg_path
+            self.checkpoint(job, BG_REMOVED, no_bg_path=str(no_bg_path))
+
+        if not checkpoint_reached(job['checkpoint'], POSITIONED):
+            final_path = job['final_path']
+            if job.get('final_bytes') is None:
+                buffer = io.BytesIO()
+                if final_path.suffix.lower() in ['.jpg', '.jpeg']:
+                    job['final_image'].save(buffer, 'JPEG')
+                else:
+                    job['final_image'].save(buffer, 'PNG')
+
+                # Keep encoded bytes so the archive does not read the file back
+                job['final_bytes'] = buffer.getvalue()
+            with open(final_path, 'wb') as f:
+                f.write(job['final_bytes'])
+            self.checkpoint(job, POSITIONED, final_path=str(final_path))
+
+        job['no_bg_image'] = None
+        job['final_image'] = None
+
+    def record(self, job: Dict[str, Any]):
+        """Stage 6: write history record and build result dict"""
+        filename = job['filename']
+        processing_time = time.time() - job['start_time']
+
+        if job['status'] == 'error':
+            self._record_error(job, processing_time)
+            return
+
+        analysis = job['analysis']
+
+        # Save to database
+        self.processor.history.save_record({
+            'batch_id': job['batch_id'],
+            'filename': filename,
+            'category': analysis.get('category', 'unknown'),
+            'product_type': analysis.get('product_identification', {}).get('type', 'unknown'),
+            'orientation': analysis.get('geometry', {}).get('orientation', 'standard'),
+            'aspect_ratio': analysis.get('geometry', {}).get('aspect_ratio', 1.0),
+            'gpt_analysis': json.dumps(analysis),
+            'gpt_prompt': job['lora_prompt'],
+            'original_path': str(job['original_path']),
+            'no_bg_path': str(job['no_bg_path']),
+            'final_path': str(job['final_path']),
+            'processing_time': processing_time,
+            'status': 'success',
+            'image_hash': job.get('image_hash')
+        })
+        self.checkpoint(job, DONE)
+
+        job['status'] = 'success'
+        job['result'] = {
+            'filename': filename,
+            'status': 'success',
+            'processing_time': processing_time,
+            'analysis': analysis,
+            'paths': {
+                'original': str(job['original_path']),
+                'no_bg': str(job['no_bg_path']),
+                'final': str(job['final_path'])
+            }
+        }
+
+    def _record_error(self, job: Dict[str, Any], processing_time: float):
+        """Write history record and result dict of a failed job"""
+        filename = job['filename']
+
+        # Print detailed error for debugging
+        error_msg = f"Error processing {filename}: {job.get('error')}"
+        print(f"ERROR: {error_msg}", flush=True)
+        print(f"TRACEBACK: {job.get('traceback', '')}", flush=True)
+
+        # Also write to file for debugging
+        try:
+            with open('/app/debug.log', 'a') as f:
+                f.write(f"ERROR: {error_msg}\n")
+                f.write(f"TRACEBACK: {job.get('traceback', '')}\n")
+                f.write("="*50 + "\n")
+        except:
+            pass
+
+        # Save error to database
+        self.processor.history.save_record({
+            'batch_id': job['batch_id'],
+            'filename': filename,
+            'status': 'error',
+            'error_message': job.get('error'),
+            'processing_time': processing_time
+        })
+        self.processor.checkpoints.mark_error(job['batch_id'], job['index'], job.get('error'))
+
+        job['result'] = {
+            'filename': filename,
+            'status': 'error',
+            'error': job.get('error'),
+            'processing_time': processing_time
+        }
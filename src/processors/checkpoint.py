@@ -0,0 +1,159 @@
+"""
+Batch Checkpoint Module
+Durable per-file pipeline state so interrupted batches can be resumed
+"""
+
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+
+# Pipeline checkpoints in order of completion
+QUEUED = 'queued'
+ANALYZED = 'analyzed'
+BG_REMOVED = 'bg_removed'
+POSITIONED = 'positioned'
+DONE = 'done'
+
+CHECKPOINTS = [QUEUED, ANALYZED, BG_REMOVED, POSITIONED, DONE]
+
+
+def checkpoint_reached(current: Optional[str], checkpoint: str) -> bool:
+    """
+    Check whether a file has already passed given checkpoint
+
+    Args:
+        current: Last finished checkpoint of the file (None if unknown)
+        checkpoint: Checkpoint to test
+
+    Returns:
+        True if current is at or after checkpoint
+    """
+    if current not in CHECKPOINTS:
+        return False
+    return CHECKPOINTS.index(current) >= CHECKPOINTS.index(checkpoint)
+
+
+class BatchCheckpointStore:
+    """
+    SQLite store of per-file pipeline checkpoints
+
+    Rows are keyed by the file's index in the batch, so uploads that share
+    a filename keep separate checkpoints.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Initialize checkpoint store
+
+        Args:
+            db_path: Path to SQLite database (shared with processing history)
+        """
+        self.db_path = db_path
+        self._init_table()
+
+    def _init_table(self):
+        """Create batch_files table if missing (rebuilding a filename-keyed one)"""
+        conn = sqlite3.connect(self.db_path)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(batch_files)")]
+        if columns and 'file_index' not in columns:
+            conn.execute("ALTER TABLE batch_files RENAME TO batch_files_by_name")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS batch_files (
+                batch_id TEXT NOT NULL,
+                file_index INTEGER NOT NULL,  -- position of the upload in the batch
+                filename TEXT NOT NULL,
+                stage TEXT NOT NULL DEFAULT 'queued',  -- queued|analyzed|bg_removed|positioned|done
+                analysis TEXT,  -- GPT analysis JSON
+                prompt TEXT,
+                original_path TEXT,
+                no_bg_path TEXT,
+                final_path TEXT,
+                error_message TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (batch_id, file_index)
+            )
+        ''')
+        if columns and 'file_index' not in columns:
+            # Index = order of registration within the batch
+            conn.execute('''
+                INSERT INTO batch_files (batch_id, file_index, filename, stage, analysis, prompt,
+                                         original_path, no_bg_path, final_path, error_message, updated_at)
+                SELECT batch_id,
+                       (SELECT COUNT(*) FROM batch_files_by_name AS earlier
+                        WHERE earlier.batch_id = old.batch_id AND earlier.rowid < old.rowid),
+                       filename, stage, analysis, prompt, original_path, no_bg_path, final_path,
+                       error_message, updated_at
+                FROM batch_files_by_name AS old
+            ''')
+            conn.execute("DROP TABLE batch_files_by_name")
+        conn.commit()
+        conn.close()
+
+    def register_files(self, batch_id: str, files: List[Dict[str, str]]):
+        """
+        Register batch files as queued in one transaction
+
+        Args:
+            batch_id: Batch identifier
+            files: Dicts with 'index', 'filename' and 'original_path'
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany('''
+            INSERT OR REPLACE INTO batch_files (batch_id, file_index, filename, stage, original_path)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(batch_id, f['index'], f['filename'], QUEUED, f['original_path']) for f in files])
+        conn.commit()
+        conn.close()
+
+    def mark(self, batch_id: str, file_index: int, stage: str, **fields: Any):
+        """
+        Record that a file finished a checkpoint
+
+        Args:
+            batch_id: Batch identifier
+            file_index: Position of the file in the batch
+            stage: Finished checkpoint
+            **fields: Column values to store (analysis, prompt, no_bg_path, final_path, error_message)
+        """
+        columns = ['stage = ?', 'updated_at = CURRENT_TIMESTAMP']
+        values = [stage]
+        for column, value in fields.items():
+            columns.append(f"{column} = ?")
+            values.append(value)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            f"UPDATE batch_files SET {', '.join(columns)} WHERE batch_id = ? AND file_index = ?",
+            values + [batch_id, file_index]
+        )
+        conn.commit()
+        conn.close()
+
+    def mark_error(self, batch_id: str, file_index: int, error_message: str):
+        """Store error without moving the checkpoint"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            UPDATE batch_files SET error_message = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE batch_id = ? AND file_index = ?
+        ''', (error_message, batch_id, file_index))
+        conn.commit()
+        conn.close()
+
+    def get_files(self, batch_id: str) -> List[Dict[str, Any]]:
+        """
+        Get checkpoint rows of a batch
+
+        Args:
+            batch_id: Batch identifier
+
+        Returns:
+            List of row dicts
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            "SELECT * FROM batch_files WHERE batch_id = ? ORDER BY file_index",
+            (batch_id,)
+        ).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
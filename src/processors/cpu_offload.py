@@ -0,0 +1,128 @@
+"""
+CPU Offload Module
+Runs positioning and image encoding in worker processes to avoid the GIL
+"""
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Any, Optional, Tuple
+
+from PIL import Image
+
+from .smart_positioning import SmartPositioning
+
+
+# Positioner of a worker process, created on first task
+_worker_positioner = None
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    """Encode image to bytes"""
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def position_and_encode(image: Image.Image,
+                        analysis: Dict[str, Any],
+                        positioner: SmartPositioning,
+                        jpeg: bool = False,
+                        encode_no_bg: bool = True) -> Tuple[Optional[bytes], bytes]:
+    """
+    Position product on canvas and encode no-background and final images
+
+    Args:
+        image: RGBA image with removed background
+        analysis: GPT analysis with positioning data
+        positioner: SmartPositioning instance
+        jpeg: Encode final image as JPEG (flattened on white) instead of PNG
+        encode_no_bg: Also encode the no-background image as PNG
+
+    Returns:
+        Tuple of (no-background PNG bytes or None, final image bytes)
+    """
+    no_bg_bytes = _encode(image, 'PNG') if encode_no_bg else None
+    final_image = positioner.process_image(image, analysis)
+
+    if jpeg:
+        if final_image.mode == 'RGBA':
+            rgb_image = Image.new('RGB', final_image.size, (255, 255, 255))
+            rgb_image.paste(final_image, mask=final_image.split()[-1])
+            final_image = rgb_image
+        return no_bg_bytes, _encode(final_image, 'JPEG')
+
+    return no_bg_bytes, _encode(final_image, 'PNG')
+
+
+def _worker_task(shm_name: str, mode: str, size: Tuple[int, int], analysis: Dict[str, Any],
+                 jpeg: bool, encode_no_bg: bool, debug: bool) -> Tuple[Optional[bytes], bytes]:
+    """Rebuild image from shared memory and run position_and_encode in a worker"""
+    global _worker_positioner
+    if _worker_positioner is None:
+        _worker_positioner = SmartPositioning()
+    _worker_positioner.set_debug_mode(debug)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Copy out of the block so it can be released before the heavy work
+        image = Image.frombytes(mode, size, bytes(shm.buf[:len(mode) * size[0] * size[1]]))
+    finally:
+        shm.close()
+
+    return position_and_encode(image, analysis, _worker_positioner, jpeg, encode_no_bg)
+
+
+class ProcessOffload:
+    """
+    Process pool for positioning and encoding
+
+    Pixels are handed to workers through a shared memory block instead of
+    pickling PIL images; workers return the encoded PNG/JPEG bytes, which
+    are much smaller than the raw canvas.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Initialize process pool
+
+        Args:
+            workers: Number of worker processes (default core count)
+        """
+        self.workers = workers or os.cpu_count() or 2
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def position_and_encode(self, image: Image.Image, analysis: Dict[str, Any],
+                            jpeg: bool = False, encode_no_bg: bool = True,
+                            debug: bool = False) -> Tuple[Optional[bytes], bytes]:
+        """
+        Position and encode image in a worker process
+
+        Args:
+            image: Image with removed background
+            analysis: GPT analysis with positioning data
+            jpeg: Encode final image as JPEG instead of PNG
+            encode_no_bg: Also encode the no-background image as PNG
+            debug: Draw positioning debug grid
+
+        Returns:
+            Tuple of (no-background PNG bytes or None, final image bytes)
+        """
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+
+        pixels = image.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=len(pixels))
+        try:
+            shm.buf[:len(pixels)] = pixels
+            future = self.executor.submit(
+                _worker_task, shm.name, image.mode, image.size, analysis, jpeg, encode_no_bg, debug)
+            return future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        """Stop worker processes"""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,282 @@
+"""
+Fal Queue Module
+Submit inference jobs to the fal.ai queue and collect them with one poller thread
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
+
+
+# fal_jobs statuses
+SUBMITTED = 'submitted'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+# Consecutive status check errors before a request is given up
+MAX_POLL_ERRORS = 5
+
+
+class FalJobStore:
+    """SQLite store of submitted fal.ai requests, so a restart can reattach to them"""
+
+    def __init__(self, db_path: str):
+        """
+        Initialize job store
+
+        Args:
+            db_path: Path to SQLite database (shared with processing history)
+        """
+        self.db_path = db_path
+        self._init_table()
+
+    def _init_table(self):
+        """Create fal_jobs table if missing"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS fal_jobs (
+                request_id TEXT PRIMARY KEY,
+                application TEXT NOT NULL,
+                batch_id TEXT,
+                file_index INTEGER,  -- position of the file in the batch
+                filename TEXT,
+                cache_key TEXT,  -- ResultCache key of the expected result
+                status TEXT NOT NULL DEFAULT 'submitted',  -- submitted|completed|failed
+                error_message TEXT,
+                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(fal_jobs)")]
+        if 'file_index' not in columns:
+            conn.execute("ALTER TABLE fal_jobs ADD COLUMN file_index INTEGER")
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_fal_jobs_file_index ON fal_jobs (batch_id, file_index)')
+        conn.commit()
+        conn.close()
+
+    def add(self, request_id: str, application: str, batch_id: Optional[str], file_index: Optional[int],
+            filename: Optional[str], cache_key: Optional[str] = None):
+        """Record submitted request"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            INSERT OR REPLACE INTO fal_jobs (request_id, application, batch_id, file_index, filename, cache_key)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (request_id, application, batch_id, file_index, filename, cache_key))
+        conn.commit()
+        conn.close()
+
+    def finish(self, request_id: str, status: str, error_message: Optional[str] = None):
+        """Mark request completed or failed"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            UPDATE fal_jobs SET status = ?, error_message = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE request_id = ?
+        ''', (status, error_message, request_id))
+        conn.commit()
+        conn.close()
+
+    def find(self, batch_id: str, file_index: int) -> Optional[Dict[str, Any]]:
+        """
+        Get latest request of a batch file that did not fail
+
+        Args:
+            batch_id: Batch identifier
+            file_index: Position of the file in the batch
+
+        Returns:
+            Job row dict or None
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        row = conn.execute('''
+            SELECT * FROM fal_jobs
+            WHERE batch_id = ? AND file_index = ? AND status != ?
+            ORDER BY submitted_at DESC LIMIT 1
+        ''', (batch_id, file_index, FAILED)).fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_pending(self, batch_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get requests still waiting for a result (optionally of one batch)"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        if batch_id:
+            rows = conn.execute('SELECT * FROM fal_jobs WHERE status = ? AND batch_id = ?',
+                                (SUBMITTED, batch_id)).fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM fal_jobs WHERE status = ?', (SUBMITTED,)).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+
+class FalJobQueue:
+    """
+    Non-blocking fal.ai requests
+
+    `submit` puts a request on the fal queue and returns a Future right
+    away; a single poller thread checks the status of every pending request
+    and resolves its Future with the result (or the error). Provider-side
+    parallelism is therefore not tied to the number of worker threads, and
+    request IDs are stored so `attach` can pick them up after a restart.
+    """
+
+    def __init__(self, store: FalJobStore, poll_interval: float = 2.0, client: Any = None,
+                 job_timeout: Optional[float] = None):
+        """
+        Initialize job queue
+
+        Args:
+            store: Durable store of request IDs
+            poll_interval: Seconds between status sweeps
+            client: fal_client module or compatible object (imported lazily if None)
+            job_timeout: Seconds a request may stay unfinished before it is cancelled
+                (default FAL_JOB_TIMEOUT or 300)
+        """
+        self.store = store
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout or float(os.environ.get('FAL_JOB_TIMEOUT', 300))
+        self._client = client
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+        self._stats = {'submitted': 0, 'reattached': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'polls': 0}
+
+    @property
+    def client(self) -> Any:
+        """fal_client module"""
+        if self._client is None:
+            import fal_client
+            self._client = fal_client
+        return self._client
+
+    def submit(self, application: str, arguments: Dict[str, Any],
+               batch_id: Optional[str] = None, file_index: Optional[int] = None,
+               filename: Optional[str] = None, cache_key: Optional[str] = None) -> Future:
+        """
+        Submit request to fal queue without waiting for it
+
+        Args:
+            application: fal application, e.g. 'fal-ai/birefnet'
+            arguments: Request arguments
+            batch_id: Batch of the file (stored for reattach)
+            file_index: Position of the file in the batch (stored for reattach)
+            filename: File name within batch (for logs)
+            cache_key: ResultCache key of the expected result
+
+        Returns:
+            Future resolving to the fal result dict
+        """
+        handle = self.client.submit(application, arguments=arguments)
+        self.store.add(handle.request_id, application, batch_id, file_index, filename, cache_key)
+        self._count('submitted')
+        return self._watch(application, handle.request_id)
+
+    def attach(self, application: str, request_id: str) -> Future:
+        """
+        Wait for a request submitted earlier (e.g. before a restart)
+
+        Args:
+            application: fal application of the request
+            request_id: fal request ID
+
+        Returns:
+            Future resolving to the fal result dict
+        """
+        self._count('reattached')
+        return self._watch(application, request_id)
+
+    def pending_count(self) -> int:
+        """Number of requests waiting for a result"""
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue counters"""
+        with self._lock:
+            return {**self._stats, 'pending': len(self._pending)}
+
+    def _watch(self, application: str, request_id: str) -> Future:
+        """Register request with the poller"""
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = {'application': application, 'future': future, 'poll_errors': 0,
+                                         'deadline': time.time() + self.job_timeout}
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, name="fal-queue-poller", daemon=True)
+                self._poller.start()
+        return future
+
+    def _poll_loop(self):
+        """Poll pending requests until none are left"""
+        while True:
+            with self._lock:
+                pending = list(self._pending.items())
+                if not pending:
+                    self._poller = None
+                    return
+
+            for request_id, entry in pending:
+                self._poll(request_id, entry)
+
+            time.sleep(self.poll_interval)
+
+    def _poll(self, request_id: str, entry: Dict[str, Any]):
+        """Check one request, resolving its future once it finished"""
+        if time.time() > entry['deadline']:
+            self._expire(request_id, entry)
+            return
+
+        self._count('polls')
+        try:
+            status = self.client.status(entry['application'], request_id)
+        except Exception as e:
+            # Status check errors are usually transient, the request itself keeps running
+            entry['poll_errors'] += 1
+            if entry['poll_errors'] < MAX_POLL_ERRORS:
+                return
+            self._resolve(request_id, FAILED, str(e))
+            entry['future'].set_exception(e)
+            return
+
+        entry['poll_errors'] = 0
+        if not isinstance(status, self.client.Completed):
+            return
+
+        try:
+            if getattr(status, 'error', None):
+                raise RuntimeError(status.error)
+            result = self.client.result(entry['application'], request_id)
+        except Exception as e:
+            self._resolve(request_id, FAILED, str(e))
+            entry['future'].set_exception(e)
+            return
+
+        self._resolve(request_id, COMPLETED)
+        entry['future'].set_result(result)
+
+    def _expire(self, request_id: str, entry: Dict[str, Any]):
+        """Cancel request stuck in the fal queue, failing its future so the file can fall back"""
+        try:
+            self.client.cancel(entry['application'], request_id)
+        except Exception as e:
+            print(f"⚠️ Не удалось отменить запрос fal {request_id}: {e}")
+        error = TimeoutError(f"fal request {request_id} not finished in {self.job_timeout:.0f}s")
+        print(f"⏱️ {error}")
+        self._count('timed_out')
+        self._resolve(request_id, FAILED, str(error))
+        entry['future'].set_exception(error)
+
+    def _resolve(self, request_id: str, status: str, error_message: Optional[str] = None):
+        """Drop request from pending and persist its outcome"""
+        with self._lock:
+            self._pending.pop(request_id, None)
+            self._stats[status] += 1
+        self.store.finish(request_id, status, error_message)
+
+    def _count(self, key: str):
+        """Increment counter"""
+        with self._lock:
+            self._stats[key] += 1
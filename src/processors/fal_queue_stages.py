@@ -0,0 +1,173 @@
+"""
+Fal Queue Stages Module
+Background removal stages of queue mode: submit every job to the fal queue, fetch results
+"""
+
+from concurrent.futures import Future
+from typing import Dict, Any, Optional
+from PIL import Image
+
+from .background_removal import BackgroundRemover, apply_background
+from .fal_queue import FalJobQueue
+from .inference_backends import FAL_PROVIDER
+from ..utils.concurrency import AdaptiveConcurrencyLimiter
+from ..utils.rate_limit import retry_rate_limited
+from ..utils.inference_resize import parse_resolution
+
+
+class FalQueueStages:
+    """
+    Submit and fetch stages of queue mode
+
+    The submit stage returns a future instead of waiting, so its worker
+    is free for the next file; one poller collects all requests and the
+    fetch stage downloads finished results.
+    """
+
+    def __init__(self, jobs: FalJobQueue, background: BackgroundRemover, limiter: AdaptiveConcurrencyLimiter):
+        """
+        Initialize queue stages
+
+        Args:
+            jobs: Queue of submitted fal requests
+            background: Background remover (model selection, cache, BiRefNet fallback)
+            limiter: Concurrency limiter for fal calls
+        """
+        self.jobs = jobs
+        self.background = background
+        self.limiter = limiter
+
+    def submit(self, job: Dict[str, Any]) -> Optional[Future]:
+        """
+        Put background removal of a job on the fal queue
+
+        A request stored before a restart is reattached instead of being
+        submitted again; a cached result is applied to the job right away.
+
+        Args:
+            job: Job with decoded image and LoRA prompt
+
+        Returns:
+            Future that resolves (never fails) once the fal outcome is stored in job,
+            None if the cached result was applied
+        """
+        stored = self.jobs.store.find(job['batch_id'], job['index'])
+        if stored:
+            print(f"🔗 {job['filename']}: ждём ранее отправленный запрос {stored['request_id']}")
+            job['fal_request'] = {'application': stored['application'], 'cache_key': stored['cache_key'],
+                                  'model_id': None}
+            return self._track(job, self.jobs.attach(stored['application'], stored['request_id']))
+
+        request = self.prepare_request(job['image'], job['lora_prompt'])
+        if 'cached_image' in request:
+            apply_background(job, request['cached_image'])
+            return None
+
+        def call() -> Future:
+            with self.limiter.slot(endpoint=request['application']):
+                return self.jobs.submit(request['application'], request['arguments'], job['batch_id'],
+                                        job['index'], job['filename'], request['cache_key'])
+
+        def submit() -> Future:
+            # Rejected with 429: wait for Retry-After and send again, like the synchronous path
+            return retry_rate_limited(call)
+
+        shared = False
+        try:
+            if request['cache_key']:
+                # A file with the same pixels and settings may already be queued: wait for its request
+                future, shared = self.background.inflight.attach(request['cache_key'], submit)
+                if shared:
+                    print(f"🔗 {job['filename']}: ждём запрос одинакового изображения")
+            else:
+                future = submit()
+        except Exception as e:
+            # Not queued: the fetch stage falls back to BiRefNet
+            print(f"❌ {job['filename']}: запрос не поставлен в очередь fal: {e}")
+            future = Future()
+            future.set_exception(e)
+        job['fal_request'] = {key: request[key] for key in ('application', 'cache_key', 'model_id')}
+        if shared:
+            # The outcome is recorded for the model once, by the job that submitted it
+            if request['model_id']:
+                self.background.selection_policy.release_probe(request['model_id'])
+            job['fal_request']['model_id'] = None
+        return self._track(job, future)
+
+    def _track(self, job: Dict[str, Any], future: Future) -> Future:
+        """Keep fal outcome in job; the returned future never fails so the fetch stage can fall back"""
+        settled = Future()
+
+        def settle(done: Future):
+            error = done.exception()
+            if error is None:
+                job['fal_result'] = done.result()
+            else:
+                job['fal_error'] = str(error)
+            settled.set_result(None)
+
+        future.add_done_callback(settle)
+        return settled
+
+    def fetch(self, job: Dict[str, Any]):
+        """
+        Download finished fal result of a job (BiRefNet if the request failed)
+
+        Args:
+            job: Job whose submit future has resolved
+        """
+        request = job.pop('fal_request', None)
+        if request is None:
+            raise Exception("Failed to remove background")
+
+        result = job.pop('fal_result', None)
+        backend = self.background.segmentation.get(FAL_PROVIDER)
+        has_image = backend.result_url(result) is not None
+        if request['model_id']:
+            self.background.selection_policy.record_result(request['model_id'], has_image)
+        if has_image:
+            result_image = backend.result_image(job['image'], result)
+            if request['cache_key']:
+                self.background.result_cache.put(request['cache_key'], result_image)
+        elif request['application'] != 'fal-ai/birefnet':
+            print(f"🔄 {job['filename']}: запрос fal не удался ({job.pop('fal_error', 'нет изображения')}), "
+                  f"пробуем BiRefNet")
+            result_image = self.background.remove_background_birefnet(job['image'])
+        else:
+            result_image = None
+
+        apply_background(job, result_image)
+
+    def prepare_request(self, image: Image.Image, prompt: str) -> Dict[str, Any]:
+        """
+        Choose model and build fal request for an image
+
+        Args:
+            image: Source image
+            prompt: Optimized prompt from GPT
+
+        Returns:
+            Dict with 'application', 'arguments', 'cache_key' and 'model_id',
+            or with 'cached_image' when the result cache already has it
+        """
+        background = self.background
+        selected_model, reason = background.select_model()
+        if not selected_model or selected_model.id == 'birefnet-fallback':
+            return {
+                'application': 'fal-ai/birefnet',
+                'arguments': {'image_url': background.image_url(image)},
+                'cache_key': None,
+                'model_id': None
+            }
+
+        arguments, settings = background.lora_arguments(selected_model, prompt)
+        cache_key = background.result_cache.make_key(image, settings)
+        cached_image = background.result_cache.get(cache_key)
+        if cached_image is not None:
+            background.selection_policy.release_probe(selected_model.id)
+            print(f"⚡ Результат LoRA {selected_model.version} взят из кэша")
+            return {'cached_image': cached_image}
+
+        arguments['image_url'] = background.image_url(image, parse_resolution(selected_model.spec.max_resolution))
+        return {'application': selected_model.endpoint, 'arguments': arguments,
+                'cache_key': cache_key, 'model_id': selected_model.id}
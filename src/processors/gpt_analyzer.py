@@ -4,18 +4,42 @@ Analyzes products to generate optimal prompts and positioning data
 """
 
 import os
-import base64
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from PIL import Image
-import io
-import requests
+
+from .analysis_schema import COMPACT_PROMPT, ANALYSIS_FORMAT, BATCH_ANALYSIS_FORMAT, decode_analysis
+from ..utils.concurrency import AdaptiveConcurrencyLimiter
+from ..utils.rate_limit import rate_limiters, retry_rate_limited
+from ..utils.http_client import http_client
+from ..utils.upload_manager import UploadManager, encode_data_url
+from ..utils.analysis_thumbnail import ThumbnailCache
 
 
 class GPTProductAnalyzer:
     """Analyzes product images using GPT-4 Vision API"""
     
-    def __init__(self):
+    def __init__(self, limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 upload_manager: Optional[UploadManager] = None):
+        """
+        Initialize analyzer
+        
+        Args:
+            limiter: Concurrency limiter shared by OpenAI calls (created with the
+                process-wide OpenAI rate limit if not given)
+            upload_manager: Upload manager providing full-size image URLs when
+                thumbnails are disabled (inline data URLs if not given)
+        """
+        self.limiter = limiter or AdaptiveConcurrencyLimiter('openai', rate_limiter=rate_limiters['openai'])
+        self.upload_manager = upload_manager
+        # Images are sent as ~512 px thumbnails: "detail": "low" downsamples to that anyway
+        self.thumbnails = ThumbnailCache()
+        # Token budget reserved per call until the response reports actual usage
+        self.estimated_tokens = int(os.environ.get('OPENAI_ESTIMATED_TOKENS', 4000))
+        # Images packed into one analyze_images request
+        self.batch_size = int(os.environ.get('OPENAI_ANALYSIS_BATCH', 6))
+        # Compact strict JSON schema instead of the verbose prompt (fewer output tokens, no parse failures)
+        self.structured_output = os.environ.get('OPENAI_STRUCTURED_OUTPUT', '1') != '0'
         self.api_key = os.environ.get('OPENAI_API_KEY', '')
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
@@ -82,128 +106,353 @@ Rules:
             Dict with analysis results
         """
         try:
-            # Convert image to base64
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+            payload = self._build_payload(image)
+            response = self._post(payload, self.estimated_tokens, timeout=30)
             
-            # Prepare the request using new OpenAI Responses API format
-            # Note: System prompt is combined with user request in single input
-            combined_prompt = f"{self.system_prompt}\n\nAnalyze this product image and return the structured JSON response."
+            return self._parse_response(response, payload, image)
             
-            payload = {
-                "model": "gpt-4o-mini",
-                "input": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": combined_prompt
-                            },
-                            {
-                                "type": "input_image",
-                                "image_url": f"data:image/png;base64,{img_base64}",
-                                "detail": "low"
-                            }
-                        ]
-                    }
-                ]
-            }
+        except Exception as e:
+            return self._error_result(e, image)
+    
+    def analyze_images(self, images: List[Image.Image]) -> List[Dict[str, Any]]:
+        """
+        Analyze several product images with one request per batch_size images
+        
+        The system prompt is sent once per request and the model answers with
+        a JSON array keyed by image index. Images whose item is missing or
+        invalid are analyzed again one by one with analyze_image.
+        
+        Args:
+            images: PIL Image objects
             
-            # Make the API call
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
+        Returns:
+            Analysis results in analyze_image format, in input order
+        """
+        results = []
+        for start in range(0, len(images), max(1, self.batch_size)):
+            chunk = images[start:start + max(1, self.batch_size)]
+            if len(chunk) == 1:
+                results.append(self.analyze_image(chunk[0]))
+                continue
             
-            if response.status_code == 200:
-                result = response.json()
-                # New Responses API returns output in different format
-                content = ""
-                if 'output' in result and len(result['output']) > 0:
-                    output_item = result['output'][0]
-                    if 'content' in output_item and len(output_item['content']) > 0:
-                        content_item = output_item['content'][0]
-                        if content_item.get('type') == 'output_text':
-                            content = content_item.get('text', '')
-                
-                if not content:
-                    # Fallback - try old format
-                    content = result.get('output_text', '')
-                
-                # Extract JSON from response
-                # GPT might wrap it in ```json ... ``` markers
-                if '```json' in content:
-                    content = content.split('```json')[1].split('```')[0]
-                elif '```' in content:
-                    content = content.split('```')[1].split('```')[0]
-                
-                # Parse JSON
-                analysis = json.loads(content.strip())
-                
-                # Add computed aspect ratio if image provided
-                if image:
-                    width, height = image.size
-                    analysis['geometry']['aspect_ratio'] = round(width / height, 2)
-                    
-                    # Verify orientation calculation
-                    if height / width > 1.3:
-                        analysis['geometry']['orientation'] = 'vertical'
-                        analysis['canvas_settings']['size'] = '1600x1600'
-                    else:
-                        analysis['geometry']['orientation'] = 'standard'
-                        analysis['canvas_settings']['size'] = '1200x1600'
-                
-                return {
-                    'success': True,
-                    'analysis': analysis
-                }
-                
-            else:
-                # Detailed error handling for debugging
-                try:
-                    error_response = response.json()
-                except:
-                    error_response = {"message": response.text}
-                
-                error_detail = ""
-                if response.status_code == 400:
-                    error_detail = f" (Bad Request - possibly invalid model or format): {error_response}"
-                elif response.status_code == 429:
-                    error_detail = f" (Rate limit exceeded): {error_response}"
-                elif response.status_code == 401:
-                    error_detail = f" (Invalid API key): {error_response}"
-                elif response.status_code == 404:
-                    error_detail = f" (Model/endpoint not found): {error_response}"
+            analyses = self._analyze_chunk(chunk)
+            for image, analysis in zip(chunk, analyses):
+                if analysis is None:
+                    results.append(self.analyze_image(image))
                 else:
-                    error_detail = f" (Unknown error): {error_response}"
-                    
-                print(f"OpenAI Responses API error: {response.status_code}{error_detail}")
-                print(f"Payload sent: {payload}")
-                return {
-                    'success': False,
-                    'error': f"API error: {response.status_code}{error_detail}",
-                    'fallback': self._get_fallback_analysis(image)
-                }
-                
+                    results.append({'success': True, 'analysis': analysis})
+        return results
+    
+    def _analyze_chunk(self, images: List[Image.Image]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Analyze images in one multi-image request
+        
+        Args:
+            images: Images of one request
+            
+        Returns:
+            Analysis per image, None for images the response did not cover
+        """
+        try:
+            payload = self._build_batch_payload(images)
+            response = self._post(payload, self.estimated_tokens * len(images), timeout=30 + 10 * len(images))
+            
+            if response.status_code != 200:
+                print(f"OpenAI Responses API error for batch of {len(images)}: {response.status_code}")
+                return [None] * len(images)
+            
+            return self._split_batch_response(response.json(), images)
+            
+        except Exception as e:
+            print(f"Error in batched GPT analysis, analyzing images one by one: {e}")
+            return [None] * len(images)
+    
+    def _post(self, payload: Dict[str, Any], tokens: float, timeout: float) -> Any:
+        """
+        Send Responses API request through the OpenAI limiter
+        
+        A 429 makes the limiter wait for Retry-After and the request is sent
+        again (RATE_LIMIT_RETRIES); the last response is returned either way.
+        
+        Args:
+            payload: Request payload
+            tokens: Estimated tokens of the request
+            timeout: Request timeout in seconds
+            
+        Returns:
+            HTTP response
+        """
+        def call():
+            with self.limiter.slot(tokens) as slot:
+                response = http_client.post(self.api_url, headers=self.headers, json=payload, timeout=timeout)
+                self._report_response(slot, response)
+            return response
+        
+        return retry_rate_limited(call, rejected=lambda response: response.status_code == 429)
+    
+    def _build_batch_payload(self, images: List[Image.Image]) -> Dict[str, Any]:
+        """
+        Build Responses API payload analyzing several images
+        
+        Args:
+            images: Images of one request
+            
+        Returns:
+            Request payload dict
+        """
+        if self.structured_output:
+            prompt = (f"{COMPACT_PROMPT}\nAnalyze each of the {len(images)} product images below separately: "
+                      f"one item per image, index is the image number (0-{len(images) - 1}).")
+        else:
+            prompt = (f"{self.system_prompt}\n\nAnalyze each of the {len(images)} product images below "
+                      f"separately. Return a JSON array with one object per image: the structured JSON "
+                      f"response above plus an \"index\" field with the image number (0-{len(images) - 1}).")
+        
+        content = [{"type": "input_text", "text": prompt}]
+        for index, image in enumerate(images):
+            image_url = self._image_url(image)
+            content.append({"type": "input_text", "text": f"Image {index}:"})
+            content.append({"type": "input_image", "image_url": image_url, "detail": "low"})
+        
+        payload = {
+            "model": "gpt-4o-mini",
+            "input": [{"role": "user", "content": content}]
+        }
+        if self.structured_output:
+            payload["text"] = {"format": BATCH_ANALYSIS_FORMAT}
+        return payload
+    
+    def _split_batch_response(self, result: Dict[str, Any],
+                              images: List[Image.Image]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Validate multi-image response and split it per image
+        
+        Args:
+            result: Decoded response body
+            images: Images of the request
+            
+        Returns:
+            Analysis per image, None where the item is missing or invalid
+        """
+        analyses = [None] * len(images)
+        try:
+            items = json.loads(self._response_json_text(result))
         except json.JSONDecodeError as e:
-            print(f"Failed to parse GPT response as JSON: {e}")
+            print(f"Failed to parse batched GPT response as JSON: {e}")
+            return analyses
+        
+        if isinstance(items, dict):
+            # Model may wrap the array, e.g. {"images": [...]}
+            items = next((value for value in items.values() if isinstance(value, list)), [])
+        
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            index = item.pop('index', None)
+            if not isinstance(index, int) or not 0 <= index < len(images) or analyses[index] is not None:
+                continue
+            try:
+                analysis = decode_analysis(item)
+            except ValueError:
+                continue
+            self.apply_geometry(analysis, images[index])
+            analyses[index] = analysis
+        
+        missing = analyses.count(None)
+        if missing:
+            print(f"⚠️ Пакетный анализ: {missing} из {len(images)} изображений без корректного ответа")
+        return analyses
+    
+    def _report_response(self, slot: Any, response: Any):
+        """Report status, Retry-After and token usage of a response to the limiter"""
+        slot.report_status(response.status_code, response.headers)
+        if response.status_code == 200:
+            try:
+                usage = response.json().get('usage') or {}
+            except ValueError:
+                return
+            if usage.get('total_tokens'):
+                slot.report_tokens(usage['total_tokens'])
+    
+    def _image_url(self, image: Image.Image) -> str:
+        """
+        Get URL of image for vision input
+        
+        Args:
+            image: PIL Image object (full resolution)
+            
+        Returns:
+            Cached thumbnail data URL, or full image URL if thumbnails are disabled
+        """
+        if self.thumbnails.enabled:
+            return self.thumbnails.data_url(image)
+        
+        # Same URL is reused by background removal when the upload manager is shared
+        if self.upload_manager:
+            return self.upload_manager.url_for(image)
+        return encode_data_url(image)
+    
+    def _build_payload(self, image: Image.Image) -> Dict[str, Any]:
+        """
+        Build Responses API payload for image analysis
+        
+        Args:
+            image: PIL Image object
+            
+        Returns:
+            Request payload dict
+        """
+        image_url = self._image_url(image)
+        
+        # Prepare the request using new OpenAI Responses API format
+        # Note: System prompt is combined with user request in single input
+        if self.structured_output:
+            combined_prompt = f"{COMPACT_PROMPT}\nAnalyze this product image."
+        else:
+            combined_prompt = f"{self.system_prompt}\n\nAnalyze this product image and return the structured JSON response."
+        
+        payload = {
+            "model": "gpt-4o-mini",
+            "input": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "input_text",
+                            "text": combined_prompt
+                        },
+                        {
+                            "type": "input_image",
+                            "image_url": image_url,
+                            "detail": "low"
+                        }
+                    ]
+                }
+            ]
+        }
+        if self.structured_output:
+            # Strict schema: the reply is always valid JSON with known codes
+            payload["text"] = {"format": ANALYSIS_FORMAT}
+        return payload
+    
+    def _parse_response(self, response: Any, payload: Dict[str, Any], image: Image.Image) -> Dict[str, Any]:
+        """
+        Turn API response into analysis result
+        
+        Args:
+            response: requests or httpx response object
+            payload: Payload that was sent (for error logging)
+            image: Analyzed image
+            
+        Returns:
+            Dict with analysis results
+        """
+        if response.status_code == 200:
+            # Parse JSON (compact schema codes are expanded to the full analysis shape)
+            analysis = decode_analysis(json.loads(self._response_json_text(response.json())))
+            
+            # Add computed aspect ratio if image provided
+            if image:
+                self.apply_geometry(analysis, image)
+            
             return {
-                'success': False,
-                'error': f"JSON parsing error: {str(e)}",
-                'fallback': self._get_fallback_analysis(image)
+                'success': True,
+                'analysis': analysis
             }
+        
+        # Detailed error handling for debugging
+        try:
+            error_response = response.json()
+        except:
+            error_response = {"message": response.text}
+        
+        error_detail = ""
+        if response.status_code == 400:
+            error_detail = f" (Bad Request - possibly invalid model or format): {error_response}"
+        elif response.status_code == 429:
+            error_detail = f" (Rate limit exceeded): {error_response}"
+        elif response.status_code == 401:
+            error_detail = f" (Invalid API key): {error_response}"
+        elif response.status_code == 404:
+            error_detail = f" (Model/endpoint not found): {error_response}"
+        else:
+            error_detail = f" (Unknown error): {error_response}"
             
-        except Exception as e:
-            print(f"Error in GPT analysis: {e}")
+        print(f"OpenAI Responses API error: {response.status_code}{error_detail}")
+        print(f"Payload sent: {payload}")
+        return {
+            'success': False,
+            'error': f"API error: {response.status_code}{error_detail}",
+            'fallback': self._get_fallback_analysis(image)
+        }
+    
+    def _response_json_text(self, result: Dict[str, Any]) -> str:
+        """
+        Get JSON text of a Responses API result
+        
+        Args:
+            result: Decoded response body
+            
+        Returns:
+            Output text without ``` markers
+        """
+        # New Responses API returns output in different format
+        content = ""
+        if 'output' in result and len(result['output']) > 0:
+            output_item = result['output'][0]
+            if 'content' in output_item and len(output_item['content']) > 0:
+                content_item = output_item['content'][0]
+                if content_item.get('type') == 'output_text':
+                    content = content_item.get('text', '')
+        
+        if not content:
+            # Fallback - try old format
+            content = result.get('output_text', '')
+        
+        # Extract JSON from response
+        # GPT might wrap it in ```json ... ``` markers
+        if '```json' in content:
+            content = content.split('```json')[1].split('```')[0]
+        elif '```' in content:
+            content = content.split('```')[1].split('```')[0]
+        
+        return content.strip()
+    
+    def apply_geometry(self, analysis: Dict[str, Any], image: Image.Image):
+        """
+        Compute image-dependent geometry fields of analysis in place
+        
+        Args:
+            analysis: Analysis dict to update
+            image: Analyzed image
+        """
+        width, height = image.size
+        analysis['geometry']['aspect_ratio'] = round(width / height, 2)
+        
+        # Verify orientation calculation
+        if height / width > 1.3:
+            analysis['geometry']['orientation'] = 'vertical'
+            analysis['canvas_settings']['size'] = '1600x1600'
+        else:
+            analysis['geometry']['orientation'] = 'standard'
+            analysis['canvas_settings']['size'] = '1200x1600'
+    
+    def _error_result(self, error: Exception, image: Image.Image) -> Dict[str, Any]:
+        """Build failed analysis result with fallback for an exception"""
+        if isinstance(error, json.JSONDecodeError):
+            print(f"Failed to parse GPT response as JSON: {error}")
             return {
                 'success': False,
-                'error': str(e),
+                'error': f"JSON parsing error: {str(error)}",
                 'fallback': self._get_fallback_analysis(image)
             }
+        
+        print(f"Error in GPT analysis: {error}")
+        return {
+            'success': False,
+            'error': str(error),
+            'fallback': self._get_fallback_analysis(image)
+        }
     
     def _get_fallback_analysis(self, image: Image.Image) -> Dict[str, Any]:
         """
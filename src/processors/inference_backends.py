@@ -0,0 +1,334 @@
+"""
+Inference Backends Module
+Pluggable analysis and segmentation providers
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+
+from .gpt_analyzer import GPTProductAnalyzer
+from ..utils.concurrency import AdaptiveConcurrencyLimiter
+from ..utils.http_client import http_client
+from ..utils.inference_resize import restore_resolution
+from ..utils.upload_manager import UploadManager, encode_data_url
+from ..utils.speculation import speculating, on_discard
+
+
+# Provider of models in the registry `provider` column
+FAL_PROVIDER = 'fal-ai'
+
+# Backend names for SEGMENTATION_BACKEND / ANALYSIS_BACKEND
+REMBG = 'rembg'
+OPENAI = 'openai'
+
+# Optional backends by name, created only when selected
+SEGMENTATION_FACTORIES: Dict[str, Callable[[], 'SegmentationBackend']] = {}
+ANALYZER_FACTORIES: Dict[str, Callable[..., GPTProductAnalyzer]] = {}
+
+
+def register_segmentation_backend(name: str, factory: Callable[[], 'SegmentationBackend']):
+    """Make a segmentation backend selectable by SEGMENTATION_BACKEND"""
+    SEGMENTATION_FACTORIES[name] = factory
+
+
+def register_analyzer(name: str, factory: Callable[..., GPTProductAnalyzer]):
+    """Make an analyzer (called with limiter and upload_manager) selectable by ANALYSIS_BACKEND"""
+    ANALYZER_FACTORIES[name] = factory
+
+
+class SegmentationHandle(ABC):
+    """Running background removal request"""
+
+    @abstractmethod
+    def get(self) -> Optional[Image.Image]:
+        """Wait for the result (at source resolution), None if the model returned nothing"""
+
+    def cancel(self):
+        """Cancel the request if the provider supports it"""
+
+
+class SegmentationBackend(ABC):
+    """
+    Provider of background removal models
+
+    A backend takes the source image and model arguments without the image
+    URL (remote backends upload the image themselves) and returns the
+    result at the source resolution.
+    """
+
+    name = ''
+
+    # Requests can go through FalJobQueue (submit now, poll later)
+    supports_fal_queue = False
+
+    def is_configured(self) -> bool:
+        """Check whether credentials or packages needed by the backend are present"""
+        return True
+
+    @abstractmethod
+    def submit(self, endpoint: str, image: Image.Image, arguments: Dict[str, Any],
+               max_size: Optional[Tuple[int, int]] = None) -> SegmentationHandle:
+        """
+        Start background removal request
+
+        Args:
+            endpoint: Model endpoint from the registry, e.g. 'fal-ai/birefnet'
+            image: Full-resolution source image
+            arguments: Model arguments without image URL
+            max_size: Model input limit (remote backends downscale before upload)
+
+        Returns:
+            Handle of the running request
+        """
+
+    def remove_background(self, endpoint: str, image: Image.Image, arguments: Dict[str, Any],
+                          max_size: Optional[Tuple[int, int]] = None) -> Optional[Image.Image]:
+        """Run background removal and wait for the result"""
+        handle = self.submit(endpoint, image, arguments, max_size)
+        # A discarded speculative call cancels its request
+        on_discard(handle.cancel)
+        return handle.get()
+
+
+class FalHandle(SegmentationHandle):
+    """fal.ai queue request"""
+
+    def __init__(self, handle: Any, backend: 'FalSegmentationBackend', image: Image.Image):
+        self.handle = handle
+        self.backend = backend
+        self.image = image
+
+    def get(self) -> Optional[Image.Image]:
+        return self.backend.result_image(self.image, self.handle.get())
+
+    def cancel(self):
+        self.handle.cancel()
+
+
+class FalSegmentationBackend(SegmentationBackend):
+    """fal.ai models (FLUX Kontext LoRA, BiRefNet) through fal_client"""
+
+    name = FAL_PROVIDER
+    supports_fal_queue = True
+
+    def __init__(self, image_url: Optional[Callable[..., str]] = None, client: Any = None):
+        """
+        Initialize fal backend
+
+        Args:
+            image_url: Function (image, max_size) -> URL sent to fal (default inline data URL)
+            client: fal_client module or compatible object (imported lazily if None)
+        """
+        self.image_url = image_url or (lambda image, max_size=None: encode_data_url(image))
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        """fal_client module"""
+        if self._client is None:
+            import fal_client
+            self._client = fal_client
+        return self._client
+
+    def is_configured(self) -> bool:
+        return bool(os.environ.get('FAL_KEY') or os.environ.get('FAL_API_KEY'))
+
+    def submit(self, endpoint: str, image: Image.Image, arguments: Dict[str, Any],
+               max_size: Optional[Tuple[int, int]] = None) -> SegmentationHandle:
+        handle = self.client.submit(endpoint, arguments=self.request_arguments(image, arguments, max_size))
+        return FalHandle(handle, self, image)
+
+    def remove_background(self, endpoint: str, image: Image.Image, arguments: Dict[str, Any],
+                          max_size: Optional[Tuple[int, int]] = None) -> Optional[Image.Image]:
+        if speculating():
+            # Queue handle instead of subscribe, so a discarded speculative call can cancel it
+            return super().remove_background(endpoint, image, arguments, max_size)
+
+        client = self.client
+
+        # Progress callback for debugging
+        def on_queue_update(update):
+            if isinstance(update, client.InProgress):
+                print(f"🔄 Processing {endpoint}: {len(update.logs)} logs")
+                for log in update.logs[-2:]:  # Show last 2 logs only
+                    print(f"  {log.get('message', '')}")
+
+        result = client.subscribe(
+            endpoint,
+            arguments=self.request_arguments(image, arguments, max_size),
+            with_logs=True,
+            on_queue_update=on_queue_update,
+        )
+        return self.result_image(image, result)
+
+    def request_arguments(self, image: Image.Image, arguments: Dict[str, Any],
+                          max_size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """Model arguments with URL of the uploaded image"""
+        if max_size is None:
+            return {**arguments, 'image_url': self.image_url(image)}
+        return {**arguments, 'image_url': self.image_url(image, max_size)}
+
+    def result_image(self, image: Image.Image, result: Optional[Dict[str, Any]]) -> Optional[Image.Image]:
+        """
+        Download image of a fal result
+
+        Args:
+            image: Source image the request was made for
+            result: fal result dict ('images' list for LoRA, 'image' for BiRefNet)
+
+        Returns:
+            Result at the source resolution, None if the result has no image
+        """
+        url = self.result_url(result)
+        if url is None:
+            if result:
+                print(f"📋 Ключи в результате без изображения: {list(result.keys()) if isinstance(result, dict) else 'не dict'}")
+            return None
+        print(f"📥 Загружаем результат с {url[:50]}...")
+        return restore_resolution(image, http_client.download_image(url))
+
+    @staticmethod
+    def result_url(result: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Get result image URL of a fal response"""
+        if not result:
+            return None
+        if result.get('images'):
+            return result['images'][0]['url']
+        if result.get('image'):
+            return result['image']['url']
+        return None
+
+
+class LocalHandle(SegmentationHandle):
+    """Local model call, run when the result is requested"""
+
+    def __init__(self, run: Callable[[], Optional[Image.Image]]):
+        self.run = run
+
+    def get(self) -> Optional[Image.Image]:
+        return self.run()
+
+
+class RembgSegmentationBackend(SegmentationBackend):
+    """Local background removal with the rembg package (optional dependency)"""
+
+    name = REMBG
+
+    def __init__(self, model_name: Optional[str] = None):
+        """
+        Initialize rembg backend
+
+        Args:
+            model_name: rembg model (default REMBG_MODEL or 'isnet-general-use')
+        """
+        self.model_name = model_name or os.environ.get('REMBG_MODEL', 'isnet-general-use')
+        self._session = None
+        self._lock = threading.Lock()
+
+    def is_configured(self) -> bool:
+        try:
+            import rembg  # noqa: F401
+            return True
+        except ImportError:
+            print("❌ rembg не установлен")
+            return False
+
+    def submit(self, endpoint: str, image: Image.Image, arguments: Dict[str, Any],
+               max_size: Optional[Tuple[int, int]] = None) -> SegmentationHandle:
+        return LocalHandle(lambda: self._remove(image))
+
+    def _remove(self, image: Image.Image) -> Image.Image:
+        """Cut out image with the shared rembg session"""
+        import rembg
+
+        with self._lock:
+            if self._session is None:
+                self._session = rembg.new_session(self.model_name)
+        return rembg.remove(image, session=self._session)
+
+
+register_segmentation_backend(REMBG, RembgSegmentationBackend)
+
+
+def create_analyzer(name: Optional[str] = None,
+                    limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                    upload_manager: Optional[UploadManager] = None) -> GPTProductAnalyzer:
+    """
+    Create product analyzer
+
+    Args:
+        name: 'openai' or a registered backend (default ANALYSIS_BACKEND or 'openai')
+        limiter: Concurrency limiter for analysis calls
+        upload_manager: Upload manager providing image URLs
+
+    Returns:
+        Analyzer with the GPTProductAnalyzer interface
+    """
+    name = name or os.environ.get('ANALYSIS_BACKEND', OPENAI)
+    if name == OPENAI:
+        return GPTProductAnalyzer(limiter=limiter, upload_manager=upload_manager)
+    factory = ANALYZER_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown analysis backend: {name}")
+    print(f"🧪 Анализ изображений: {name} backend")
+    return factory(limiter=limiter, upload_manager=upload_manager)
+
+
+class SegmentationBackends:
+    """
+    Segmentation backends keyed by model provider
+
+    Models are routed by the registry `provider` column. Setting
+    SEGMENTATION_BACKEND (e.g. 'rembg') routes every model to that
+    backend instead, so the pipeline can run without network access.
+    Backends other than fal are created on first use.
+    """
+
+    def __init__(self, image_url: Optional[Callable[..., str]] = None, override: Optional[str] = None):
+        """
+        Initialize backends
+
+        Args:
+            image_url: Function (image, max_size) -> URL for remote backends
+            override: Backend used for all models (default SEGMENTATION_BACKEND, unset = by provider)
+        """
+        self._backends: Dict[str, SegmentationBackend] = {FAL_PROVIDER: FalSegmentationBackend(image_url)}
+        self._lock = threading.Lock()
+        self.override = override if override is not None else os.environ.get('SEGMENTATION_BACKEND', '')
+        if self.override and self.override not in self._backends and self.override not in SEGMENTATION_FACTORIES:
+            raise ValueError(f"Unknown segmentation backend: {self.override}")
+        if self.override:
+            print(f"🧪 Удаление фона: {self.override} backend для всех моделей")
+
+    def register(self, provider: str, backend: SegmentationBackend):
+        """Add or replace backend of a provider"""
+        self._backends[provider] = backend
+
+    def get(self, provider: str = FAL_PROVIDER) -> SegmentationBackend:
+        """
+        Get backend of a model provider
+
+        Args:
+            provider: Registry provider of the model
+
+        Returns:
+            Segmentation backend
+
+        Raises:
+            ValueError: If no backend serves the provider
+        """
+        name = self.override or provider
+        backend = self._backends.get(name)
+        if backend is not None:
+            return backend
+        factory = SEGMENTATION_FACTORIES.get(name)
+        if factory is None:
+            raise ValueError(f"No segmentation backend for provider {provider}")
+        with self._lock:
+            if name not in self._backends:
+                self._backends[name] = factory()
+            return self._backends[name]
@@ -0,0 +1,242 @@
+"""
+Local Heuristic Analyzer for product images
+Fills the analysis fields the pipeline uses from cheap pixel and filename signals
+"""
+
+import os
+import re
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+
+# Filename keywords (token prefixes): category, product type, physical property
+PRODUCT_HINTS = [
+    (('shoe', 'sneaker', 'boot', 'sandal', 'кроссов', 'ботин', 'туфл', 'сапог'), 'fashion', 'shoes', 'stands'),
+    (('shirt', 'tshirt', 'dress', 'jacket', 'hoodie', 'coat', 'футболк', 'рубашк', 'плать', 'куртк'),
+     'fashion', 'clothing', 'hangs'),
+    (('bag', 'backpack', 'сумк', 'рюкзак'), 'fashion', 'bag', 'stands'),
+    (('watch', 'ring', 'earring', 'necklace', 'bracelet', 'часы', 'кольц', 'серьг', 'браслет'),
+     'fashion', 'accessory', 'floats'),
+    (('bottle', 'jar', 'бутыл'), 'fmcg', 'bottle', 'stands'),
+    (('vase', 'lamp', 'chair', 'ваза', 'ламп', 'стул'), 'home', 'home item', 'stands'),
+    (('book', 'notebook', 'towel', 'книг', 'полотен'), 'home', 'flat item', 'lies_flat'),
+    (('kettle', 'toaster', 'blender', 'чайник', 'тостер', 'блендер'), 'appliances', 'kitchen appliance', 'stands'),
+    (('tablet', 'laptop', 'планшет', 'ноутбук'), 'electronics', 'device', 'lies_flat'),
+    (('phone', 'headphone', 'speaker', 'смартфон', 'телефон', 'наушник', 'колонк'),
+     'electronics', 'device', 'floats'),
+    (('drill', 'hammer', 'screwdriver', 'wrench', 'дрель', 'молот', 'отвертк', 'ключ'), 'diy', 'tool', 'floats'),
+]
+
+COLORS = {'white': (235, 235, 235), 'black': (25, 25, 25), 'gray': (128, 128, 128),
+          'red': (200, 40, 40), 'green': (40, 160, 60), 'blue': (40, 80, 200),
+          'yellow': (230, 200, 40), 'brown': (120, 80, 40)}
+
+
+class LocalHeuristicAnalyzer:
+    """
+    Analyzes product images locally, without a remote model
+
+    The object box comes from the alpha channel or from the difference to
+    the border colour, physical property and product type from filename
+    and SKU tokens. Confidence combines how clean the background is (the
+    box is only reliable on a plain or transparent background) with whether
+    the filename named the product, since without a name there is nothing
+    to describe in the LoRA prompt.
+    """
+
+    # Weights of the confidence signals
+    BOX_WEIGHT = 0.6
+    HINT_WEIGHT = 0.4
+
+    def __init__(self, threshold: Optional[float] = None, sample_side: int = 256, diff_threshold: int = 32):
+        """
+        Initialize local analyzer
+
+        Args:
+            threshold: Confidence needed to skip GPT (default LOCAL_ANALYSIS_THRESHOLD or 0.75, above 1 disables)
+            sample_side: Longest side of the image the signals are computed on
+            diff_threshold: Channel difference from the background that counts as object
+        """
+        self.threshold = threshold if threshold is not None else float(
+            os.environ.get('LOCAL_ANALYSIS_THRESHOLD', 0.75))
+        self.sample_side = sample_side
+        self.diff_threshold = diff_threshold
+        self._lock = threading.Lock()
+        self._stats = {'analyzed': 0, 'confident': 0, 'no_description': 0}
+
+    def analyze(self, image: Image.Image, filename: str = '') -> Dict[str, Any]:
+        """
+        Analyze image from local signals
+
+        Args:
+            image: PIL Image object
+            filename: Original filename (SKU and product keywords)
+
+        Returns:
+            Dict with analysis (analyze_image format), confidence (0-1),
+            whether it is confident enough to skip GPT, and raw signals
+        """
+        sample = image.copy()
+        sample.thumbnail((self.sample_side, self.sample_side), reducing_gap=2.0)
+        sample = sample.convert('RGBA')
+
+        mask, box_score = self._object_mask(sample)
+        bbox = mask.getbbox() if mask is not None else None
+        hint = self.filename_hint(filename)
+        color = self._primary_color(sample, mask)
+
+        confidence = round(self.BOX_WEIGHT * box_score + (self.HINT_WEIGHT if hint else 0.0), 3)
+        confident = confidence >= self.threshold and hint is not None
+
+        with self._lock:
+            self._stats['analyzed'] += 1
+            if confident:
+                self._stats['confident'] += 1
+            if hint is None:
+                self._stats['no_description'] += 1
+
+        scale = image.width / sample.width
+        return {
+            'success': True,
+            'analysis': self._build_analysis(image, bbox, hint, color),
+            'confidence': confidence,
+            'confident': confident,
+            'local': True,
+            'signals': {
+                'object_bbox': [round(v * scale) for v in bbox] if bbox else None,
+                'box_score': box_score,
+                'hint': hint[1] if hint else None,
+                'primary_color': color
+            }
+        }
+
+    def filename_hint(self, filename: str) -> Optional[Tuple[str, str, str]]:
+        """
+        Find product keyword in filename
+
+        Args:
+            filename: Filename, e.g. "SKU123_red_shoes.jpg"
+
+        Returns:
+            Tuple of (category, product type, physical property), None if no keyword matches
+        """
+        stem = os.path.splitext(os.path.basename(filename or ''))[0].lower()
+        tokens = [token for token in re.split(r'[^a-zа-яё]+', stem) if token]
+        for keywords, category, product_type, physical_property in PRODUCT_HINTS:
+            if any(token.startswith(keyword) for token in tokens for keyword in keywords):
+                return category, product_type, physical_property
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Get analysis counters"""
+        with self._lock:
+            return {**self._stats, 'threshold': self.threshold}
+
+    def _object_mask(self, sample: Image.Image) -> Tuple[Optional[Image.Image], float]:
+        """
+        Find object pixels
+
+        Args:
+            sample: Downscaled RGBA image
+
+        Returns:
+            Tuple of (object mask or None if no object found, reliability 0-1)
+        """
+        alpha = sample.getchannel('A')
+        if alpha.getextrema()[0] < 250:
+            # Cut-out with transparency: alpha is the object
+            mask = alpha.point(lambda value: 255 if value > 16 else 0)
+            return (mask, 1.0) if mask.getbbox() else (None, 0.0)
+
+        rgb = sample.convert('RGB')
+        border = self._border_pixels(rgb)
+        background = tuple(sorted(channel)[len(channel) // 2] for channel in zip(*border))
+        spread = sum(max(abs(a - b) for a, b in zip(pixel, background)) for pixel in border) / len(border)
+
+        difference = ImageChops.difference(rgb, Image.new('RGB', rgb.size, background))
+        red, green, blue = difference.split()
+        strongest = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+        mask = strongest.point(lambda value: 255 if value > self.diff_threshold else 0)
+        bbox = mask.getbbox()
+        if bbox is None:
+            return None, 0.0
+
+        # Plain studio background gives a reliable box, a busy one does not
+        score = 0.9 if spread <= 6 else 0.6 if spread <= 20 else 0.2
+        box_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+        if box_area >= 0.97 * rgb.width * rgb.height:
+            # Object fills the frame: no background to measure against
+            score = min(score, 0.3)
+        return mask, score
+
+    @staticmethod
+    def _border_pixels(image: Image.Image) -> List[Tuple[int, int, int]]:
+        """Get pixels of the outer one-pixel frame"""
+        width, height = image.size
+        pixels = image.load()
+        coordinates = ([(x, 0) for x in range(width)] + [(x, height - 1) for x in range(width)]
+                       + [(0, y) for y in range(1, height - 1)] + [(width - 1, y) for y in range(1, height - 1)])
+        return [pixels[x, y] for x, y in coordinates]
+
+    @staticmethod
+    def _primary_color(sample: Image.Image, mask: Optional[Image.Image]) -> str:
+        """Name of the palette colour closest to the mean object colour"""
+        rgb = sample.convert('RGB')
+        if mask is not None:
+            rgb = rgb.crop(mask.getbbox())
+            mask = mask.crop(mask.getbbox())
+            background = Image.new('RGB', rgb.size)
+            # Mean over object pixels only: average of masked pixels / share of object pixels
+            masked = Image.composite(rgb, background, mask).resize((1, 1), Image.BOX).getpixel((0, 0))
+            share = mask.resize((1, 1), Image.BOX).getpixel((0, 0)) / 255
+            mean = tuple(min(255, value / share) for value in masked) if share else masked
+        else:
+            mean = rgb.resize((1, 1), Image.BOX).getpixel((0, 0))
+        return min(COLORS, key=lambda name: sum((a - b) ** 2 for a, b in zip(COLORS[name], mean)))
+
+    def _build_analysis(self, image: Image.Image, bbox: Optional[Tuple[int, int, int, int]],
+                        hint: Optional[Tuple[str, str, str]], color: str) -> Dict[str, Any]:
+        """Build analysis dict with the fields GPT would return (bbox in sample coordinates)"""
+        width, height = image.size
+        is_vertical = height / width > 1.3
+        category, product_type, physical_property = hint or ('unknown', 'product', 'floats')
+
+        positioning = 'centered'
+        if physical_property == 'stands':
+            positioning = 'bottom_aligned'
+            if bbox and (bbox[3] - bbox[1]) / max(1, bbox[2] - bbox[0]) > 2.5:
+                # Tall standing item (bottle, floor lamp) uses the full canvas height
+                positioning = 'fill_vertical'
+
+        return {
+            'category': category,
+            'product_identification': {
+                'type': product_type,
+                'brand': 'unknown',
+                'model': 'unknown'
+            },
+            'visual_properties': {
+                'primary_color': color,
+                'secondary_colors': [],
+                'material': 'unknown',
+                'texture': 'unknown',
+                'transparency': 'opaque'
+            },
+            'geometry': {
+                'orientation': 'vertical' if is_vertical else 'standard',
+                'aspect_ratio': round(width / height, 2),
+                'has_shadow': True,
+                'physical_property': physical_property
+            },
+            'lora_optimization': {
+                'main_object_description': f"{color} {product_type}",
+                'special_instructions': 'none',
+                'shadow_handling': 'preserve'
+            },
+            'canvas_settings': {
+                'size': '1600x1600' if is_vertical else '1200x1600',
+                'positioning': positioning
+            }
+        }
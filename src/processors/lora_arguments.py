@@ -0,0 +1,75 @@
+"""
+LoRA Arguments Module
+Request arguments and result cache settings of FLUX Kontext LoRA models
+"""
+
+from typing import Dict, Any, Optional
+
+from ..models.model_registry import ModelInfo
+
+
+# Adapter weights of the v2 model (v1 uses LORA_PATH)
+V2_LORA_PATH = "https://v3.fal.media/files/zebra/KoeQj8N4bU6OGnPT2VABy_adapter_model.safetensors"
+
+# Prompts used when GPT did not provide one
+DEFAULT_PROMPTS = {
+    'v2': "Isolate the main product from the original image. Remove all text, graphics, watermarks, and extra objects. Replace the background with a pure white background. Keep product colors, proportions, and details. Add a soft realistic shadow for a natural catalog look.",
+    'v1': "remove background, place product on pure white background, keep shadows for realism, professional product photography"
+}
+
+
+def build_lora_arguments(selected_model: ModelInfo, image_url: Optional[str], prompt: str,
+                         lora_path: str) -> Dict[str, Any]:
+    """
+    Build FLUX Kontext LoRA request arguments from model spec
+
+    Args:
+        selected_model: Selected LoRA model
+        image_url: Source image URL (data URL or uploaded file URL), None to set later
+        prompt: Optimized prompt from GPT
+        lora_path: Adapter weights of v1 models
+
+    Returns:
+        Arguments dict for fal-ai/flux-kontext-lora
+    """
+    # Configure settings from model spec
+    model_spec = selected_model.spec
+    guidance_scale = model_spec.guidance_scale
+    inference_steps = model_spec.num_inference_steps
+
+    # Use default prompt if not provided
+    if not prompt or prompt.strip() == "":
+        prompt = DEFAULT_PROMPTS['v2' if selected_model.version == 'v2' else 'v1']
+
+    print(f"🔧 Конфигурация {selected_model.name} {selected_model.version}:")
+    print(f"   Endpoint: {selected_model.endpoint}")
+    print(f"   Шаги: {inference_steps}")
+    print(f"   Guidance Scale: {guidance_scale}")
+    print(f"   Промпт: {prompt[:50]}...")
+
+    return {
+        "image_url": image_url,
+        "prompt": prompt,
+        "num_inference_steps": inference_steps,
+        "guidance_scale": guidance_scale,
+        "output_format": "png",
+        "enable_safety_checker": False,
+        "loras": [
+            {
+                "path": V2_LORA_PATH if selected_model.version == 'v2' else lora_path,
+                "scale": 1.0
+            }
+        ],
+        "resolution_mode": "match_input"
+    }
+
+
+def lora_cache_settings(selected_model: ModelInfo, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Settings that change the LoRA output, keyed into the result cache with the source pixels"""
+    return {
+        'model_id': selected_model.id,
+        'prompt': arguments['prompt'],
+        'lora_path': arguments['loras'][0]['path'],
+        'guidance_scale': arguments['guidance_scale'],
+        'num_inference_steps': arguments['num_inference_steps']
+    }
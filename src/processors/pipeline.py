@@ -0,0 +1,209 @@
+"""
+Staged Pipeline Module
+Runs jobs through a chain of stages, each with its own bounded queue and worker pool
+"""
+
+import time
+import queue
+import threading
+import traceback
+from dataclasses import dataclass
+from concurrent.futures import Future
+from typing import List, Dict, Any, Callable, Iterator, Optional
+
+
+@dataclass
+class PipelineStage:
+    """Configuration of a single pipeline stage"""
+    name: str
+    handler: Callable[[Dict[str, Any]], Dict[str, Any]]
+    workers: int = 1
+    queue_size: int = 0  # 0 = twice the worker count
+    run_on_error: bool = False  # Run even for jobs that failed in an earlier stage
+
+
+class StagedPipeline:
+    """
+    Chain of stages connected by bounded queues
+
+    Every stage owns its own worker threads, so slow network stages can keep
+    many requests in flight while CPU stages stay at core count. Jobs are plain
+    dicts passed from stage to stage. A handler that raises marks the job as
+    failed; later stages skip it unless they are declared with run_on_error.
+    A handler may also return a Future: the worker is released at once and
+    the job moves on when the future completes (an exception fails the job),
+    so a stage can wait on far more remote jobs than it has threads. Completed
+    futures are handed to a forwarding thread, so the thread that resolves
+    them (e.g. a single status poller) never blocks on a full queue.
+    """
+
+    def __init__(self, stages: List[PipelineStage]):
+        """
+        Initialize pipeline
+
+        Args:
+            stages: Ordered list of stages
+        """
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+
+        self.stages = stages
+        self._queues = [
+            queue.Queue(maxsize=max(stage.queue_size or stage.workers * 2, stage.workers))
+            for stage in stages
+        ]
+        self._output = queue.Queue()
+        self._deferred = queue.Queue()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            stage.name: {'processed': 0, 'failed': 0, 'busy': 0, 'busy_time': 0.0, 'in_flight': 0}
+            for stage in stages
+        }
+
+    def run(self, jobs: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Push jobs through all stages
+
+        Args:
+            jobs: Job dicts to process
+
+        Yields:
+            Jobs in completion order, once they leave the last stage
+        """
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(index,),
+                    name=f"{stage.name}-{worker}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        feeder = threading.Thread(target=self._feed, args=(jobs,), name="pipeline-feeder", daemon=True)
+        feeder.start()
+        forwarder = threading.Thread(target=self._forward_deferred, name="pipeline-deferred", daemon=True)
+        forwarder.start()
+        threads.append(forwarder)
+
+        try:
+            for _ in range(len(jobs)):
+                yield self._output.get()
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join(timeout=1.0)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get per-stage counters and current queue depth
+
+        Returns:
+            Dict keyed by stage name
+        """
+        with self._stats_lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        for stage, stage_queue in zip(self.stages, self._queues):
+            stats[stage.name]['queued'] = stage_queue.qsize()
+            stats[stage.name]['workers'] = stage.workers
+        return stats
+
+    def _feed(self, jobs: List[Dict[str, Any]]):
+        """Feed jobs into the first stage, blocking while its queue is full"""
+        for job in jobs:
+            if not self._put(0, job):
+                return
+
+    def _put(self, index: int, job: Dict[str, Any]) -> bool:
+        """Put job into stage queue (or output when past the last stage)"""
+        if index >= len(self._queues):
+            self._output.put(job)
+            return True
+
+        while not self._stop.is_set():
+            try:
+                self._queues[index].put(job, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker_loop(self, index: int):
+        """Worker thread body for stage with given index"""
+        stage = self.stages[index]
+        stage_queue = self._queues[index]
+
+        while not self._stop.is_set():
+            try:
+                job = stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if job.get('status') != 'error' or stage.run_on_error:
+                pending = self._run_handler(stage, job)
+                if pending is not None:
+                    pending.add_done_callback(
+                        lambda done, job=job: self._deferred.put((index, job, done)))
+                    continue
+
+            self._put(index + 1, job)
+
+    def _forward_deferred(self):
+        """Forwarding thread body: move jobs of completed futures to the next stage"""
+        while not self._stop.is_set():
+            try:
+                index, job, done = self._deferred.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self._finish_deferred(index, job, done)
+
+    def _finish_deferred(self, index: int, job: Dict[str, Any], done: Future):
+        """Move job on once the future returned by its handler completed"""
+        stage = self.stages[index]
+        error = done.exception()
+        with self._stats_lock:
+            self._stats[stage.name]['in_flight'] -= 1
+            if error is not None:
+                self._stats[stage.name]['failed'] += 1
+
+        if error is not None:
+            job['status'] = 'error'
+            job['error'] = str(error)
+            job['failed_stage'] = stage.name
+            job['traceback'] = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+
+        self._put(index + 1, job)
+
+    def _run_handler(self, stage: PipelineStage, job: Dict[str, Any]) -> Optional[Future]:
+        """Run stage handler, converting exceptions into a failed job"""
+        with self._stats_lock:
+            self._stats[stage.name]['busy'] += 1
+
+        started = time.time()
+        failed = False
+        pending = None
+        try:
+            result = stage.handler(job)
+            if isinstance(result, Future):
+                pending = result
+        except Exception as e:
+            failed = True
+            job['status'] = 'error'
+            job['error'] = str(e)
+            job['failed_stage'] = stage.name
+            job['traceback'] = traceback.format_exc()
+        finally:
+            with self._stats_lock:
+                stats = self._stats[stage.name]
+                stats['busy'] -= 1
+                stats['busy_time'] += time.time() - started
+                stats['processed'] += 1
+                if failed:
+                    stats['failed'] += 1
+                if pending is not None:
+                    stats['in_flight'] += 1
+
+        return pending
@@ -3,10 +3,13 @@ Smart Positioning Module
 Positions products on canvas based on category and orientation
 """
 
+import os
 from PIL import Image, ImageDraw
 import numpy as np
 from typing import Tuple, Dict, Any, Optional
 
+from ..utils.content_bounds import find_content_bounds
+
 
 class SmartPositioning:
     """Intelligent product positioning on standardized canvases"""
@@ -22,6 +25,10 @@ class SmartPositioning:
     def __init__(self):
         """Initialize positioning system"""
         self.debug_mode = False  # Set to True to show grid lines
+        # Content thresholds for bounding box: alpha noise below this is background,
+        # opaque images (no transparency) use channel distance from the border colour
+        self.alpha_threshold = int(os.environ.get('BBOX_ALPHA_THRESHOLD', 10))
+        self.color_distance = int(os.environ.get('BBOX_COLOR_DISTANCE', 24))
         
     def process_image(self, 
                      image: Image.Image, 
@@ -172,7 +179,10 @@ class SmartPositioning:
     
     def _get_image_bounds(self, image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
         """
-        Get bounding box of non-transparent pixels (including shadows)
+        Get bounding box of visible content (including shadows)
+        
+        Near-transparent noise and isolated specks are ignored; fully opaque
+        images are bounded against their background colour.
         
         Args:
             image: Image to analyze
@@ -180,15 +190,8 @@ class SmartPositioning:
         Returns:
             Bounding box (left, top, right, bottom) or None if empty
         """
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-        
-        # Get alpha channel
-        alpha = image.split()[-1]
-        
-        # Find bounding box of non-transparent pixels
-        # We use a low threshold to include soft shadows
-        bbox = alpha.getbbox()
+        # Low alpha threshold keeps soft shadows in the box
+        bbox = find_content_bounds(image, self.alpha_threshold, self.color_distance)
         
         if bbox:
             # Expand bbox slightly to ensure we don't clip shadows
@@ -0,0 +1,179 @@
+"""
+Analysis-sized thumbnails for GPT vision requests
+Small JPEG/WebP copies of source images, since "detail": "low" downsamples to ~512 px anyway
+"""
+
+import io
+import os
+import base64
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from PIL import Image
+
+from .upload_manager import content_hash
+
+
+# Longest side the provider keeps for low-detail vision input
+DEFAULT_MAX_SIDE = 512
+
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png'}
+
+
+def make_thumbnail(image: Image.Image, max_side: int = DEFAULT_MAX_SIDE) -> Image.Image:
+    """
+    Downscale image for analysis, flattening transparency onto white
+
+    Args:
+        image: Source image (any size and mode)
+        max_side: Longest side of the thumbnail
+
+    Returns:
+        RGB image no larger than max_side
+    """
+    thumbnail = image.copy()
+    # reducing_gap: integer-factor reduce first, then a short resample
+    thumbnail.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+
+    if thumbnail.mode in ('RGBA', 'LA', 'P'):
+        thumbnail = thumbnail.convert('RGBA')
+        background = Image.new('RGB', thumbnail.size, (255, 255, 255))
+        background.paste(thumbnail, mask=thumbnail.getchannel('A'))
+        return background
+    return thumbnail.convert('RGB')
+
+
+def load_thumbnail(path: Union[str, Path], max_side: int = DEFAULT_MAX_SIDE) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Decode file straight to thumbnail size
+
+    JPEG files are decoded in draft mode (DCT scaling), so a 4000 px photo
+    is never decoded at full resolution.
+
+    Args:
+        path: Image file
+        max_side: Longest side of the thumbnail
+
+    Returns:
+        Tuple of (thumbnail, true (width, height) of the file)
+    """
+    with Image.open(path) as image:
+        size = image.size
+        image.draft('RGB', (max_side, max_side))
+        return make_thumbnail(image, max_side), size
+
+
+class ThumbnailCache:
+    """
+    Encoded analysis thumbnails keyed by image content
+
+    The first analysis of an image encodes its thumbnail once; retries,
+    fallbacks and batched re-requests of the same pixels reuse the stored
+    data URL. Entries also keep the true image size, because geometry
+    fields must describe the original, not the thumbnail.
+    """
+
+    def __init__(self,
+                 max_side: Optional[int] = None,
+                 image_format: Optional[str] = None,
+                 quality: Optional[int] = None,
+                 max_entries: int = 512):
+        """
+        Initialize thumbnail cache
+
+        Args:
+            max_side: Longest thumbnail side (default ANALYSIS_THUMBNAIL_SIZE or 512, 0 = send full image)
+            image_format: JPEG or WEBP (default ANALYSIS_THUMBNAIL_FORMAT or JPEG)
+            quality: Encoder quality (default ANALYSIS_THUMBNAIL_QUALITY or 85)
+            max_entries: Max cached thumbnails
+        """
+        self.max_side = max_side if max_side is not None else int(
+            os.environ.get('ANALYSIS_THUMBNAIL_SIZE', DEFAULT_MAX_SIDE))
+        self.image_format = (image_format or os.environ.get('ANALYSIS_THUMBNAIL_FORMAT', 'JPEG')).upper()
+        self.quality = quality if quality is not None else int(os.environ.get('ANALYSIS_THUMBNAIL_QUALITY', 85))
+        self.max_entries = max_entries
+
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'encoded': 0, 'hits': 0, 'draft_decoded': 0, 'bytes_encoded': 0}
+
+    @property
+    def enabled(self) -> bool:
+        """Whether analysis uses thumbnails (max_side > 0)"""
+        return self.max_side > 0
+
+    def get(self, image: Image.Image, key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get thumbnail of image, encoding it on first use
+
+        Args:
+            image: Source image
+            key: Content hash of image (computed if not given)
+
+        Returns:
+            Dict with data_url, size (true image size) and bytes
+        """
+        key = key or content_hash(image)
+        entry = self._lookup(key)
+        if entry is None:
+            entry = self._store(key, make_thumbnail(image, self.max_side), image.size)
+        return entry
+
+    def prime(self, key: str, path: Union[str, Path]) -> Dict[str, Any]:
+        """
+        Encode thumbnail of a not yet analyzed image straight from its file
+
+        Args:
+            key: Content hash of the decoded image
+            path: Image file
+
+        Returns:
+            Cached entry (see get)
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            thumbnail, size = load_thumbnail(path, self.max_side)
+            entry = self._store(key, thumbnail, size)
+            with self._lock:
+                self._stats['draft_decoded'] += 1
+        return entry
+
+    def data_url(self, image: Image.Image, key: Optional[str] = None) -> str:
+        """Get thumbnail data URL of image"""
+        return self.get(image, key)['data_url']
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries),
+                    'max_side': self.max_side, 'format': self.image_format}
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get cached entry and mark it recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+            return entry
+
+    def _store(self, key: str, thumbnail: Image.Image, size: Tuple[int, int]) -> Dict[str, Any]:
+        """Encode thumbnail and cache it"""
+        buffered = io.BytesIO()
+        thumbnail.save(buffered, format=self.image_format, quality=self.quality)
+        data = buffered.getvalue()
+        content_type = CONTENT_TYPES.get(self.image_format, f"image/{self.image_format.lower()}")
+        entry = {
+            'data_url': f"data:{content_type};base64,{base64.b64encode(data).decode()}",
+            'size': size,
+            'bytes': len(data)
+        }
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._stats['encoded'] += 1
+            self._stats['bytes_encoded'] += len(data)
+        return entry
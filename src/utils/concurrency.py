@@ -0,0 +1,265 @@
+"""
+Adaptive concurrency control for remote inference calls
+AIMD limiter: additive increase while latency is flat, multiplicative decrease on overload
+"""
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from .rate_limit import RateLimiter, parse_retry_after, retry_after_from
+
+
+# Outcome signals reported for each call
+OK = 'ok'
+RATE_LIMITED = 'rate_limited'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Map exception raised by a remote call to an outcome signal
+
+    Args:
+        error: Exception from requests, httpx or fal_client
+
+    Returns:
+        RATE_LIMITED, TIMEOUT or ERROR
+    """
+    response = getattr(error, 'response', None)
+    status_code = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+    if status_code == 429:
+        return RATE_LIMITED
+
+    if isinstance(error, TimeoutError) or 'timeout' in type(error).__name__.lower():
+        return TIMEOUT
+
+    return ERROR
+
+
+class CallSlot:
+    """Single in-flight call holding a limiter slot"""
+
+    def __init__(self):
+        self.outcome = OK
+        self.retry_after = None
+        self.tokens_used = None
+
+    def report_status(self, status_code: int, headers: Optional[Any] = None):
+        """Report HTTP status (and headers with Retry-After) of a call that did not raise"""
+        if status_code == 429:
+            self.outcome = RATE_LIMITED
+            if headers:
+                self.retry_after = parse_retry_after(headers.get('Retry-After'))
+        elif status_code in (408, 504):
+            self.outcome = TIMEOUT
+        elif status_code >= 500:
+            self.outcome = ERROR
+
+    def report_tokens(self, tokens_used: int):
+        """Report actual token usage so the rate limiter can correct its estimate"""
+        self.tokens_used = tokens_used
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limiter for one remote provider
+
+    The limit grows by one after a full window of healthy calls and is
+    multiplied by decrease_factor on 429s, timeouts or latency spikes
+    (latency above latency_tolerance x baseline). Decreases are spaced by at
+    least one baseline latency so a single overload episode is counted once.
+    Calls that name an endpoint are compared with that endpoint's own
+    baseline, so a provider serving both slow and fast models (LoRA and
+    BiRefNet on fal) does not read the slow model as a spike of the fast one.
+    With a RateLimiter, every slot first waits for the provider's
+    process-wide request/token budget.
+    """
+
+    def __init__(self,
+                 name: str,
+                 initial_limit: int = 4,
+                 min_limit: int = 1,
+                 max_limit: int = 64,
+                 decrease_factor: float = 0.5,
+                 latency_tolerance: float = 2.0,
+                 history_size: int = 20,
+                 rate_limiter: Optional[RateLimiter] = None):
+        """
+        Initialize limiter
+
+        Args:
+            name: Provider name for metrics
+            initial_limit: Starting concurrency limit
+            min_limit: Lower bound of the limit
+            max_limit: Upper bound of the limit
+            decrease_factor: Multiplier applied on overload signals
+            latency_tolerance: Latency / baseline ratio treated as a spike
+            history_size: Number of recent decisions kept for metrics
+            rate_limiter: Process-wide budget of the provider (optional)
+        """
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._in_flight = 0
+        self._healthy_streak = 0
+        self._baselines: Dict[Optional[str], float] = {}
+        self._last_latency = None
+        self._last_decrease = 0.0
+        self._counters = {OK: 0, RATE_LIMITED: 0, TIMEOUT: 0, ERROR: 0, 'latency_spike': 0}
+        self._decisions = deque(maxlen=history_size)
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """Current concurrency limit"""
+        return int(self._limit)
+
+    def acquire(self):
+        """Block until a slot is free"""
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot without blocking, return False if none is free"""
+        with self._condition:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self, latency: float, outcome: str = OK, endpoint: Optional[str] = None):
+        """
+        Free a slot and adjust the limit
+
+        Args:
+            latency: Call duration in seconds
+            outcome: OK, RATE_LIMITED, TIMEOUT or ERROR
+            endpoint: Model endpoint of the call (latency baseline key)
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._counters[outcome] += 1
+            self._last_latency = latency
+
+            baseline = self._baselines.get(endpoint)
+            if outcome in (RATE_LIMITED, TIMEOUT):
+                self._decrease(outcome, latency, baseline)
+            elif outcome == OK:
+                if baseline is not None and latency > baseline * self.latency_tolerance:
+                    self._counters['latency_spike'] += 1
+                    self._decrease('latency_spike', latency, baseline)
+                else:
+                    self._update_baseline(endpoint, latency)
+                    self._increase(latency, self._baselines[endpoint])
+
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: float = 0, endpoint: Optional[str] = None):
+        """
+        Hold a slot for the duration of a call
+
+        Exceptions are classified and re-raised; calls that return an HTTP
+        status instead of raising report it through CallSlot.report_status.
+
+        Args:
+            tokens: Estimated provider tokens of the call (for the token budget)
+            endpoint: Model endpoint of the call (latency baseline key)
+        """
+        if self.rate_limiter:
+            self.rate_limiter.acquire(tokens)
+        self.acquire()
+        call = CallSlot()
+        started = time.time()
+        try:
+            yield call
+        except Exception as e:
+            call.outcome = classify_error(e)
+            call.retry_after = retry_after_from(e)
+            raise
+        finally:
+            self.release(time.time() - started, call.outcome, endpoint)
+            self._settle_budget(call, tokens)
+
+    def _settle_budget(self, call: CallSlot, tokens: float):
+        """Report call outcome and token usage to the rate limiter"""
+        if not self.rate_limiter:
+            return
+        if call.outcome == RATE_LIMITED:
+            self.rate_limiter.backoff(call.retry_after)
+        else:
+            self.rate_limiter.note_success()
+        if call.tokens_used is not None:
+            self.rate_limiter.adjust_tokens(call.tokens_used - tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get current limit and the signals behind recent decisions
+
+        Returns:
+            Dict suitable for progress/metrics JSON
+        """
+        with self._condition:
+            default_baseline = self._baselines.get(None)
+            return {
+                'name': self.name,
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'baseline_latency': round(default_baseline, 3) if default_baseline else None,
+                'endpoint_baselines': {endpoint: round(baseline, 3)
+                                       for endpoint, baseline in self._baselines.items() if endpoint},
+                'last_latency': round(self._last_latency, 3) if self._last_latency else None,
+                'signals': dict(self._counters),
+                'decisions': list(self._decisions)
+            }
+
+    def _update_baseline(self, endpoint: Optional[str], latency: float):
+        """Track healthy latency of an endpoint with a slow moving average"""
+        baseline = self._baselines.get(endpoint)
+        if baseline is None:
+            self._baselines[endpoint] = latency
+        else:
+            self._baselines[endpoint] = 0.9 * baseline + 0.1 * latency
+
+    def _increase(self, latency: float, baseline: Optional[float]):
+        """Additive increase after a full window of healthy calls"""
+        self._healthy_streak += 1
+        if self._healthy_streak < int(self._limit) or self._limit >= self.max_limit:
+            return
+
+        self._healthy_streak = 0
+        self._limit = min(self.max_limit, self._limit + 1)
+        self._record('increase', 'latency_flat', latency, baseline)
+
+    def _decrease(self, signal: str, latency: float, baseline: Optional[float]):
+        """Multiplicative decrease, at most once per baseline latency of the endpoint"""
+        self._healthy_streak = 0
+        now = time.time()
+        if now - self._last_decrease < (baseline or 0.0):
+            return
+
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+        self._record('decrease', signal, latency, baseline)
+
+    def _record(self, action: str, signal: str, latency: float, baseline: Optional[float]):
+        """Remember decision for metrics"""
+        self._decisions.append({
+            'timestamp': round(time.time(), 3),
+            'action': action,
+            'signal': signal,
+            'limit': int(self._limit),
+            'latency': round(latency, 3),
+            'baseline_latency': round(baseline, 3) if baseline else None
+        })
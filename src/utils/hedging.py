@@ -0,0 +1,173 @@
+"""
+Latency hedging for remote inference
+Fire a backup request once the primary runs past a percentile of recent latency
+"""
+
+import time
+import queue
+import threading
+import contextvars
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+PRIMARY = 'primary'
+BACKUP = 'backup'
+
+
+class LatencyTracker:
+    """
+    Sliding window of call latencies with an adaptive hedge threshold
+
+    The threshold is the configured percentile of the last `window`
+    latencies, never below `floor` seconds. Until `min_samples` calls are
+    observed there is no threshold and calls are not hedged.
+    """
+
+    def __init__(self, percentile: float = 0.9, window: int = 200,
+                 min_samples: int = 20, floor: float = 5.0):
+        """
+        Initialize tracker
+
+        Args:
+            percentile: Latency percentile (0-1) after which a call is hedged, 0 disables hedging
+            window: Number of recent latencies kept
+            min_samples: Latencies needed before hedging starts
+            floor: Minimum threshold in seconds
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.floor = floor
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'hedged': 0, 'primary_wins': 0, 'backup_wins': 0, 'both_failed': 0}
+
+    def record(self, latency: float):
+        """Record latency of a finished (or abandoned) call in seconds"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_threshold(self) -> Optional[float]:
+        """
+        Get current hedge delay
+
+        Returns:
+            Seconds to wait before firing the backup, None if hedging is off
+            or there are not enough samples yet
+        """
+        if self.percentile <= 0:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return max(self.floor, ordered[index])
+
+    def note_outcome(self, winner: Optional[str], hedged: bool):
+        """Count result of a hedged call"""
+        with self._lock:
+            self._stats['calls'] += 1
+            if hedged:
+                self._stats['hedged'] += 1
+            if winner is None:
+                self._stats['both_failed'] += 1
+            else:
+                self._stats[f'{winner}_wins'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hedging counters and current threshold"""
+        threshold = self.hedge_threshold()
+        with self._lock:
+            return {
+                **self._stats,
+                'samples': len(self._latencies),
+                'percentile': self.percentile,
+                'threshold': round(threshold, 3) if threshold is not None else None
+            }
+
+
+def hedged_call(primary: Callable[[], Any],
+                backup: Callable[[], Any],
+                delay: float,
+                cancel_primary: Optional[Callable[[], None]] = None,
+                cancel_backup: Optional[Callable[[], None]] = None,
+                accept: Callable[[Any], bool] = lambda result: result is not None,
+                primary_sent: Optional[threading.Event] = None,
+                poll_interval: float = 0.05) -> Tuple[Any, Optional[str], bool]:
+    """
+    Run primary call, starting backup if it is slow or fails
+
+    The backup starts once `delay` seconds pass without an acceptable
+    primary result, or at once if the primary fails earlier. The first
+    acceptable result wins and the other call is cancelled through its
+    cancel hook. With `primary_sent` the delay counts from the moment the
+    primary sets it (e.g. once it got a concurrency slot), so time spent
+    queueing locally does not trigger the backup.
+
+    Args:
+        primary: Preferred call
+        backup: Fallback call
+        delay: Seconds to wait for the primary before hedging
+        cancel_primary: Cancels the running primary (optional)
+        cancel_backup: Cancels the running backup (optional)
+        accept: Whether a result is usable (default: not None)
+        primary_sent: Set by the primary when its request is sent (default: counts from the start)
+        poll_interval: Seconds between checks of primary_sent
+
+    Returns:
+        Tuple of (result or None, PRIMARY/BACKUP/None, whether backup was started)
+    """
+    outcomes = queue.Queue()
+    cancels = {PRIMARY: cancel_primary, BACKUP: cancel_backup}
+    running = set()
+    backup_started = False
+
+    def start(name: str, func: Callable[[], Any]):
+        def run():
+            try:
+                outcomes.put((name, func(), None))
+            except Exception as e:
+                outcomes.put((name, None, e))
+        running.add(name)
+        # Calls keep the caller's context (e.g. rate limit priority)
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(run,), name=f"hedge-{name}", daemon=True).start()
+
+    start(PRIMARY, primary)
+    deadline = time.time() + delay if primary_sent is None else None
+
+    while running:
+        if deadline is None and primary_sent.is_set():
+            deadline = time.time() + delay
+        if backup_started:
+            timeout = None
+        elif deadline is None:
+            timeout = poll_interval
+        else:
+            timeout = max(0.0, deadline - time.time())
+        try:
+            name, result, error = outcomes.get(timeout=timeout)
+        except queue.Empty:
+            if deadline is None or time.time() < deadline:
+                continue
+            start(BACKUP, backup)
+            backup_started = True
+            continue
+
+        running.discard(name)
+        if error is None and accept(result):
+            for other in running:
+                if cancels[other]:
+                    try:
+                        cancels[other]()
+                    except Exception as e:
+                        print(f"⚠️ Не удалось отменить запрос {other}: {e}")
+            return result, name, backup_started
+
+        if not backup_started:
+            # Primary failed before the threshold: no reason to wait
+            start(BACKUP, backup)
+            backup_started = True
+
+    return None, None, backup_started
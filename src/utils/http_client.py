@@ -0,0 +1,186 @@
+"""
+Shared HTTP client for inference APIs
+Connection-pooled keep-alive session with timeouts and bounded streaming downloads
+"""
+
+import io
+import os
+import threading
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5.0, 60.0)
+CHUNK_SIZE = 64 * 1024
+
+# Hosts serving inference results get larger pools than the default
+DEFAULT_HOST_POOL_SIZES = {
+    'fal.media': 64,
+    'v3.fal.media': 64,
+    'api.openai.com': 64,
+}
+
+
+class ResponseTooLarge(ValueError):
+    """Response body exceeds the download limit"""
+
+
+class HttpClient:
+    """
+    Thread-safe pooled HTTP client
+
+    One requests.Session shared by all threads: connections are kept alive
+    and reused per host, so result downloads and API calls skip the TCP/TLS
+    handshake after the first request. Hosts listed in `host_pool_sizes` get
+    their own pool of that size. Downloads stream into a per-thread buffer
+    that is reused between calls and stop once `max_body_bytes` is exceeded.
+    """
+
+    def __init__(self,
+                 pool_size: Optional[int] = None,
+                 host_pool_sizes: Optional[Dict[str, int]] = None,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 max_body_bytes: Optional[int] = None):
+        """
+        Initialize HTTP client
+
+        Args:
+            pool_size: Connections kept per host (default HTTP_POOL_SIZE or 16)
+            host_pool_sizes: Pool size overrides per host name
+            timeout: Default (connect, read) timeout in seconds
+            max_body_bytes: Download size limit (default HTTP_MAX_BODY_MB or 64 MB)
+        """
+        self.pool_size = pool_size or int(os.environ.get('HTTP_POOL_SIZE', 16))
+        self.host_pool_sizes = dict(DEFAULT_HOST_POOL_SIZES if host_pool_sizes is None else host_pool_sizes)
+        self.timeout = timeout
+        self.max_body_bytes = max_body_bytes or int(os.environ.get('HTTP_MAX_BODY_MB', 64)) * 1024 * 1024
+
+        self.session = requests.Session()
+        default_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=self.pool_size)
+        self.session.mount('https://', default_adapter)
+        self.session.mount('http://', default_adapter)
+        for host, size in self.host_pool_sizes.items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self.session.mount(f'https://{host}/', adapter)
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'downloads': 0, 'bytes_downloaded': 0, 'rejected_too_large': 0}
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET through the pooled session with default timeout"""
+        return self._request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST through the pooled session with default timeout"""
+        return self._request('POST', url, **kwargs)
+
+    def download(self, url: str, max_bytes: Optional[int] = None,
+                 timeout: Optional[Union[float, Tuple[float, float]]] = None) -> bytes:
+        """
+        Download response body
+
+        Args:
+            url: URL to fetch
+            max_bytes: Size limit (default client limit)
+            timeout: Request timeout (default client timeout)
+
+        Returns:
+            Response body
+
+        Raises:
+            requests.HTTPError: On non-2xx status
+            ResponseTooLarge: If body exceeds the limit
+        """
+        return self._download_into_buffer(url, max_bytes, timeout).getvalue()
+
+    def download_image(self, url: str, max_bytes: Optional[int] = None,
+                       timeout: Optional[Union[float, Tuple[float, float]]] = None) -> Image.Image:
+        """
+        Download and decode image
+
+        The image is decoded straight from the reusable buffer, without
+        copying the body into a new bytes object.
+
+        Args:
+            url: Image URL
+            max_bytes: Size limit (default client limit)
+            timeout: Request timeout (default client timeout)
+
+        Returns:
+            Decoded PIL Image
+
+        Raises:
+            requests.HTTPError: On non-2xx status
+            ResponseTooLarge: If body exceeds the limit
+        """
+        buffer = self._download_into_buffer(url, max_bytes, timeout)
+        image = Image.open(buffer)
+        # Decode now, the buffer is reused by the next download of this thread
+        image.load()
+        return image
+
+    def stats(self) -> Dict[str, int]:
+        """Get request counters"""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send request with default timeout"""
+        kwargs.setdefault('timeout', self.timeout)
+        self._count('requests')
+        return self.session.request(method, url, **kwargs)
+
+    def _download_into_buffer(self, url: str, max_bytes: Optional[int],
+                              timeout: Optional[Union[float, Tuple[float, float]]]) -> io.BytesIO:
+        """Stream body into this thread's buffer, enforcing the size limit"""
+        limit = max_bytes or self.max_body_bytes
+        buffer = self._buffer()
+
+        with self._request('GET', url, stream=True, timeout=timeout or self.timeout) as response:
+            response.raise_for_status()
+
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > limit:
+                self._count('rejected_too_large')
+                raise ResponseTooLarge(f"{urlsplit(url).netloc}: {content_length} bytes > {limit}")
+
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    self._count('rejected_too_large')
+                    raise ResponseTooLarge(f"{urlsplit(url).netloc}: body exceeds {limit} bytes")
+                buffer.write(chunk)
+
+        self._count('downloads')
+        self._count('bytes_downloaded', size)
+        buffer.seek(0)
+        return buffer
+
+    def _buffer(self) -> io.BytesIO:
+        """Get emptied per-thread download buffer"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = io.BytesIO()
+        buffer.seek(0)
+        buffer.truncate()
+        return buffer
+
+    def _count(self, key: str, amount: int = 1):
+        """Increment counter"""
+        with self._stats_lock:
+            self._stats[key] += amount
+
+
+# Global instance
+http_client = HttpClient()
@@ -0,0 +1,84 @@
+"""
+Resolution handling around remote inference
+Downscale inputs to the model limit, restore outputs to the upload resolution
+"""
+
+from typing import Tuple
+
+from PIL import Image
+
+
+# Limit used when a model spec does not give one (BiRefNet works at 1024)
+DEFAULT_MAX_RESOLUTION = (1024, 1024)
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    """
+    Parse 'WIDTHxHEIGHT' resolution string
+
+    Args:
+        value: Resolution like '1024x1024'
+
+    Returns:
+        (width, height), DEFAULT_MAX_RESOLUTION if the value is malformed
+    """
+    try:
+        width, height = (int(part) for part in str(value).lower().split('x'))
+    except ValueError:
+        return DEFAULT_MAX_RESOLUTION
+    if width <= 0 or height <= 0:
+        return DEFAULT_MAX_RESOLUTION
+    return width, height
+
+
+def fit_within(image: Image.Image, max_size: Tuple[int, int]) -> Image.Image:
+    """
+    Downscale image to fit the model's max resolution
+
+    The limit is applied to pixel count rather than per side, so a tall
+    1200x2400 photo becomes ~724x1448 (same area as 1024x1024) instead of
+    being squeezed to 512x1024.
+
+    Args:
+        image: Source image
+        max_size: Model limit (width, height)
+
+    Returns:
+        Downscaled copy, or the image itself if it already fits
+    """
+    max_pixels = max_size[0] * max_size[1]
+    pixels = image.width * image.height
+    if pixels <= max_pixels:
+        return image
+
+    scale = (max_pixels / pixels) ** 0.5
+    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def restore_resolution(original: Image.Image, result: Image.Image) -> Image.Image:
+    """
+    Bring inference result back to the source resolution
+
+    Results with alpha (background removal masks) keep the original pixels:
+    the upscaled alpha channel is applied to the full-resolution source, so
+    product detail is never resampled. Opaque results are upscaled with
+    Lanczos resampling.
+
+    Args:
+        original: Full-resolution source image
+        result: Result of inference on the downscaled image
+
+    Returns:
+        Result at the source resolution
+    """
+    if result.size == original.size:
+        return result
+
+    if result.mode in ('RGBA', 'LA') or 'transparency' in result.info:
+        mask = result.convert('RGBA').getchannel('A').resize(original.size, Image.LANCZOS)
+        restored = original.convert('RGBA')
+        restored.putalpha(mask)
+        return restored
+
+    return result.resize(original.size, Image.LANCZOS)
@@ -0,0 +1,130 @@
+"""
+Micro-batching of concurrent calls
+Items submitted by concurrent workers within a short window are processed by one batch call
+"""
+
+import time
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+class _Batch:
+    """Items collected for one batch call"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.futures: List[Future] = []
+        self.closed = False
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Group concurrent submissions into batch calls
+
+    The worker that opens a batch becomes its leader: it waits until the
+    batch holds `max_batch` items or `max_wait` seconds pass, closes it and
+    runs `func` on the collected items. Other workers only add their item
+    and wait for their share of the result, so a lone request is delayed by
+    at most `max_wait` and no extra thread is needed.
+    """
+
+    def __init__(self, func: Callable[[List[Any]], List[Any]], max_batch: int,
+                 max_wait: float = 0.2, name: str = 'batch'):
+        """
+        Initialize batcher
+
+        Args:
+            func: Batch call returning one result per item, in order
+            max_batch: Items per batch call (1 or less disables batching)
+            max_wait: Seconds the leader waits for more items
+            name: Batcher name for logs and metrics
+        """
+        self.func = func
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self._open = None
+        self._lock = threading.Lock()
+        self._stats = {'items': 0, 'batches': 0, 'errors': 0, 'max_size': 0}
+
+    def submit(self, item: Any) -> Any:
+        """
+        Process item as part of a batch
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Result of func for this item
+
+        Raises:
+            Exception: Error of the batch call, raised to every item of the batch
+        """
+        if self.max_batch <= 1:
+            return self._run([item])[0]
+
+        future = Future()
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= self.max_batch:
+                self._close(batch)
+
+        if not leader:
+            return future.result()
+
+        batch.full.wait(timeout=self.max_wait)
+        with self._lock:
+            self._close(batch)
+
+        try:
+            results = self._run(batch.items)
+            if len(results) != len(batch.items):
+                raise ValueError(f"{self.name}: batch call returned {len(results)} results "
+                                 f"for {len(batch.items)} items")
+        except BaseException as e:
+            for waiting in batch.futures:
+                waiting.set_exception(e)
+        else:
+            for waiting, result in zip(batch.futures, results):
+                waiting.set_result(result)
+        return future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get batch counters"""
+        with self._lock:
+            batches = self._stats['batches']
+            return {**self._stats,
+                    'avg_size': round(self._stats['items'] / batches, 2) if batches else 0.0}
+
+    def _close(self, batch: _Batch):
+        """Stop adding items to batch (lock must be held)"""
+        if not batch.closed:
+            batch.closed = True
+            batch.full.set()
+            if self._open is batch:
+                self._open = None
+
+    def _run(self, items: List[Any]) -> List[Any]:
+        """Run batch call and count it"""
+        started = time.time()
+        try:
+            results = self.func(items)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats['items'] += len(items)
+                self._stats['batches'] += 1
+                self._stats['max_size'] = max(self._stats['max_size'], len(items))
+        if len(items) > 1:
+            print(f"📦 {self.name}: {len(items)} запросов объединены в один ({time.time() - started:.2f}s)")
+        return results
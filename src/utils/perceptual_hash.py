@@ -0,0 +1,164 @@
+"""
+Perceptual image hashing and Hamming-distance lookup
+Finds near-duplicate uploads (recompressed, resized, slightly cropped shots)
+"""
+
+from itertools import combinations
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from PIL import Image
+
+
+HASH_BITS = 64
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Compute difference hash of an image
+
+    Each bit tells whether a pixel of the downscaled grayscale image is
+    brighter than its right neighbour, so the hash survives JPEG
+    recompression, rescaling and small crops.
+
+    Args:
+        image: PIL Image object
+        hash_size: Hash side length (hash has hash_size ** 2 bits)
+
+    Returns:
+        Hash as integer
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits of two hashes"""
+    return _popcount(a ^ b)
+
+
+# int.bit_count is much faster but only exists on Python 3.10+
+if hasattr(int, 'bit_count'):
+    _popcount = int.bit_count
+else:
+    def _popcount(value: int) -> int:
+        return bin(value).count('1')
+
+
+def hash_to_hex(value: int) -> str:
+    """Format hash for storage (SQLite integers are signed, so hashes are kept as text)"""
+    return f"{value:016x}"
+
+
+def hash_from_hex(value: str) -> int:
+    """Parse stored hash"""
+    return int(value, 16)
+
+
+class HammingIndex:
+    """
+    Multi-index hash table for Hamming-radius search over 64-bit hashes
+
+    The hash is split into `chunks` substrings with one exact-match table
+    each. Two hashes within max_distance bits have at least one substring
+    within max_distance // chunks bits (pigeonhole), so a lookup probes only
+    those substring neighbours and checks the few candidates found. With
+    ~21-bit substrings a million entries leave most buckets empty, so the
+    lookup cost stays flat as history grows, unlike a BK-tree whose search
+    visits a growing share of the tree at radius 6 over 64 bits.
+    """
+
+    def __init__(self, max_distance: int = 6, chunks: int = 3):
+        """
+        Initialize index
+
+        Args:
+            max_distance: Largest Hamming distance treated as a match
+            chunks: Number of substrings the hash is split into
+        """
+        self.max_distance = max_distance
+        self.chunk_radius = max_distance // chunks
+        self._hashes: List[int] = []
+        self._values: List[Any] = []
+        self._exact: Dict[int, int] = {}
+
+        # (offset, mask, neighbour flips) per substring, widths differ by at most one bit
+        self._chunks = []
+        self._tables: List[Dict[int, List[int]]] = []
+        offset = 0
+        for i in range(chunks):
+            width = HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0)
+            self._chunks.append((offset, (1 << width) - 1, self._neighbour_flips(width)))
+            self._tables.append({})
+            offset += width
+
+    def _neighbour_flips(self, width: int) -> List[int]:
+        """Bit flips that keep a substring within chunk_radius"""
+        flips = [0]
+        for radius in range(1, self.chunk_radius + 1):
+            for bits in combinations(range(width), radius):
+                flip = 0
+                for bit in bits:
+                    flip |= 1 << bit
+                flips.append(flip)
+        return flips
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, value_hash: int, value: Any):
+        """
+        Add hash with associated value
+
+        Args:
+            value_hash: 64-bit hash
+            value: Value returned by find (e.g. row id or analysis)
+        """
+        position = len(self._hashes)
+        self._exact.setdefault(value_hash, position)
+        self._hashes.append(value_hash)
+        self._values.append(value)
+        for table, (offset, mask, _) in zip(self._tables, self._chunks):
+            table.setdefault((value_hash >> offset) & mask, []).append(position)
+
+    def find(self, value_hash: int,
+             accept: Optional[Callable[[Any], bool]] = None) -> Optional[Tuple[int, Any]]:
+        """
+        Find closest stored hash within max_distance
+
+        Args:
+            value_hash: 64-bit hash to look up
+            accept: Optional check of a candidate's value; rejected candidates are skipped
+
+        Returns:
+            Tuple of (distance, value) or None if nothing is close enough
+        """
+        if self.max_distance < 0:
+            return None
+
+        exact = self._exact.get(value_hash)
+        if exact is not None and (accept is None or accept(self._values[exact])):
+            return 0, self._values[exact]
+
+        best_distance, best_position = self.max_distance + 1, None
+        hashes = self._hashes
+        for table, (offset, mask, flips) in zip(self._tables, self._chunks):
+            chunk = (value_hash >> offset) & mask
+            for flip in flips:
+                bucket = table.get(chunk ^ flip)
+                if not bucket:
+                    continue
+                for position in bucket:
+                    distance = _popcount(value_hash ^ hashes[position])
+                    if distance < best_distance and (accept is None or accept(self._values[position])):
+                        best_distance, best_position = distance, position
+
+        if best_position is None:
+            return None
+        return best_distance, self._values[best_position]
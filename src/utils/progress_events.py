@@ -0,0 +1,134 @@
+"""
+Progress event log for Server-Sent Events
+Keeps per-batch progress deltas so clients can resume after reconnects
+"""
+
+import json
+import time
+import threading
+from typing import Dict, Any, List, Iterator, Optional
+
+
+class ProgressEventLog:
+    """
+    Append-only event log per progress stream (batch or single processing)
+
+    Producers publish small deltas; SSE clients read every event after the
+    last ID they saw, so a reconnect with Last-Event-ID continues where the
+    previous connection stopped. Closed streams are dropped after
+    `retention` seconds.
+    """
+
+    def __init__(self, retention: float = 3600.0):
+        """
+        Initialize event log
+
+        Args:
+            retention: Seconds a closed stream is kept for late readers
+        """
+        self.retention = retention
+        self._streams: Dict[str, Dict[str, Any]] = {}
+        self._condition = threading.Condition()
+
+    def open(self, stream_id: str):
+        """Create empty stream (replaces a previous stream with the same ID)"""
+        with self._condition:
+            self._expire()
+            self._streams[stream_id] = {'events': [], 'closed_at': None}
+
+    def publish(self, stream_id: str, event: str, data: Dict[str, Any]) -> int:
+        """
+        Append event to stream
+
+        Args:
+            stream_id: Batch or processing ID
+            event: Event name
+            data: JSON-serializable payload
+
+        Returns:
+            Event ID
+        """
+        with self._condition:
+            stream = self._streams.setdefault(stream_id, {'events': [], 'closed_at': None})
+            event_id = len(stream['events']) + 1
+            stream['events'].append({'id': event_id, 'event': event, 'data': data})
+            self._condition.notify_all()
+            return event_id
+
+    def close(self, stream_id: str):
+        """Mark stream finished, readers stop after its last event"""
+        with self._condition:
+            if stream_id in self._streams:
+                self._streams[stream_id]['closed_at'] = time.time()
+            self._condition.notify_all()
+
+    def has_stream(self, stream_id: str) -> bool:
+        """Check whether stream exists"""
+        with self._condition:
+            return stream_id in self._streams
+
+    def events_after(self, stream_id: str, last_event_id: int = 0,
+                     timeout: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get events after given ID, waiting for new ones if there are none
+
+        Args:
+            stream_id: Batch or processing ID
+            last_event_id: ID of last event the client has
+            timeout: Max seconds to wait (None waits until an event or close)
+
+        Returns:
+            List of events (empty on timeout), or None if the stream is
+            unknown or closed with nothing left to read
+        """
+        with self._condition:
+            while True:
+                stream = self._streams.get(stream_id)
+                if stream is None:
+                    return None
+                if len(stream['events']) > last_event_id:
+                    return stream['events'][last_event_id:]
+                if stream['closed_at'] is not None:
+                    return None
+                if not self._condition.wait(timeout):
+                    return []
+
+    def stream(self, stream_id: str, last_event_id: int = 0,
+               keepalive: float = 15.0) -> Iterator[str]:
+        """
+        Generate SSE-formatted events until the stream closes
+
+        Args:
+            stream_id: Batch or processing ID
+            last_event_id: ID of last event the client has (from Last-Event-ID)
+            keepalive: Seconds between comment lines keeping proxies from timing out
+
+        Yields:
+            SSE text chunks
+        """
+        yield "retry: 2000\n\n"
+        while True:
+            events = self.events_after(stream_id, last_event_id, keepalive)
+            if events is None:
+                return
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                last_event_id = event['id']
+                yield self.format_sse(event)
+
+    @staticmethod
+    def format_sse(event: Dict[str, Any]) -> str:
+        """Format event as SSE message"""
+        return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    def _expire(self):
+        """Drop closed streams past retention (lock must be held)"""
+        now = time.time()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream['closed_at'] is not None and now - stream['closed_at'] > self.retention
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
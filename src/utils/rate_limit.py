@@ -0,0 +1,339 @@
+"""
+Process-wide rate limiting for remote providers
+Token buckets for requests and tokens per provider, priority queueing and Retry-After backoff
+"""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+# Caller priorities (lower is served first)
+INTERACTIVE = 0
+BATCH = 10
+
+# Seconds of budget that may be spent in one burst
+BURST_SECONDS = 10.0
+
+# Backoff after a 429 without Retry-After: doubles per consecutive 429 up to the max
+DEFAULT_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+_priority = contextvars.ContextVar('rate_limit_priority', default=BATCH)
+
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """
+    Set priority of provider calls made in this context
+
+    Args:
+        priority: INTERACTIVE or BATCH
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    """Priority of calls made in this context (BATCH unless set)"""
+    return _priority.get()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse Retry-After header
+
+    Args:
+        value: Header value, seconds or HTTP date
+
+    Returns:
+        Seconds to wait, None if missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_from(source: Any) -> Optional[float]:
+    """
+    Get Retry-After of a response or of an exception carrying one
+
+    Args:
+        source: requests/httpx response or exception with `.response`
+
+    Returns:
+        Seconds to wait, None if the header is absent
+    """
+    response = getattr(source, 'response', None) or source
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    return parse_retry_after(headers.get('Retry-After') or headers.get('retry-after'))
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` per second up to `capacity` (not thread-safe)"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initialize bucket (full)
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def refill(self):
+        """Add tokens earned since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available"""
+        self.refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        """Remove tokens (balance may go negative after an adjustment)"""
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Request and token budget of one provider account, shared by the whole process
+
+    Callers queue in priority order (FIFO within a priority) and only the
+    head of the queue takes budget, so an interactive request waits for
+    the budget itself, not for every queued batch call. A 429 blocks the
+    whole queue for the Retry-After period (or an exponential backoff when
+    the provider sends none), so no call is wasted on a known rejection.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = 0):
+        """
+        Initialize rate limiter
+
+        Args:
+            name: Provider name for metrics
+            requests_per_minute: Request budget (0 = unlimited)
+            tokens_per_minute: Token budget (0 = unlimited)
+        """
+        self.name = name
+        self.requests = self._bucket(requests_per_minute)
+        self.tokens = self._bucket(tokens_per_minute)
+
+        self._blocked_until = 0.0
+        self._backoff = DEFAULT_BACKOFF
+        self._waiters = []
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+        self._stats = {'granted': 0, 'queued': 0, 'wait_seconds': 0.0, 'rate_limited': 0,
+                       'interactive': 0, 'batch': 0}
+
+    @staticmethod
+    def _bucket(per_minute: float) -> Optional[TokenBucket]:
+        """Bucket for a per-minute budget, None when unlimited"""
+        if not per_minute:
+            return None
+        rate = per_minute / 60.0
+        return TokenBucket(rate, max(1.0, rate * BURST_SECONDS))
+
+    def acquire(self, tokens: float = 0, priority: Optional[int] = None, timeout: Optional[float] = None) -> float:
+        """
+        Wait for budget of one request
+
+        Args:
+            tokens: Estimated tokens of the request
+            priority: Queue priority (default from request_priority context)
+            timeout: Max seconds to wait (None = no limit)
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            TimeoutError: If the budget was not available in time
+        """
+        ticket = self._enqueue(priority)
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._condition:
+            try:
+                while True:
+                    wait = self._try_take(ticket, tokens)
+                    if wait == 0:
+                        return self._granted(ticket, started)
+                    if deadline is not None:
+                        if time.monotonic() >= deadline:
+                            raise TimeoutError(f"{self.name}: rate limit budget not available in {timeout}s")
+                        wait = min(wait, deadline - time.monotonic()) if wait else deadline - time.monotonic()
+                    self._condition.wait(timeout=wait)
+            except BaseException:
+                self._dequeue(ticket)
+                raise
+
+    def adjust_tokens(self, delta: float):
+        """Charge (positive) or refund (negative) tokens once actual usage is known"""
+        if self.tokens is None or not delta:
+            return
+        with self._condition:
+            self.tokens.take(delta)
+            self._condition.notify_all()
+
+    def backoff(self, retry_after: Optional[float] = None):
+        """
+        Stop granting budget after a 429
+
+        Args:
+            retry_after: Seconds from the Retry-After header (None = exponential backoff)
+        """
+        with self._condition:
+            if retry_after is None:
+                retry_after = self._backoff
+                self._backoff = min(MAX_BACKOFF, self._backoff * 2)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self._stats['rate_limited'] += 1
+            print(f"⏳ {self.name}: лимит провайдера, запросы приостановлены на {retry_after:.1f}s")
+
+    def note_success(self):
+        """Reset exponential backoff after a call that was not rate limited"""
+        with self._condition:
+            self._backoff = DEFAULT_BACKOFF
+
+    def stats(self) -> Dict[str, Any]:
+        """Get budgets, queue length and counters"""
+        with self._condition:
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill()
+            return {
+                **self._stats,
+                'wait_seconds': round(self._stats['wait_seconds'], 3),
+                'waiting': len(self._waiters),
+                'blocked_for': round(max(0.0, self._blocked_until - time.monotonic()), 3),
+                'requests_available': round(self.requests.tokens, 1) if self.requests else None,
+                'tokens_available': round(self.tokens.tokens) if self.tokens else None
+            }
+
+    def _enqueue(self, priority: Optional[int]) -> tuple:
+        """Add waiter to priority queue"""
+        priority = current_priority() if priority is None else priority
+        with self._condition:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiters, ticket)
+            return ticket
+
+    def _dequeue(self, ticket: tuple):
+        """Remove abandoned waiter (condition must be held)"""
+        if ticket in self._waiters:
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+            self._condition.notify_all()
+
+    def _try_take(self, ticket: tuple, tokens: float) -> Optional[float]:
+        """
+        Take budget if ticket is first in queue (condition must be held)
+
+        Returns:
+            0 if taken, seconds to wait for budget, or None if other waiters are ahead
+        """
+        if self._waiters[0] != ticket:
+            return None
+
+        wait = self._blocked_until - time.monotonic()
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.wait_time(min(tokens, self.tokens.capacity)))
+        if wait > 0:
+            return wait
+
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None and tokens:
+            self.tokens.take(tokens)
+        return 0
+
+    def _granted(self, ticket: tuple, started: float) -> float:
+        """Pop granted ticket and count it (condition must be held)"""
+        heapq.heappop(self._waiters)
+        self._condition.notify_all()
+        waited = time.monotonic() - started
+        self._stats['granted'] += 1
+        self._stats['interactive' if ticket[0] <= INTERACTIVE else 'batch'] += 1
+        if waited > 0.001:
+            self._stats['queued'] += 1
+            self._stats['wait_seconds'] += waited
+        return waited
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check whether exception carries HTTP status 429"""
+    status_code = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    return status_code == 429
+
+
+def retry_rate_limited(func: Callable[[], Any], retries: Optional[int] = None,
+                       is_rate_limited: Optional[Callable[[Exception], bool]] = None,
+                       rejected: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Run call again when the provider rejects it with 429
+
+    The limiter that saw the 429 already blocks new calls until Retry-After
+    passes, so the retry simply queues for budget again.
+
+    Args:
+        func: Call going through a rate-limited slot
+        retries: Extra attempts (default RATE_LIMIT_RETRIES or 3)
+        is_rate_limited: Whether an exception is a 429 (default is_rate_limit_error)
+        rejected: Whether a returned result is a 429 (for calls returning an HTTP
+            response instead of raising); the last result is returned as is
+
+    Returns:
+        Result of the call
+    """
+    retries = int(os.environ.get('RATE_LIMIT_RETRIES', 3)) if retries is None else retries
+    is_rate_limited = is_rate_limited or is_rate_limit_error
+
+    for attempt in range(retries + 1):
+        try:
+            result = func()
+        except Exception as e:
+            if attempt == retries or not is_rate_limited(e):
+                raise
+        else:
+            if attempt == retries or rejected is None or not rejected(result):
+                return result
+        print(f"🔁 Повтор после 429 ({attempt + 1}/{retries})")
+
+
+# Global instances: one budget per provider account for every processor in the process
+rate_limiters = {
+    'openai': RateLimiter('openai',
+                          requests_per_minute=float(os.environ.get('OPENAI_RPM', 500)),
+                          tokens_per_minute=float(os.environ.get('OPENAI_TPM', 200000))),
+    'fal': RateLimiter('fal', requests_per_minute=float(os.environ.get('FAL_RPM', 600)))
+}
@@ -0,0 +1,164 @@
+"""
+Content-addressed cache of background removal results
+Repeated uploads with the same request settings are served from disk
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from PIL import Image
+
+
+class ResultCache:
+    """
+    On-disk LRU cache of RGBA results keyed by source pixels and request settings
+
+    Entries are PNG files named by their key. Recency is kept in memory and
+    mirrored to file mtimes, so the LRU order survives restarts. When the
+    total size exceeds max_bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Initialize cache
+
+        Args:
+            cache_dir: Directory for cached results (default BG_CACHE_DIR or cache/background)
+            max_bytes: Size budget in bytes (default BG_CACHE_MAX_MB or 2048 MB)
+        """
+        self.cache_dir = Path(cache_dir or os.environ.get('BG_CACHE_DIR', 'cache/background'))
+        self.max_bytes = max_bytes or int(os.environ.get('BG_CACHE_MAX_MB', 2048)) * 1024 * 1024
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._total_bytes = 0
+        self._load_index()
+
+    @staticmethod
+    def make_key(image: Image.Image, settings: Dict[str, Any]) -> str:
+        """
+        Build cache key for a request
+
+        Args:
+            image: Source image sent to the model
+            settings: Request settings that change the result (prompt, model id,
+                LoRA path, guidance_scale, num_inference_steps)
+
+        Returns:
+            Hex SHA-256 key
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+        digest.update(image.tobytes())
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """
+        Get cached result
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            RGBA image or None on miss
+        """
+        path = self._path(key)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            image = Image.open(path)
+            image.load()
+            os.utime(path)
+        except OSError:
+            # File removed behind our back, treat as miss
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return image
+
+    def put(self, key: str, image: Image.Image):
+        """
+        Store result and evict least recently used entries over the budget
+
+        Args:
+            key: Cache key from make_key
+            image: Result image
+        """
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        image.save(tmp_path, format='PNG')
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters and size
+
+        Returns:
+            Dict suitable for metrics JSON
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _path(self, key: str) -> Path:
+        """File path of a cache entry"""
+        return self.cache_dir / f"{key}.png"
+
+    def _load_index(self):
+        """Rebuild LRU order from files left by previous runs"""
+        files = sorted(self.cache_dir.glob('*.png'), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _forget(self, key: str):
+        """Drop entry from index (lock must be held)"""
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        """Remove oldest entries until within budget (lock must be held)"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
@@ -0,0 +1,120 @@
+"""
+Single-flight request coalescing
+Concurrent calls with the same key share one in-flight call instead of duplicating it
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesce identical in-flight calls
+
+    The first caller of a key (the leader) runs the call; callers arriving
+    while it is in flight wait for the leader's result or error instead of
+    issuing their own. Once the call finishes the key is forgotten, so this
+    only covers the window before a result is stored in a cache — later
+    requests are the caches' job.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize single-flight group
+
+        Args:
+            name: Group name for logs and metrics
+        """
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run call once for all concurrent callers of a key
+
+        Args:
+            key: Identity of the call (content hash + prompt + model params)
+            func: Call to run if no identical call is in flight
+
+        Returns:
+            Tuple of (result, whether it was shared from another caller's call)
+
+        Raises:
+            Exception: Error of the call, re-raised to every waiting caller
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            self._stats['leaders' if leader else 'coalesced'] += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, failed=True)
+            future.set_exception(e)
+            raise
+        self._finish(key, future)
+        future.set_result(result)
+        return result, False
+
+    def attach(self, key: Hashable, start: Callable[[], Future]) -> Tuple[Future, bool]:
+        """
+        Share a future-returning call (e.g. a queued request) between concurrent callers
+
+        Args:
+            key: Identity of the call
+            start: Starts the call and returns its future, run only by the leader
+
+        Returns:
+            Tuple of (future of the call, whether it was shared)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                return future, True
+            # Reserve the key before starting, so a concurrent caller waits for this call
+            future = self._calls[key] = Future()
+            self._stats['leaders'] += 1
+
+        try:
+            started = start()
+        except BaseException as e:
+            self._finish(key, future, failed=True)
+            future.set_exception(e)
+            raise
+
+        def forward(done: Future):
+            if done.cancelled():
+                self._finish(key, future)
+                future.cancel()
+            elif done.exception() is not None:
+                self._finish(key, future, failed=True)
+                future.set_exception(done.exception())
+            else:
+                self._finish(key, future)
+                future.set_result(done.result())
+
+        started.add_done_callback(forward)
+        return future, False
+
+    def stats(self) -> Dict[str, int]:
+        """Get dedupe counters"""
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._calls)}
+
+    def _finish(self, key: Hashable, future: Future, failed: bool = False):
+        """Forget finished call so the next caller starts a new one"""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            if failed:
+                self._stats['errors'] += 1
@@ -0,0 +1,191 @@
+"""
+Speculative execution of remote calls
+Start a call with guessed inputs while the real inputs are still being computed
+"""
+
+import os
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _CancelScope:
+    """Cancel hooks of the remote requests made by one speculative call"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._hooks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def add(self, cancel: Callable[[], None]):
+        """Register hook, running it at once if the call was already discarded"""
+        with self._lock:
+            if not self.cancelled:
+                self._hooks.append(cancel)
+                return
+        cancel()
+
+    def cancel(self):
+        """Run every registered hook"""
+        with self._lock:
+            self.cancelled = True
+            hooks, self._hooks = self._hooks, []
+        for hook in hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"⚠️ Не удалось отменить спекулятивный запрос: {e}")
+
+
+_current_scope: contextvars.ContextVar[Optional[_CancelScope]] = contextvars.ContextVar(
+    'speculation_scope', default=None)
+
+
+def speculating() -> bool:
+    """Whether the caller runs inside a speculative call (remote requests should be cancellable)"""
+    return _current_scope.get() is not None
+
+
+def on_discard(cancel: Callable[[], None]):
+    """
+    Register how to cancel a remote request started by the running speculative call
+
+    Args:
+        cancel: Cancels the request (e.g. fal handle cancel); ignored outside speculation
+    """
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.add(cancel)
+
+
+def start_call(func: Callable[[], Any], name: str = "call") -> Future:
+    """
+    Run call whose inputs are already final in its own thread
+
+    Unlike speculative calls it is not bounded by a Speculator pool, so an
+    interactive request never queues behind speculative work.
+
+    Args:
+        func: Call to run (keeps the caller's context, e.g. rate limit priority)
+        name: Thread name
+
+    Returns:
+        Future of the call
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), name=name, daemon=True).start()
+    return future
+
+
+class Speculator:
+    """
+    Runs calls ahead of the inputs they depend on
+
+    A speculative call starts with a guess (e.g. a generic prompt) and runs
+    in a small pool while the caller computes the real input. Once the real
+    input is known the caller resolves the speculation: the result is kept
+    if the guess was good enough, otherwise the caller re-issues the call.
+    An abandoned speculative call still finishes in the background, so its
+    result may warm caches but is never used. A call whose job is dropped
+    (e.g. analysis raised) is discarded instead: its remote requests are
+    cancelled through the hooks registered with on_discard.
+    """
+
+    def __init__(self, name: str, max_workers: Optional[int] = None):
+        """
+        Initialize speculator
+
+        Args:
+            name: Name for logs and metrics
+            max_workers: Concurrent speculative calls (default SPECULATIVE_WORKERS or 4)
+        """
+        self.name = name
+        self.max_workers = max_workers or int(os.environ.get('SPECULATIVE_WORKERS', 4))
+        self._pool = None
+        self._lock = threading.Lock()
+        self._scopes: Dict[Future, _CancelScope] = {}
+        self._stats = {'started': 0, 'kept': 0, 'reissued': 0, 'failed': 0, 'discarded': 0}
+
+    def start(self, func: Callable[[], Any]) -> Future:
+        """
+        Start speculative call
+
+        Args:
+            func: Call with guessed inputs (runs in the caller's context, e.g. rate limit priority)
+
+        Returns:
+            Future of the call
+        """
+        scope = _CancelScope()
+
+        def run() -> Any:
+            _current_scope.set(scope)
+            return func()
+
+        self._count('started')
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix=f"speculative-{self.name}")
+            future = self._pool.submit(contextvars.copy_context().run, run)
+            self._scopes[future] = scope
+        return future
+
+    def resolve(self, future: Future, guess_ok: bool) -> Optional[Any]:
+        """
+        Take result of speculative call once the real inputs are known
+
+        Args:
+            future: Future returned by start
+            guess_ok: Whether the real inputs would not materially change the call
+
+        Returns:
+            Result of the call, or None if it must be re-issued (bad guess or failure)
+        """
+        with self._lock:
+            self._scopes.pop(future, None)
+        if not guess_ok:
+            self._count('reissued')
+            return None
+
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"⚠️ {self.name}: спекулятивный вызов завершился ошибкой, повторяем: {e}")
+            result = None
+        self._count('kept' if result is not None else 'failed')
+        return result
+
+    def discard(self, future: Future):
+        """
+        Drop speculative call whose job will not use it, cancelling its remote requests
+
+        Args:
+            future: Future returned by start (no-op if already resolved or discarded)
+        """
+        with self._lock:
+            scope = self._scopes.pop(future, None)
+        if scope is None:
+            return
+        self._count('discarded')
+        future.cancel()
+        scope.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get speculation counters"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key: str):
+        """Increment counter"""
+        with self._lock:
+            self._stats[key] += 1
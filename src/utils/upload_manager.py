@@ -0,0 +1,167 @@
+"""
+Upload manager for inference inputs
+Uploads each source image once and reuses its URL instead of inline base64 data URLs
+"""
+
+import io
+import os
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
+from PIL import Image
+
+
+# Upload modes
+FAL_STORAGE = 'fal'
+INLINE = 'inline'
+
+
+def encode_data_url(image: Image.Image) -> str:
+    """Encode image as PNG data URL"""
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return f"data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode()}"
+
+
+def content_hash(image: Image.Image) -> str:
+    """SHA-256 of image mode, size and pixels"""
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def fal_upload(data: bytes, content_type: str) -> str:
+    """Upload bytes to fal.ai storage and return file URL"""
+    import fal_client
+    return fal_client.upload(data, content_type)
+
+
+class UploadManager:
+    """
+    Content-addressed upload cache for source images
+
+    The first request for an image PNG-encodes it once and pushes it to
+    storage (fal.ai storage by default); every later request for the same
+    pixels — LoRA call, BiRefNet fallback, retries, GPT analysis — gets the
+    stored URL. Concurrent requests for one image wait for a single upload.
+    Entries expire after `ttl` seconds so URLs past the storage lifetime are
+    never handed out. In inline mode, or when uploading fails, a data URL is
+    returned instead.
+    """
+
+    def __init__(self,
+                 uploader: Optional[Callable[[bytes, str], str]] = None,
+                 mode: Optional[str] = None,
+                 ttl: Optional[float] = None,
+                 max_entries: int = 4096):
+        """
+        Initialize upload manager
+
+        Args:
+            uploader: Function (data, content_type) -> URL (default fal.ai storage)
+            mode: 'fal' or 'inline' (default UPLOAD_MODE or 'fal')
+            ttl: Seconds an uploaded URL is reused (default UPLOAD_TTL or 3600)
+            max_entries: Max remembered uploads
+        """
+        self.uploader = uploader or fal_upload
+        self.mode = mode or os.environ.get('UPLOAD_MODE', FAL_STORAGE)
+        self.ttl = ttl if ttl is not None else float(os.environ.get('UPLOAD_TTL', 3600))
+        self.max_entries = max_entries
+
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        # key -> [lock, threads holding or waiting for it]
+        self._key_locks: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'uploads': 0, 'hits': 0, 'expired': 0, 'failed': 0, 'bytes_uploaded': 0}
+
+    def url_for(self, image: Image.Image, key: Optional[str] = None,
+                prepare: Optional[Callable[[Image.Image], Image.Image]] = None) -> str:
+        """
+        Get URL of image for inference requests, uploading it on first use
+
+        Args:
+            image: Source image
+            key: Cache key (default content hash of image); must identify the prepared image
+            prepare: Transform applied before upload (e.g. downscale), run only on a cache miss
+
+        Returns:
+            Uploaded file URL, or data URL in inline mode / on upload failure
+        """
+        if self.mode == INLINE:
+            return encode_data_url(prepare(image) if prepare else image)
+
+        key = key or content_hash(image)
+        with self._key_lock(key):
+            url = self._lookup(key)
+            if url is not None:
+                return url
+
+            if prepare:
+                image = prepare(image)
+            buffered = io.BytesIO()
+            image.save(buffered, format="PNG")
+            data = buffered.getvalue()
+            try:
+                url = self.uploader(data, 'image/png')
+            except Exception as e:
+                print(f"⚠️ Не удалось загрузить изображение в хранилище, используем data URL: {e}")
+                self._count('failed')
+                return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+            with self._lock:
+                self._entries[key] = {'url': url, 'uploaded_at': time.time()}
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._stats['uploads'] += 1
+                self._stats['bytes_uploaded'] += len(data)
+            return url
+
+    def stats(self) -> Dict[str, Any]:
+        """Get upload statistics"""
+        with self._lock:
+            return {**self._stats, 'mode': self.mode, 'entries': len(self._entries)}
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """Get fresh URL for key, dropping it if expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['uploaded_at'] > self.ttl:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry['url']
+
+    @contextmanager
+    def _key_lock(self, key: str) -> Iterator[None]:
+        """
+        Hold lock serializing uploads of one image
+
+        The lock is shared by every thread holding or waiting for it and is
+        dropped when the last one leaves, so two threads never get different
+        locks for one key.
+        """
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+    def _count(self, key: str):
+        """Increment counter"""
+        with self._lock:
+            self._stats[key] += 1
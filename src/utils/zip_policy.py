@@ -0,0 +1,53 @@
+"""
+Per-entry compression policy for result archives
+Already-compressed images are stored as-is, text is deflated
+"""
+
+import os
+import zipfile
+from typing import Union
+
+
+# Formats with their own compression: deflating them costs CPU and saves ~nothing
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.avif', '.zip'}
+
+
+def compression_for(arcname: str) -> int:
+    """
+    Choose compression method for archive entry
+
+    Args:
+        arcname: Entry name inside archive
+
+    Returns:
+        zipfile.ZIP_STORED for compressed image formats, zipfile.ZIP_DEFLATED otherwise
+    """
+    if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def open_zip(file: Union[str, os.PathLike, object]) -> zipfile.ZipFile:
+    """
+    Open ZIP archive for writing with ZIP64 enabled
+
+    ZIP64 records are added automatically once an archive passes 4 GB or
+    65535 entries, so very large batches stay readable.
+    """
+    return zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+
+
+def write_entry(zipf: zipfile.ZipFile, arcname: str, source: Union[str, bytes]):
+    """
+    Write file path or bytes to archive using the compression policy
+
+    Args:
+        zipf: Archive opened for writing
+        arcname: Entry name inside archive
+        source: Path of file to add, or entry content
+    """
+    compress_type = compression_for(arcname)
+    if isinstance(source, bytes):
+        zipf.writestr(arcname, source, compress_type=compress_type)
+    else:
+        zipf.write(source, arcname, compress_type=compress_type)
@@ -0,0 +1,63 @@
+"""
+Общие фикстуры для тестов пакетной обработки.
+"""
+
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeUpload:
+    """Имитация Flask FileStorage для тестов"""
+
+    def __init__(self, filename, image=None, size=(120, 200), color=(200, 30, 30)):
+        self.filename = filename
+        self.content_type = 'image/png'
+        image = image or Image.new('RGB', size, color)
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        self.stream = io.BytesIO(buffer.getvalue())
+
+
+@pytest.fixture
+def make_upload():
+    """Фабрика тестовых загрузок"""
+    return FakeUpload
+
+
+@pytest.fixture
+def batch_processor(tmp_path, monkeypatch):
+    """
+    BatchProcessor во временной директории с заглушками сетевых вызовов.
+
+    GPT-анализ (в том числе пакетный) возвращает fallback-анализ, удаление фона возвращает
+    RGBA-копию входного изображения. Повторное использование анализа
+    похожих изображений отключено, изображения передаются как data URL.
+    """
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('ANALYSIS_REUSE_DISTANCE', '-1')
+    monkeypatch.setenv('UPLOAD_MODE', 'inline')
+    monkeypatch.chdir(tmp_path)
+
+    from src.processors.batch_processor import BatchProcessor
+
+    processor = BatchProcessor(db_path=str(tmp_path / 'database' / 'history.db'))
+
+    def fake_analyze(image, *args, **kwargs):
+        return {'success': True, 'analysis': processor.gpt_analyzer._get_fallback_analysis(image)}
+
+    def fake_remove_background(image, prompt, *args, **kwargs):
+        return image.convert('RGBA')
+
+    monkeypatch.setattr(processor.gpt_analyzer, 'analyze_image', fake_analyze)
+    # Пакетный анализ разбивается на вызовы analyze_image, чтобы тесты могли их подменять
+    monkeypatch.setattr(processor.gpt_analyzer, 'analyze_images',
+                        lambda images: [processor.gpt_analyzer.analyze_image(image) for image in images])
+    monkeypatch.setattr(processor, '_remove_background_fal', fake_remove_background)
+    return processor
@@ -0,0 +1,211 @@
+"""
+Офлайн mock backend'ы анализа и удаления фона для тестов и нагрузочного теста.
+
+Импорт модуля регистрирует их под именем 'mock' для ANALYSIS_BACKEND и SEGMENTATION_BACKEND.
+"""
+
+import os
+import time
+import random
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from src.processors.gpt_analyzer import GPTProductAnalyzer
+from src.processors.inference_backends import (
+    SegmentationBackend, SegmentationHandle, register_analyzer, register_segmentation_backend
+)
+from src.utils.concurrency import AdaptiveConcurrencyLimiter
+from src.utils.upload_manager import UploadManager, content_hash
+from src.utils.analysis_thumbnail import ThumbnailCache
+
+
+# Backend name for SEGMENTATION_BACKEND / ANALYSIS_BACKEND
+MOCK = 'mock'
+
+
+class MockInferenceError(RuntimeError):
+    """Error injected by a mock backend"""
+
+
+class MockProfile:
+    """
+    Latency and error distribution of a mock backend
+
+    Each call sleeps `latency` seconds scaled by a log-normal factor with
+    sigma `jitter` (long tail, like real inference) and fails with
+    probability `error_rate`. The random generator is seeded, so a run
+    with the same settings draws the same sequence.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = 0):
+        """
+        Initialize mock profile
+
+        Args:
+            latency: Median call latency in seconds
+            jitter: Sigma of the log-normal latency factor (0 = constant latency)
+            error_rate: Probability (0-1) of a failed call
+            seed: Random seed (None = unseeded)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'MockProfile':
+        """Create profile from MOCK_LATENCY, MOCK_LATENCY_JITTER, MOCK_ERROR_RATE and MOCK_SEED"""
+        return cls(latency=float(os.environ.get('MOCK_LATENCY', 0)),
+                   jitter=float(os.environ.get('MOCK_LATENCY_JITTER', 0)),
+                   error_rate=float(os.environ.get('MOCK_ERROR_RATE', 0)),
+                   seed=int(os.environ.get('MOCK_SEED', 0)))
+
+    def draw(self) -> Tuple[float, bool]:
+        """
+        Draw outcome of the next call
+
+        Returns:
+            Tuple of (latency in seconds, whether the call fails)
+        """
+        with self._lock:
+            factor = self._random.lognormvariate(0, self.jitter) if self.jitter > 0 else 1.0
+            fails = self._random.random() < self.error_rate
+        return self.latency * factor, fails
+
+
+def mock_cutout(image: Image.Image, tolerance: int = 24) -> Image.Image:
+    """
+    Deterministic cutout: pixels close to the top-left corner color become transparent
+
+    Args:
+        image: Source image
+        tolerance: Max per-channel difference still treated as background
+
+    Returns:
+        RGBA image with background alpha set to 0
+    """
+    rgb = image.convert('RGB')
+    background = Image.new('RGB', rgb.size, rgb.getpixel((0, 0)))
+    mask = ImageChops.difference(rgb, background).convert('L').point(lambda v: 255 if v > tolerance else 0)
+
+    cutout = image.convert('RGBA')
+    cutout.putalpha(ImageChops.multiply(cutout.getchannel('A'), mask))
+    return cutout
+
+
+class MockHandle(SegmentationHandle):
+    """Mock request: waits out the drawn latency on the calling thread"""
+
+    def __init__(self, image: Image.Image, latency: float, fails: bool, endpoint: str):
+        self.image = image
+        self.latency = latency
+        self.fails = fails
+        self.endpoint = endpoint
+        self._cancelled = threading.Event()
+
+    def get(self) -> Optional[Image.Image]:
+        if self._cancelled.wait(self.latency):
+            raise MockInferenceError(f"{self.endpoint}: request cancelled")
+        if self.fails:
+            raise MockInferenceError(f"{self.endpoint}: injected failure")
+        return mock_cutout(self.image)
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+class MockSegmentationBackend(SegmentationBackend):
+    """Offline backend for benchmarks and load tests: deterministic masks, simulated latency and errors"""
+
+    name = MOCK
+
+    def __init__(self, profile: Optional[MockProfile] = None):
+        """
+        Initialize mock backend
+
+        Args:
+            profile: Latency and error distribution (default from MOCK_* environment)
+        """
+        self.profile = profile or MockProfile.from_env()
+
+    def submit(self, endpoint: str, image: Image.Image, arguments: Dict[str, Any],
+               max_size: Optional[Tuple[int, int]] = None) -> SegmentationHandle:
+        latency, fails = self.profile.draw()
+        return MockHandle(image, latency, fails, endpoint)
+
+
+class MockAnalyzer(GPTProductAnalyzer):
+    """
+    Offline stand-in for GPTProductAnalyzer
+
+    Returns analyses derived from the pixels (same image, same analysis)
+    with the latency and errors of a MockProfile. Prompt building and
+    geometry are inherited, so downstream stages see the usual shape.
+    """
+
+    CATEGORIES = ['electronics', 'home', 'diy', 'fashion', 'appliances', 'fmcg']
+    COLORS = {'white': (235, 235, 235), 'black': (25, 25, 25), 'gray': (128, 128, 128),
+              'red': (200, 40, 40), 'green': (40, 160, 60), 'blue': (40, 80, 200),
+              'yellow': (230, 200, 40), 'brown': (120, 80, 40)}
+
+    def __init__(self, limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 upload_manager: Optional[UploadManager] = None,
+                 profile: Optional[MockProfile] = None):
+        """
+        Initialize mock analyzer (no API key needed)
+
+        Args:
+            limiter: Concurrency limiter shared by analysis calls (created if not given)
+            upload_manager: Unused, accepted for interface compatibility
+            profile: Latency and error distribution (default from MOCK_* environment)
+        """
+        self.limiter = limiter or AdaptiveConcurrencyLimiter('openai')
+        self.upload_manager = upload_manager
+        self.profile = profile or MockProfile.from_env()
+        self.batch_size = int(os.environ.get('OPENAI_ANALYSIS_BATCH', 6))
+        self.thumbnails = ThumbnailCache()
+
+    def analyze_image(self, image: Image.Image) -> Dict[str, Any]:
+        latency, fails = self.profile.draw()
+        with self.limiter.slot():
+            time.sleep(latency)
+        return self._mock_result(image, fails)
+
+    def analyze_images(self, images: List[Image.Image]) -> List[Dict[str, Any]]:
+        # One simulated request per batch, like the multi-image API call
+        latency, fails = self.profile.draw()
+        with self.limiter.slot():
+            time.sleep(latency)
+        return [self._mock_result(image, fails) for image in images]
+
+    def _mock_result(self, image: Image.Image, fails: bool) -> Dict[str, Any]:
+        """Build analysis result (or injected failure with fallback)"""
+        if fails:
+            return self._error_result(MockInferenceError("injected analysis failure"), image)
+        return {'success': True, 'analysis': self._mock_analysis(image)}
+
+    def _mock_analysis(self, image: Image.Image) -> Dict[str, Any]:
+        """Deterministic analysis from image content"""
+        analysis = self._get_fallback_analysis(image)
+        digest = int(content_hash(image)[:8], 16)
+        color = self._nearest_color(image)
+        width, height = image.size
+
+        analysis['category'] = self.CATEGORIES[digest % len(self.CATEGORIES)]
+        analysis['visual_properties']['primary_color'] = color
+        analysis['geometry']['physical_property'] = 'stands' if height > width else 'floats'
+        analysis['lora_optimization']['main_object_description'] = f"{color} {analysis['category']} product"
+        return analysis
+
+    def _nearest_color(self, image: Image.Image) -> str:
+        """Name of the palette color closest to the mean image color"""
+        mean = image.convert('RGB').resize((1, 1), Image.BOX).getpixel((0, 0))
+        return min(self.COLORS, key=lambda name: sum((a - b) ** 2 for a, b in zip(self.COLORS[name], mean)))
+
+
+register_segmentation_backend(MOCK, MockSegmentationBackend)
+register_analyzer(MOCK, MockAnalyzer)
@@ -0,0 +1,130 @@
+"""
+Тесты для повторного использования анализа похожих изображений
+(dHash, HammingIndex, AnalysisIndex).
+"""
+
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from src.utils.perceptual_hash import dhash, hamming_distance, HammingIndex
+from src.processors.analysis_index import AnalysisIndex
+
+
+def product_photo(seed, size=(300, 400)):
+    """Текстурированное «фото товара»: случайные фигуры на светлом фоне"""
+    rnd = random.Random(seed)
+    image = Image.new('RGB', size, (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.ellipse([x - 40, y - 40, x + 40, y + 40], fill=color)
+    return image
+
+
+def recompress(image, quality=60):
+    """Пересжать изображение в JPEG"""
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+
+
+def test_dhash_tolerates_recompression_and_resize():
+    """dHash почти не меняется при пересжатии и масштабировании"""
+    original = product_photo(1)
+
+    assert hamming_distance(dhash(original), dhash(recompress(original))) <= 6
+    assert hamming_distance(dhash(original), dhash(original.resize((150, 200)))) <= 6
+    assert hamming_distance(dhash(original), dhash(product_photo(2))) > 6
+
+
+def test_index_matches_brute_force():
+    """Поиск в индексе совпадает с полным перебором"""
+    rnd = random.Random(7)
+    hashes = [rnd.getrandbits(64) for _ in range(3000)]
+    index = HammingIndex(max_distance=6)
+    for position, value in enumerate(hashes):
+        index.add(value, position)
+
+    for _ in range(200):
+        query = rnd.choice(hashes)
+        for bit in rnd.sample(range(64), rnd.randrange(9)):
+            query ^= 1 << bit
+        expected = min(hamming_distance(query, h) for h in hashes)
+
+        match = index.find(query)
+
+        if expected <= 6:
+            assert match[0] == expected
+        else:
+            assert match is None
+
+
+def test_negative_distance_disables_index():
+    """Отрицательный радиус отключает поиск"""
+    index = HammingIndex(max_distance=-1)
+    index.add(42, 'value')
+
+    assert index.find(42) is None
+
+
+def test_batch_reuses_analysis_of_duplicates(batch_processor, make_upload, monkeypatch):
+    """Дубликаты в пакете и в истории не вызывают GPT повторно"""
+    batch_processor.analysis_index = batch_processor.analysis.analysis_index = AnalysisIndex(
+        batch_processor.db_path, max_distance=6)
+    calls = []
+    analyze = batch_processor.gpt_analyzer.analyze_image
+
+    def counting_analyze(image, *args, **kwargs):
+        calls.append(image.size)
+        return analyze(image, *args, **kwargs)
+
+    monkeypatch.setattr(batch_processor.gpt_analyzer, 'analyze_image', counting_analyze)
+    original = product_photo(3)
+
+    batch_processor.process_batch([make_upload("a.png", image=original)], batch_id="batch_1")
+    result = batch_processor.process_batch([
+        make_upload("b.png", image=recompress(original)),
+        make_upload("c.png", image=original.resize((300, 500))),
+        make_upload("d.png", image=product_photo(4))
+    ], batch_id="batch_2")
+
+    assert len(calls) == 2
+    by_name = {r['filename']: r for r in result['results']}
+    assert by_name['c.png']['analysis']['geometry']['aspect_ratio'] == 0.6
+    assert by_name['b.png']['analysis']['geometry']['aspect_ratio'] == 0.75
+
+    # Новый процесс находит анализ по истории в SQLite
+    restored = AnalysisIndex(batch_processor.db_path, max_distance=6)
+    assert restored.stats()['entries'] == 4
+    assert restored.find(restored.image_hash(original)) is not None
+
+
+def test_colour_variant_not_reused(tmp_path):
+    """Тот же товар другого цвета не получает чужой анализ: dHash совпадает, средний цвет нет"""
+    index = AnalysisIndex(str(tmp_path / 'history.db'), max_distance=6)
+    red = Image.new('RGB', (300, 400), (240, 240, 240))
+    ImageDraw.Draw(red).rectangle([60, 60, 240, 340], fill=(200, 30, 30))
+    blue = Image.new('RGB', (300, 400), (240, 240, 240))
+    ImageDraw.Draw(blue).rectangle([60, 60, 240, 340], fill=(30, 30, 200))
+    assert hamming_distance(dhash(red.convert('L')), dhash(blue.convert('L'))) <= 6
+
+    index.add(index.image_hash(red), {'category': 'fashion', 'color': 'red'})
+
+    assert index.find(index.image_hash(recompress(red)))['color'] == 'red'
+    assert index.find(index.image_hash(blue)) is None
+
+
+def test_in_memory_analyses_bounded(batch_processor, make_upload):
+    """В памяти хранятся только последние анализы, вытесненные читаются из истории"""
+    index = AnalysisIndex(batch_processor.db_path, max_distance=6, max_recent=1)
+    batch_processor.analysis_index = batch_processor.analysis.analysis_index = index
+
+    batch_processor.process_batch([make_upload("a.png", image=product_photo(5)),
+                                   make_upload("b.png", image=product_photo(6))], batch_id="batch_lru")
+
+    assert index.stats()['in_memory'] == 1
+    assert index.find(index.image_hash(product_photo(5))) is not None
+    assert index.find(index.image_hash(product_photo(6))) is not None
@@ -0,0 +1,79 @@
+"""
+Тесты для компактной схемы структурированного ответа GPT-анализа.
+"""
+
+import json
+
+import pytest
+from PIL import Image
+
+from src.processors.analysis_schema import ANALYSIS_FORMAT, expand_analysis, decode_analysis
+
+
+COMPACT = {
+    'c': 'fa', 't': 'running shoes', 'br': 'Acme', 'mo': '', 'pc': 'red', 'sc': ['white'],
+    'mt': 'fa', 'tx': 'ma', 'tr': 'op', 'sh': True, 'pp': 'st',
+    'd': 'red mesh running shoe with white sole', 'si': 'lg', 'sw': 'pr', 'po': 'b'
+}
+
+
+def test_schema_is_strict_and_covers_every_field():
+    """Строгая схема: все поля обязательны, коды категорий и позиционирования перечислены"""
+    schema = ANALYSIS_FORMAT['schema']
+
+    assert ANALYSIS_FORMAT['strict'] is True
+    assert schema['additionalProperties'] is False
+    assert sorted(schema['required']) == sorted(COMPACT)
+    assert schema['properties']['c']['enum'] == ['el', 'ho', 'di', 'fa', 'ap', 'fm']
+    assert schema['properties']['po']['enum'] == ['b', 'c', 'f']
+
+
+def test_expand_restores_full_analysis_shape():
+    """Коды разворачиваются в прежнюю структуру анализа"""
+    analysis = expand_analysis(COMPACT)
+
+    assert analysis['category'] == 'fashion'
+    assert analysis['product_identification'] == {'type': 'running shoes', 'brand': 'Acme', 'model': 'unknown'}
+    assert analysis['visual_properties']['material'] == 'fabric'
+    assert analysis['geometry']['physical_property'] == 'stands'
+    assert analysis['lora_optimization']['special_instructions'] == 'preserve logo'
+    assert analysis['canvas_settings']['positioning'] == 'bottom_aligned'
+
+    # Полный ответ старого формата принимается как есть
+    assert decode_analysis(analysis) is analysis
+
+
+@pytest.mark.parametrize('field, value', [('c', 'shoes'), ('po', None), ('d', 7), ('sc', 'red')])
+def test_invalid_codes_are_rejected(field, value):
+    """Неизвестный код или неверный тип поля — ошибка проверки"""
+    with pytest.raises(ValueError, match=field):
+        expand_analysis({**COMPACT, field: value})
+
+
+def test_analyzer_requests_schema_and_expands_reply(monkeypatch):
+    """Запрос содержит схему, ответ разворачивается и дополняется геометрией"""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    import src.processors.gpt_analyzer as module
+
+    sent = []
+
+    class Response:
+        status_code = 200
+        headers = {}
+
+        def json(self):
+            return {'output': [{'content': [{'type': 'output_text', 'text': json.dumps(COMPACT)}]}]}
+
+    def post(url, json=None, **kwargs):
+        sent.append(json)
+        return Response()
+
+    monkeypatch.setattr(module.http_client, 'post', post)
+
+    result = module.GPTProductAnalyzer().analyze_image(Image.new('RGB', (300, 600)))
+
+    assert sent[0]['text']['format']['name'] == 'product_analysis'
+    assert result['success']
+    assert result['analysis']['category'] == 'fashion'
+    assert result['analysis']['geometry']['orientation'] == 'vertical'
+    assert result['analysis']['canvas_settings']['size'] == '1600x1600'
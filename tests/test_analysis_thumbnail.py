@@ -0,0 +1,80 @@
+"""
+Тесты для миниатюр, отправляемых на GPT-анализ вместо полноразмерного PNG.
+"""
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from src.utils.analysis_thumbnail import ThumbnailCache, load_thumbnail, make_thumbnail
+from src.utils.upload_manager import content_hash
+
+
+def decode_data_url(data_url):
+    """Декодирует data URL в изображение"""
+    header, data = data_url.split(',', 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def test_thumbnail_is_small_jpeg_with_true_size():
+    """Миниатюра не больше 512 px, прозрачность на белом, размер оригинала сохранён"""
+    image = Image.new('RGBA', (3000, 1500), (0, 0, 0, 0))
+    image.paste((200, 30, 30, 255), (1000, 500, 2000, 1000))
+    cache = ThumbnailCache(max_side=512, image_format='JPEG')
+
+    entry = cache.get(image)
+
+    header, thumbnail = decode_data_url(entry['data_url'])
+    assert header == 'data:image/jpeg;base64'
+    assert thumbnail.size == (512, 256)
+    assert entry['size'] == (3000, 1500)
+    assert thumbnail.convert('RGB').getpixel((5, 5))[0] > 240
+
+    # Повторный запрос берёт закодированную миниатюру из кэша
+    assert cache.get(image)['data_url'] == entry['data_url']
+    stats = cache.stats()
+    assert stats['encoded'] == 1 and stats['hits'] == 1
+
+
+def test_jpeg_file_is_decoded_in_draft_mode(tmp_path):
+    """JPEG декодируется сразу в уменьшенном размере, кэш заполняется по хешу изображения"""
+    path = tmp_path / 'photo.jpg'
+    Image.new('RGB', (4000, 3000), (40, 80, 200)).save(path, format='JPEG')
+
+    thumbnail, size = load_thumbnail(path, 512)
+    assert size == (4000, 3000)
+    assert max(thumbnail.size) == 512
+
+    image = Image.open(path).convert('RGBA')
+    cache = ThumbnailCache(max_side=512)
+    cache.prime(content_hash(image), path)
+    cache.get(image)
+
+    stats = cache.stats()
+    assert stats['draft_decoded'] == 1 and stats['encoded'] == 1 and stats['hits'] == 1
+
+
+def test_analyzer_sends_thumbnail(monkeypatch):
+    """Запрос анализа содержит миниатюру, а геометрия считается по оригиналу"""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    from src.processors.gpt_analyzer import GPTProductAnalyzer
+
+    analyzer = GPTProductAnalyzer()
+    image = Image.new('RGBA', (1200, 2400), (200, 30, 30, 255))
+
+    payload = analyzer._build_payload(image)
+    image_url = payload['input'][0]['content'][1]['image_url']
+    _, thumbnail = decode_data_url(image_url)
+    assert thumbnail.size == (256, 512)
+
+    analysis = analyzer._get_fallback_analysis(image)
+    analyzer.apply_geometry(analysis, image)
+    assert analysis['geometry']['aspect_ratio'] == 0.5
+
+    # ANALYSIS_THUMBNAIL_SIZE=0 возвращает отправку полноразмерного PNG
+    monkeypatch.setenv('ANALYSIS_THUMBNAIL_SIZE', '0')
+    analyzer = GPTProductAnalyzer()
+    header, full = decode_data_url(analyzer._build_payload(image)['input'][0]['content'][1]['image_url'])
+    assert header == 'data:image/png;base64' and full.size == (1200, 2400)
@@ -0,0 +1,82 @@
+"""
+Тесты для инкрементальной сборки и потоковой выдачи ZIP-архива пакета.
+"""
+
+import io
+import json
+import zipfile
+
+from src.processors.batch_archive import BatchArchive, stream_zip, REPORT_NAME
+
+
+def success(path):
+    """Результат успешной обработки"""
+    return {'filename': path.name, 'status': 'success', 'paths': {'final': str(path)}}
+
+
+def test_archive_grows_entry_by_entry(tmp_path):
+    """Записи добавляются по мере готовности, отчёт пишется последним"""
+    on_disk = tmp_path / 'b.png'
+    on_disk.write_bytes(b'from-disk')
+    archive = BatchArchive(tmp_path / 'batch.zip')
+
+    archive.add_result(success(tmp_path / 'a.png'), b'encoded')
+    archive.add_result(success(on_disk))
+    archive.add_result(success(on_disk))
+    archive.add_result({'filename': 'c.png', 'status': 'error'})
+    archive.add_result(success(tmp_path / 'missing.png'))
+    zip_path = archive.close({'total_files': 4})
+
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.namelist() == ['final/a.png', 'final/b.png', REPORT_NAME]
+        assert zipf.read('final/a.png') == b'encoded'
+        assert json.loads(zipf.read(REPORT_NAME)) == {'total_files': 4}
+
+
+def test_stream_zip_is_valid_archive():
+    """Потоковый архив без seek читается как обычный ZIP"""
+    chunks = list(stream_zip([('a.txt', b'one'), ('b.txt', b'two' * 1000)]))
+
+    assert len(chunks) == 3
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zipf:
+        assert zipf.read('b.txt') == b'two' * 1000
+
+
+def test_batch_archive_matches_outputs(batch_processor, make_upload):
+    """Архив пакета содержит все итоговые изображения и отчёт"""
+    result = batch_processor.process_batch([make_upload("a.png"), make_upload("b.png")])
+
+    with zipfile.ZipFile(result['zip_path']) as zipf:
+        assert sorted(zipf.namelist()) == ['final/a.png', 'final/b.png', REPORT_NAME]
+        for item in result['results']:
+            with open(item['paths']['final'], 'rb') as f:
+                assert zipf.read(f"final/{item['filename']}") == f.read()
+
+
+def test_stream_batch_archive_while_running(batch_processor, make_upload):
+    """Частичный архив отдаётся, пока пакет ещё выполняется"""
+    result = batch_processor.process_batch([make_upload("a.png"), make_upload("b.png")], batch_id="batch_5")
+    checks = iter([True, True, False])
+
+    stream = batch_processor.stream_batch_archive("batch_5", lambda: next(checks), poll_interval=0)
+
+    with zipfile.ZipFile(io.BytesIO(b''.join(stream))) as zipf:
+        assert sorted(zipf.namelist()) == ['final/a.png', 'final/b.png', REPORT_NAME]
+        assert json.loads(zipf.read(REPORT_NAME))['successful'] == result['successful']
+
+
+def test_compression_policy_per_entry(tmp_path):
+    """Изображения хранятся без сжатия, JSON сжимается"""
+    archive = BatchArchive(tmp_path / 'batch.zip')
+    archive.add_result(success(tmp_path / 'a.png'), b'png' * 100)
+    archive.add_result(success(tmp_path / 'b.JPG'), b'jpg' * 100)
+    zip_path = archive.close({'results': ['x'] * 100})
+
+    with zipfile.ZipFile(zip_path) as zipf:
+        types = {info.filename: info.compress_type for info in zipf.infolist()}
+
+    assert types == {
+        'final/a.png': zipfile.ZIP_STORED,
+        'final/b.JPG': zipfile.ZIP_STORED,
+        REPORT_NAME: zipfile.ZIP_DEFLATED
+    }
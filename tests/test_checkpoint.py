@@ -0,0 +1,126 @@
+"""
+Тесты для возобновления пакетов по контрольным точкам (BatchCheckpointStore).
+"""
+
+import os
+
+import pytest
+
+from src.processors.checkpoint import (
+    BatchCheckpointStore, checkpoint_reached, QUEUED, ANALYZED, BG_REMOVED, DONE
+)
+
+
+def count_calls(processor, monkeypatch):
+    """Подсчитать вызовы GPT и удаления фона"""
+    calls = {'gpt': 0, 'lora': 0}
+    analyze = processor.gpt_analyzer.analyze_image
+    remove_background = processor._remove_background_fal
+
+    def counting_analyze(image, *args, **kwargs):
+        calls['gpt'] += 1
+        return analyze(image, *args, **kwargs)
+
+    def counting_remove_background(image, prompt, *args, **kwargs):
+        calls['lora'] += 1
+        return remove_background(image, prompt, *args, **kwargs)
+
+    monkeypatch.setattr(processor.gpt_analyzer, 'analyze_image', counting_analyze)
+    monkeypatch.setattr(processor, '_remove_background_fal', counting_remove_background)
+    return calls
+
+
+def test_checkpoint_order():
+    """Контрольные точки сравниваются по порядку"""
+    assert checkpoint_reached(DONE, BG_REMOVED)
+    assert checkpoint_reached(ANALYZED, ANALYZED)
+    assert not checkpoint_reached(QUEUED, ANALYZED)
+    assert not checkpoint_reached(None, QUEUED)
+
+
+def test_files_reach_done(batch_processor, make_upload):
+    """После обработки все файлы пакета отмечены как done"""
+    result = batch_processor.process_batch(
+        [make_upload("a.png"), make_upload("b.png")], batch_id="batch_100")
+
+    assert result['batch_id'] == "batch_100"
+    rows = batch_processor.checkpoints.get_files("batch_100")
+    assert [row['stage'] for row in rows] == [DONE, DONE]
+    assert all(row['analysis'] and row['final_path'] for row in rows)
+
+
+def test_resume_skips_finished_work(batch_processor, make_upload, monkeypatch):
+    """Возобновление не повторяет готовые файлы и вызовы GPT/LoRA"""
+    files = [make_upload(f"item_{i}.png") for i in range(3)]
+    batch_processor.process_batch(files, batch_id="batch_200")
+
+    # Имитация падения: item_1 остановился после анализа, item_2 - после удаления фона
+    store = batch_processor.checkpoints
+    store.mark("batch_200", 1, ANALYZED)
+    store.mark("batch_200", 2, BG_REMOVED)
+    os.remove(store.get_files("batch_200")[2]['final_path'])
+
+    calls = count_calls(batch_processor, monkeypatch)
+    updates = []
+
+    result = batch_processor.resume_batch("batch_200", progress_callback=updates.append)
+
+    assert result['successful'] == 3
+    assert calls == {'gpt': 0, 'lora': 1}
+    assert len(updates) == 2
+    assert updates[-1]['processed'] == 3
+    assert all(row['stage'] == DONE for row in store.get_files("batch_200"))
+    assert all(os.path.exists(r['paths']['final']) for r in result['results'])
+
+
+def test_resume_restarts_queued_file_from_original(batch_processor, make_upload, monkeypatch):
+    """Файл без контрольных точек обрабатывается заново из сохранённого оригинала"""
+    batch_processor.process_batch([make_upload("shoe.png")], batch_id="batch_300")
+    batch_processor.checkpoints.mark("batch_300", 0, QUEUED)
+    calls = count_calls(batch_processor, monkeypatch)
+
+    result = batch_processor.resume_batch("batch_300")
+
+    assert result['successful'] == 1
+    assert calls == {'gpt': 1, 'lora': 1}
+
+
+def test_duplicate_filenames_kept_apart(batch_processor, make_upload, monkeypatch):
+    """Файлы с одинаковым именем в пакете не перезаписывают друг друга и возобновляются оба"""
+    files = [make_upload("photo.png"), make_upload("photo.png"), make_upload("photo.webp")]
+    result = batch_processor.process_batch(files, batch_id="batch_400")
+
+    finals = [r['paths']['final'] for r in result['results']]
+    assert result['successful'] == 3
+    assert len(set(finals)) == 3
+    assert [r['filename'] for r in result['results']].count("photo.png") == 2
+
+    store = batch_processor.checkpoints
+    assert len(store.get_files("batch_400")) == 3
+    store.mark("batch_400", 0, QUEUED)
+    store.mark("batch_400", 1, QUEUED)
+    calls = count_calls(batch_processor, monkeypatch)
+
+    resumed = batch_processor.resume_batch("batch_400")
+
+    assert resumed['successful'] == 3
+    assert calls['lora'] == 2
+    assert sorted(r['paths']['final'] for r in resumed['results']) == sorted(finals)
+
+
+def test_resume_unknown_batch(batch_processor):
+    """Возобновление неизвестного пакета - ошибка"""
+    with pytest.raises(ValueError):
+        batch_processor.resume_batch("batch_missing")
+
+
+def test_store_keeps_error_message(tmp_path):
+    """Ошибка сохраняется, контрольная точка не сдвигается"""
+    store = BatchCheckpointStore(str(tmp_path / 'history.db'))
+    store.register_files("b", [{'index': 0, 'filename': 'x.png', 'original_path': '/tmp/x.png'}])
+
+    store.mark_error("b", 0, "LoRA unavailable")
+
+    row = store.get_files("b")[0]
+    assert row['stage'] == QUEUED
+    assert row['error_message'] == "LoRA unavailable"
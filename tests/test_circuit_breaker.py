@@ -0,0 +1,118 @@
+"""
+Тесты для circuit breaker моделей и его учёта в ModelSelectionPolicy.
+"""
+
+import time
+from types import SimpleNamespace
+
+from src.models.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitState
+from src.models.selection_policy import ModelSelectionPolicy
+
+
+def test_opens_on_failure_rate_and_recovers_after_probe():
+    """Цепь размыкается по доле ошибок, после паузы пропускает пробный запрос"""
+    breaker = CircuitBreaker('lora', min_calls=4, open_seconds=0.05)
+    for success in (True, False, True, False):
+        breaker.allow_request()
+        breaker.record_success() if success else breaker.record_failure()
+
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # Только один пробный запрос
+    breaker.record_success(latency=1.0)
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    """Слишком медленные ответы считаются ошибками, проваленная проба снова размыкает цепь"""
+    breaker = CircuitBreaker('lora', min_calls=2, slow_call_seconds=10, open_seconds=0.01)
+    breaker.record_success(latency=30)
+    breaker.record_success(latency=40)
+    assert breaker.state == CircuitState.OPEN
+
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.snapshot()['state'] == CircuitState.OPEN
+    assert breaker.snapshot()['opened'] == 2
+
+
+def model(model_id, priority):
+    """Модель реестра для тестов политики"""
+    spec = SimpleNamespace(memory_usage='medium', num_inference_steps=28)
+    return SimpleNamespace(id=model_id, name='Model', version=model_id[-2:], priority=priority, spec=spec, tags=[])
+
+
+def test_policy_skips_open_models():
+    """Политика выбора пропускает модели с разомкнутой цепью"""
+    models = {m.id: m for m in (model('flux-kontext-lora-v2', 100), model('flux-kontext-lora-v1', 50),
+                                model('birefnet-fallback', 10))}
+    policy = ModelSelectionPolicy(breakers=CircuitBreakerRegistry(min_calls=1, open_seconds=60))
+    policy.registry = SimpleNamespace(get_all_models=lambda active_only=True: list(models.values()),
+                                      get_model_by_id=models.get)
+
+    assert policy.select_model().model.id == 'flux-kontext-lora-v2'
+
+    policy.record_result('flux-kontext-lora-v2', success=False)
+    selection = policy.select_model()
+    assert selection.model.id == 'flux-kontext-lora-v1'
+    assert selection.selection_metadata['circuit_open'] == ['flux-kontext-lora-v2']
+
+    user_choice = policy.select_model(user_model_id='flux-kontext-lora-v2')
+    assert user_choice.model.id == 'flux-kontext-lora-v1'
+    assert policy.get_fallback_model('flux-kontext-lora-v2', 'error').model.id == 'flux-kontext-lora-v1'
+
+    policy.record_result('flux-kontext-lora-v1', success=False)
+    assert policy.select_model().model.id == 'birefnet-fallback'
+
+
+def test_probe_released_without_outcome():
+    """Пробный запрос без результата (кэш, общий вызов) освобождает слот пробы"""
+    breaker = CircuitBreaker('lora', min_calls=1, open_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_lora_cache_hit_frees_probe_and_latency_excludes_queueing(batch_processor, monkeypatch):
+    """Попадание в кэш возвращает пробу; задержка LoRA не включает ожидание слота"""
+    import fal_client
+    from contextlib import contextmanager
+    from PIL import Image
+    from src.processors import batch_processor as module
+
+    batch_processor.model_registry.db_manager.initialize_database()
+    monkeypatch.setenv('FAL_KEY', 'test-key')
+    monkeypatch.setattr(fal_client, 'subscribe',
+                        lambda endpoint, arguments=None, **kwargs: {'images': [{'url': 'https://fal.media/r.png'}]})
+    monkeypatch.setattr(module.http_client, 'download_image', lambda url, *args, **kwargs: Image.new('RGBA', (60, 60)))
+    background = batch_processor.background
+    limiter_slot = background.limiter.slot
+
+    @contextmanager
+    def queued_slot(*args, **kwargs):
+        time.sleep(0.3)
+        with limiter_slot(*args, **kwargs) as call:
+            yield call
+
+    monkeypatch.setattr(background.limiter, 'slot', queued_slot)
+    source = Image.new('RGB', (60, 60), (200, 10, 10))
+
+    assert background.remove_background(source, 'red mug') is not None
+    assert background.lora_latency._latencies[-1] < 0.2
+
+    # Цепь полуоткрыта: запрос из кэша берёт пробу и должен её вернуть
+    background.selection_policy.breakers = CircuitBreakerRegistry(min_calls=1, open_seconds=0.01)
+    background.selection_policy.record_result('flux-kontext-lora-v2', success=False)
+    time.sleep(0.02)
+    assert background.remove_background(source, 'red mug', model_id='flux-kontext-lora-v2') is not None
+    assert background.selection_policy.breakers.is_available('flux-kontext-lora-v2')
+    assert batch_processor.get_metrics()['result_cache']['hits'] == 1
@@ -0,0 +1,134 @@
+"""
+Тесты для адаптивного ограничителя параллельности (AIMD).
+"""
+
+import threading
+import time
+
+import pytest
+
+from src.utils.concurrency import (
+    AdaptiveConcurrencyLimiter, classify_error, OK, RATE_LIMITED, TIMEOUT, ERROR
+)
+
+
+class HTTPStatusError(Exception):
+    """Ошибка с HTTP-ответом, как у requests/httpx"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type('Response', (), {'status_code': status_code})()
+
+
+def run_calls(limiter, count, latency, outcome=OK):
+    """Выполнить серию вызовов с заданной задержкой и исходом"""
+    for _ in range(count):
+        limiter.acquire()
+        limiter.release(latency, outcome)
+
+
+def test_limit_grows_while_latency_is_flat():
+    """Лимит растёт аддитивно при стабильной задержке"""
+    limiter = AdaptiveConcurrencyLimiter('fal', initial_limit=2, max_limit=5)
+
+    run_calls(limiter, 50, latency=1.0)
+
+    assert limiter.limit == 5
+    decisions = limiter.snapshot()['decisions']
+    assert decisions and all(d['action'] == 'increase' for d in decisions)
+
+
+def test_rate_limit_halves_limit():
+    """429 уменьшает лимит мультипликативно"""
+    limiter = AdaptiveConcurrencyLimiter('openai', initial_limit=8)
+
+    run_calls(limiter, 1, latency=0.0, outcome=RATE_LIMITED)
+
+    assert limiter.limit == 4
+    snapshot = limiter.snapshot()
+    assert snapshot['signals'][RATE_LIMITED] == 1
+    assert snapshot['decisions'][-1]['signal'] == RATE_LIMITED
+
+
+def test_latency_spike_decreases_limit():
+    """Всплеск задержки относительно базовой уменьшает лимит"""
+    limiter = AdaptiveConcurrencyLimiter('fal', initial_limit=8, latency_tolerance=2.0)
+    run_calls(limiter, 3, latency=0.001)
+
+    run_calls(limiter, 1, latency=5.0)
+
+    assert limiter.limit == 4
+    assert limiter.snapshot()['signals']['latency_spike'] == 1
+
+
+def test_latency_baseline_kept_per_endpoint():
+    """Медленная модель не считается всплеском задержки быстрой модели того же провайдера"""
+    limiter = AdaptiveConcurrencyLimiter('fal', initial_limit=8, latency_tolerance=2.0)
+    for _ in range(3):
+        for endpoint, latency in (('fal-ai/birefnet', 0.001), ('fal-ai/flux-kontext-lora', 0.03)):
+            limiter.acquire()
+            limiter.release(latency, OK, endpoint)
+
+    assert limiter.snapshot()['signals']['latency_spike'] == 0
+    assert set(limiter.snapshot()['endpoint_baselines']) == {'fal-ai/birefnet', 'fal-ai/flux-kontext-lora'}
+
+    limiter.acquire()
+    limiter.release(0.01, OK, 'fal-ai/birefnet')
+    assert limiter.snapshot()['signals']['latency_spike'] == 1
+
+
+def test_generic_errors_do_not_change_limit():
+    """Обычные ошибки не считаются сигналом перегрузки"""
+    limiter = AdaptiveConcurrencyLimiter('fal', initial_limit=4)
+
+    run_calls(limiter, 3, latency=1.0, outcome=ERROR)
+
+    assert limiter.limit == 4
+
+
+def test_acquire_blocks_at_limit():
+    """Вызовы сверх лимита ждут освобождения слота"""
+    limiter = AdaptiveConcurrencyLimiter('fal', initial_limit=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def waiter():
+        limiter.acquire()
+        acquired.set()
+
+    threading.Thread(target=waiter, daemon=True).start()
+    assert not acquired.wait(0.1)
+
+    limiter.release(0.1)
+    assert acquired.wait(1.0)
+
+
+def test_slot_classifies_exceptions():
+    """Контекстный менеджер классифицирует исключения и пробрасывает их"""
+    limiter = AdaptiveConcurrencyLimiter('fal', initial_limit=4)
+
+    with pytest.raises(HTTPStatusError):
+        with limiter.slot():
+            raise HTTPStatusError(429)
+
+    assert limiter.limit == 2
+    assert limiter.snapshot()['in_flight'] == 0
+
+
+def test_classify_error():
+    """Классификация ошибок по типу и статусу"""
+    assert classify_error(HTTPStatusError(429)) == RATE_LIMITED
+    assert classify_error(HTTPStatusError(500)) == ERROR
+    assert classify_error(TimeoutError()) == TIMEOUT
+
+
+def test_batch_progress_exposes_concurrency(batch_processor, make_upload):
+    """Прогресс пакета содержит текущие лимиты провайдеров"""
+    updates = []
+
+    batch_processor.process_batch([make_upload("a.png")], progress_callback=updates.append)
+
+    concurrency = updates[-1]['concurrency']
+    assert set(concurrency) == {'openai', 'fal'}
+    assert concurrency['fal']['limit'] >= 1
+    assert 'decisions' in batch_processor.get_metrics()['concurrency']['openai']
@@ -0,0 +1,101 @@
+"""
+Тесты для быстрой рамки содержимого, используемой SmartPositioning.
+"""
+
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.utils.content_bounds import find_content_bounds
+from src.processors.smart_positioning import SmartPositioning
+
+
+def cutout(size=(1920, 1080), box=(500, 250, 1450, 900)):
+    """Прозрачный кадр с непрозрачным товаром-прямоугольником"""
+    image = Image.new('RGBA', size, (0, 0, 0, 0))
+    image.paste((200, 30, 30, 255), box)
+    return image
+
+
+def test_alpha_noise_and_specks_are_ignored():
+    """Почти прозрачный шум и одиночные точки не расширяют рамку"""
+    image = cutout()
+    # Шум LoRA на всём фоне ниже порога
+    alpha = np.asarray(image).copy()
+    alpha[..., 3] = np.maximum(alpha[..., 3], np.random.default_rng(0).integers(0, 8, alpha.shape[:2]))
+    image = Image.fromarray(alpha, 'RGBA')
+    rng = random.Random(0)
+    for _ in range(100):
+        x, y = rng.randrange(1920), rng.randrange(1080)
+        if not (490 <= x < 1460 and 240 <= y < 910):
+            image.putpixel((x, y), (0, 0, 0, 60))
+
+    assert find_content_bounds(image) == (500, 250, 1450, 900)
+
+
+def test_soft_shadow_and_thin_parts_are_kept():
+    """Мягкая тень выше порога и тонкие детали между отсчётами входят в рамку"""
+    image = cutout()
+    image.paste((0, 0, 0, 40), (500, 900, 1450, 930))
+    # Антенна шириной 1 пиксель не попадает на сетку подвыборки
+    image.paste((200, 30, 30, 255), (1001, 100, 1002, 250))
+
+    assert find_content_bounds(image) == (500, 100, 1450, 930)
+
+
+def test_opaque_image_bounded_against_background():
+    """Непрозрачный результат на светлом фоне: рамка по отличию от цвета фона"""
+    image = Image.new('RGB', (1920, 1080), (245, 244, 242))
+    image.paste((20, 20, 200), (300, 150, 1500, 1000))
+    # Лёгкий градиент фона в пределах допуска
+    image.paste((238, 240, 236), (0, 0, 1920, 40))
+
+    assert find_content_bounds(image) == (300, 150, 1500, 1000)
+    assert find_content_bounds(image.convert('RGBA')) == (300, 150, 1500, 1000)
+
+
+def test_empty_image_has_no_bounds():
+    """Пустой кадр — рамки нет, SmartPositioning возвращает пустой холст"""
+    assert find_content_bounds(Image.new('RGBA', (800, 600), (0, 0, 0, 5))) is None
+    assert SmartPositioning()._get_image_bounds(Image.new('RGBA', (800, 600))) is None
+
+
+def test_matches_full_scan_on_random_shapes():
+    """Рамка совпадает с полным перебором маски для сплошных фигур"""
+    rng = np.random.default_rng(1)
+    for _ in range(10):
+        width, height = rng.integers(600, 2400, 2)
+        left, right = sorted(rng.integers(0, width, 2))
+        top, bottom = sorted(rng.integers(0, height, 2))
+        right, bottom = max(right, left + 20), max(bottom, top + 20)
+        image = Image.new('RGBA', (int(width), int(height)), (0, 0, 0, 0))
+        image.paste((90, 90, 90, 255), (int(left), int(top), int(right), int(bottom)))
+
+        mask = np.asarray(image.getchannel('A')) > 10
+        rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+        expected = (cols[0], rows[0], cols[-1] + 1, rows[-1] + 1)
+
+        assert find_content_bounds(image) == expected
+
+
+def test_positioning_keeps_margin(monkeypatch):
+    """SmartPositioning добавляет 2 пикселя запаса и читает пороги из окружения"""
+    monkeypatch.setenv('BBOX_ALPHA_THRESHOLD', '50')
+    positioning = SmartPositioning()
+    image = cutout()
+    image.paste((0, 0, 0, 40), (500, 900, 1450, 930))
+
+    # Тень ниже заданного порога не учитывается
+    assert positioning.alpha_threshold == 50
+    assert positioning._get_image_bounds(image) == (498, 248, 1452, 902)
+
+
+def test_diagonal_thin_part_leaving_box_is_kept():
+    """Тонкая диагональная деталь (кабель, ремешок), выходящая из рамки по углу, не обрезается"""
+    for width in (1, 2, 4):
+        image = Image.new('RGBA', (3840, 2160), (0, 0, 0, 0))
+        image.paste((200, 30, 30, 255), (1000, 500, 2000, 1500))
+        ImageDraw.Draw(image).line((2000, 1500, 3500, 2100), fill=(200, 30, 30, 255), width=width)
+
+        assert find_content_bounds(image) == image.getchannel('A').getbbox()
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Тесты для выноса позиционирования и кодирования в пул процессов.
+"""
+
+from multiprocessing import shared_memory
+
+import pytest
+from PIL import Image
+
+from src.processors import cpu_offload
+from src.processors.cpu_offload import ProcessOffload, position_and_encode
+from src.processors.smart_positioning import SmartPositioning
+
+
+ANALYSIS = {'geometry': {'orientation': 'standard'}, 'canvas_settings': {'positioning': 'centered'}}
+
+
+@pytest.fixture
+def offload():
+    """Пул из одного процесса"""
+    pool = ProcessOffload(workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_process_output_matches_threads(offload):
+    """Процессный режим даёт те же байты, что и обработка в потоке"""
+    image = Image.new('RGBA', (300, 500), (20, 120, 200, 255))
+
+    expected = position_and_encode(image, ANALYSIS, SmartPositioning(), jpeg=False)
+
+    assert offload.position_and_encode(image, ANALYSIS) == expected
+
+
+def test_shared_memory_released(offload, monkeypatch):
+    """Блок shared memory удаляется после выполнения задачи"""
+    created = []
+    original = shared_memory.SharedMemory
+
+    def recording(*args, **kwargs):
+        block = original(*args, **kwargs)
+        if kwargs.get('create'):
+            created.append(block.name)
+        return block
+
+    monkeypatch.setattr(cpu_offload.shared_memory, 'SharedMemory', recording)
+    no_bg, final = offload.position_and_encode(Image.new('RGB', (64, 64)), ANALYSIS,
+                                               jpeg=True, encode_no_bg=False)
+
+    assert no_bg is None and final[:2] == b'\xff\xd8'
+    assert len(created) == 1
+    with pytest.raises(FileNotFoundError):
+        original(name=created[0])
+
+
+def test_batch_in_process_mode(batch_processor, make_upload, offload):
+    """Пакет в процессном режиме сохраняет те же файлы, что и в потоковом"""
+    threads = batch_processor.process_batch([make_upload("a.png")])
+    batch_processor.cpu_offload = offload
+    processes = batch_processor.process_batch([make_upload("a.png")])
+
+    for key in ('no_bg', 'final'):
+        with open(threads['results'][0]['paths'][key], 'rb') as f:
+            expected = f.read()
+        with open(processes['results'][0]['paths'][key], 'rb') as f:
+            assert f.read() == expected
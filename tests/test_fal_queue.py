@@ -0,0 +1,231 @@
+"""
+Тесты для режима очереди fal.ai (FalJobQueue, FAL_QUEUE_MODE).
+"""
+
+import itertools
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from src.processors.fal_queue import FalJobStore, FalJobQueue, COMPLETED
+from src.processors.pipeline import StagedPipeline, PipelineStage
+
+
+class FakeFal:
+    """Очередь fal.ai в памяти: запрос готов после заданного числа опросов"""
+
+    class Completed:
+        error = None
+
+    class InProgress:
+        pass
+
+    class Handle:
+        def __init__(self, request_id):
+            self.request_id = request_id
+
+    def __init__(self, polls_until_done=2, fail=()):
+        self.polls_until_done = polls_until_done
+        self.fail = set(fail)
+        self.submitted = []
+        self.cancelled = []
+        self.polls = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, application, arguments=None):
+        with self._lock:
+            request_id = f"req_{next(self._ids)}"
+            self.submitted.append((application, request_id))
+        return self.Handle(request_id)
+
+    def status(self, application, request_id):
+        self.polls[request_id] = self.polls.get(request_id, 0) + 1
+        done = self.polls[request_id] >= self.polls_until_done
+        return self.Completed() if done else self.InProgress()
+
+    def cancel(self, application, request_id):
+        self.cancelled.append(request_id)
+
+    def result(self, application, request_id):
+        if request_id in self.fail:
+            raise RuntimeError("inference failed")
+        return {'image': {'url': f"https://fal.media/{request_id}.png"}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Хранилище запросов во временной базе"""
+    return FalJobStore(str(tmp_path / 'history.db'))
+
+
+def test_many_jobs_collected_by_one_poller(store):
+    """Все запросы отправляются сразу и завершаются одним потоком опроса"""
+    fake = FakeFal(polls_until_done=3, fail={'req_2'})
+    jobs = FalJobQueue(store, poll_interval=0.01, client=fake)
+
+    futures = [jobs.submit('fal-ai/birefnet', {}, 'batch_1', i, f"{i}.png") for i in range(20)]
+
+    assert len(fake.submitted) == 20
+    results = [f.exception(timeout=5) or f.result() for f in futures]
+    assert isinstance(results[1], RuntimeError)
+    assert results[0] == {'image': {'url': 'https://fal.media/req_1.png'}}
+    assert jobs.stats()['completed'] == 19 and jobs.stats()['failed'] == 1
+    assert store.find('batch_1', 0)['status'] == COMPLETED
+    assert store.find('batch_1', 1) is None
+
+
+def test_pipeline_waits_on_futures_without_threads():
+    """Стадия, возвращающая Future, не держит поток на время ожидания"""
+    from concurrent.futures import Future
+
+    pending = []
+
+    def submit(job):
+        future = Future()
+        pending.append(future)
+        if len(pending) == 5:
+            for f in pending:
+                f.set_result(None)
+        return future
+
+    pipeline = StagedPipeline([PipelineStage('submit', submit, workers=1),
+                               PipelineStage('after', lambda job: job.update(done=True), workers=1)])
+
+    jobs = list(pipeline.run([{'id': i} for i in range(5)]))
+
+    assert all(job['done'] for job in jobs)
+    assert pipeline.get_stats()['submit']['in_flight'] == 0
+
+
+def test_resolving_futures_does_not_block_on_full_queue():
+    """Поток, завершающий Future (опрос fal), не ждёт места в очереди следующей стадии"""
+    from concurrent.futures import Future
+
+    pending = []
+    release = threading.Event()
+
+    def submit(job):
+        future = Future()
+        pending.append(future)
+        return future
+
+    def poller():
+        # Все задачи отправлены: завершаем их подряд, как один поток опроса
+        while len(pending) < 10:
+            time.sleep(0.01)
+        started = time.time()
+        for future in pending:
+            future.set_result(None)
+        resolved.append(time.time() - started)
+        release.set()
+
+    resolved = []
+    threading.Thread(target=poller, daemon=True).start()
+    pipeline = StagedPipeline([
+        PipelineStage('submit', submit, workers=1),
+        PipelineStage('fetch', lambda job: release.wait(5), workers=1, queue_size=1)
+    ])
+
+    jobs = list(pipeline.run([{'id': i} for i in range(10)]))
+
+    assert len(jobs) == 10
+    assert resolved[0] < 0.5
+
+
+def test_stuck_job_times_out_and_is_cancelled(store):
+    """Запрос, зависший в очереди fal, отменяется по таймауту, остальные не ждут его"""
+    fake = FakeFal(polls_until_done=10 ** 6)
+    jobs = FalJobQueue(store, poll_interval=0.01, client=fake, job_timeout=0.1)
+
+    future = jobs.submit('fal-ai/flux-kontext-lora', {}, 'batch_t', 0, 'stuck.png')
+
+    assert isinstance(future.exception(timeout=5), TimeoutError)
+    assert fake.cancelled == ['req_1']
+    assert jobs.stats()['timed_out'] == 1 and jobs.pending_count() == 0
+    assert store.find('batch_t', 0) is None
+
+
+def queue_processor(batch_processor, fake, monkeypatch):
+    """Переключить процессор в режим очереди с заглушкой fal"""
+    from src.processors import batch_processor as module
+
+    batch_processor.fal_api_key = 'test-key'
+    batch_processor.fal_queue_mode = True
+    batch_processor.fal_queue.jobs = FalJobQueue(batch_processor.fal_queue.jobs.store, poll_interval=0.01, client=fake)
+    monkeypatch.setattr(batch_processor.background, 'select_model', lambda model_id=None: (None, 'test'))
+    monkeypatch.setattr(module.http_client, 'download_image',
+                        lambda url: Image.new('RGBA', (120, 200), (0, 90, 0, 255)))
+
+
+def test_batch_in_queue_mode(batch_processor, make_upload, monkeypatch):
+    """Пакет в режиме очереди проходит все стадии"""
+    fake = FakeFal()
+    queue_processor(batch_processor, fake, monkeypatch)
+
+    result = batch_processor.process_batch([make_upload(f"{i}.png") for i in range(4)], batch_id='batch_q')
+
+    assert result['successful'] == 4
+    assert len(fake.submitted) == 4
+    assert batch_processor.get_metrics()['fal_queue']['completed'] == 4
+
+
+def test_resume_reattaches_to_submitted_jobs(batch_processor, make_upload, monkeypatch):
+    """После перезапуска ранее отправленные запросы не отправляются повторно, даже при одинаковых именах"""
+    import sqlite3
+    from src.processors.checkpoint import ANALYZED
+
+    queue_processor(batch_processor, FakeFal(), monkeypatch)
+    batch_processor.process_batch([make_upload("a.png"), make_upload("a.png")], batch_id='batch_r')
+
+    # Процесс упал после отправки: файлы проанализированы, запросы ещё в очереди fal
+    for index in (0, 1):
+        batch_processor.checkpoints.mark('batch_r', index, ANALYZED)
+    conn = sqlite3.connect(batch_processor.db_path)
+    conn.execute("UPDATE fal_jobs SET status = 'submitted'")
+    conn.commit()
+    conn.close()
+
+    restarted = FakeFal()
+    queue_processor(batch_processor, restarted, monkeypatch)
+    result = batch_processor.resume_batch('batch_r')
+
+    assert result['successful'] == 2
+    assert restarted.submitted == []
+    assert batch_processor.fal_queue.jobs.stats()['reattached'] == 2
+    assert len({r['paths']['final'] for r in result['results']}) == 2
+
+
+def test_rate_limited_submit_retried_and_failed_submit_falls_back(batch_processor, make_upload, monkeypatch):
+    """429 при постановке в очередь повторяется; если запрос не поставлен, файл уходит в BiRefNet"""
+    class RateLimited(Exception):
+        status_code = 429
+
+    class FlakyFal(FakeFal):
+        def __init__(self, errors):
+            super().__init__()
+            self.errors = list(errors)
+
+        def submit(self, application, arguments=None):
+            if self.errors:
+                raise self.errors.pop(0)
+            return super().submit(application, arguments)
+
+    fake = FlakyFal([RateLimited("429 Too Many Requests")])
+    queue_processor(batch_processor, fake, monkeypatch)
+    monkeypatch.setenv('RATE_LIMIT_RETRIES', '1')
+    assert batch_processor.process_batch([make_upload("a.png")], batch_id='batch_429')['successful'] == 1
+    assert len(fake.submitted) == 1
+
+    fake = FlakyFal([RuntimeError("fal unavailable")])
+    queue_processor(batch_processor, fake, monkeypatch)
+    batch_processor.model_registry.db_manager.initialize_database()
+    lora = batch_processor.model_registry.get_model_by_id('flux-kontext-lora-v2')
+    monkeypatch.setattr(batch_processor.background, 'select_model', lambda model_id=None: (lora, 'test'))
+    birefnet = []
+    monkeypatch.setattr(batch_processor.background, 'remove_background_birefnet',
+                        lambda image: birefnet.append(1) or image.convert('RGBA'))
+    assert batch_processor.process_batch([make_upload("b.png")], batch_id='batch_down')['successful'] == 1
+    assert fake.submitted == [] and birefnet == [1]
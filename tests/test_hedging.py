@@ -0,0 +1,190 @@
+"""
+Тесты для хеджирования медленных запросов LoRA запросом BiRefNet.
+"""
+
+import threading
+import time
+
+from PIL import Image
+
+from src.utils.hedging import LatencyTracker, hedged_call, PRIMARY, BACKUP
+
+
+def test_fast_primary_needs_no_backup():
+    """Быстрый основной запрос не запускает резервный"""
+    backup_calls = []
+
+    result, winner, hedged = hedged_call(lambda: 'lora', lambda: backup_calls.append(1), delay=1.0)
+
+    assert (result, winner, hedged) == ('lora', PRIMARY, False)
+    assert backup_calls == []
+
+
+def test_slow_primary_loses_and_is_cancelled():
+    """Медленный основной запрос отменяется, побеждает резервный"""
+    cancelled = threading.Event()
+
+    def slow_primary():
+        cancelled.wait(5)
+        raise RuntimeError("cancelled")
+
+    result, winner, hedged = hedged_call(slow_primary, lambda: 'birefnet', delay=0.05,
+                                         cancel_primary=cancelled.set)
+
+    assert (result, winner, hedged) == ('birefnet', BACKUP, True)
+    assert cancelled.is_set()
+
+
+def test_failed_primary_starts_backup_at_once():
+    """Ошибка основного запроса сразу запускает резервный, не дожидаясь порога"""
+    def failing():
+        raise RuntimeError("LoRA unavailable")
+
+    started = time.time()
+    result, winner, _ = hedged_call(failing, lambda: 'birefnet', delay=10)
+
+    assert (result, winner) == ('birefnet', BACKUP)
+    assert time.time() - started < 1
+    assert hedged_call(failing, lambda: None, delay=0.01)[:2] == (None, None)
+
+
+def test_delay_counts_from_sent_primary():
+    """Ожидание основного запроса в локальной очереди не запускает резервный"""
+    sent = threading.Event()
+    backup_calls = []
+
+    def queued_primary():
+        time.sleep(0.2)
+        sent.set()
+        time.sleep(0.05)
+        return 'lora'
+
+    result = hedged_call(queued_primary, lambda: backup_calls.append(1), delay=0.1, primary_sent=sent)
+
+    assert result == ('lora', PRIMARY, False)
+    assert backup_calls == []
+
+
+def test_threshold_follows_percentile():
+    """Порог — перцентиль недавних задержек, не ниже минимума"""
+    tracker = LatencyTracker(percentile=0.9, min_samples=10, floor=1.0)
+    for latency in range(1, 10):
+        tracker.record(latency)
+    assert tracker.hedge_threshold() is None
+
+    tracker.record(100)
+    assert tracker.hedge_threshold() == 100
+    assert LatencyTracker(percentile=0).hedge_threshold() is None
+
+
+def test_lora_hedged_with_birefnet(batch_processor, monkeypatch):
+    """Медленная LoRA проигрывает BiRefNet, запрос LoRA отменяется"""
+    import fal_client
+    from src.processors import batch_processor as module
+
+    cancelled = []
+
+    class Handle:
+        def __init__(self, application):
+            self.application = application
+            self.done = threading.Event()
+
+        def get(self):
+            if self.application == 'fal-ai/flux-kontext-lora':
+                self.done.wait(5)
+                raise RuntimeError("cancelled")
+            return {'image': {'url': 'https://fal.media/birefnet.png'}}
+
+        def cancel(self):
+            cancelled.append(self.application)
+            self.done.set()
+
+    batch_processor.model_registry.db_manager.initialize_database()
+    batch_processor.fal_api_key = 'test-key'
+    monkeypatch.setenv('FAL_KEY', 'test-key')
+    monkeypatch.setattr(fal_client, 'submit', lambda application, arguments=None: Handle(application))
+    monkeypatch.setattr(module.http_client, 'download_image', lambda url: Image.new('RGBA', (60, 60)))
+    batch_processor.background.lora_latency = LatencyTracker(min_samples=1, floor=0.05)
+    batch_processor.background.lora_latency.record(0.05)
+
+    result = batch_processor._remove_background_fal_v2(Image.new('RGB', (60, 60)), 'mug')
+
+    assert result is not None
+    assert cancelled == ['fal-ai/flux-kontext-lora']
+    stats = batch_processor.get_metrics()['hedging']
+    assert stats['backup_wins'] == 1 and stats['hedged'] == 1
+    # Отменённый проигравший вызов LoRA не считается ни успехом, ни ошибкой
+    breaker = batch_processor.get_metrics()['circuit_breakers']
+    assert all(state['calls'] == 0 for state in breaker.values())
+
+
+def fal_handles(monkeypatch, batch_processor, lora_seconds, failures=()):
+    """Подменить fal_client.submit: LoRA отвечает через lora_seconds, BiRefNet сразу; failures — ответы 429"""
+    import fal_client
+    from src.processors import batch_processor as module
+
+    submitted = []
+    failures = list(failures)
+
+    class RateLimited(Exception):
+        status_code = 429
+
+    class Handle:
+        def __init__(self, application):
+            self.application = application
+
+        def get(self):
+            if self.application == 'fal-ai/flux-kontext-lora':
+                time.sleep(lora_seconds)
+                return {'images': [{'url': 'https://fal.media/lora.png'}]}
+            return {'image': {'url': 'https://fal.media/birefnet.png'}}
+
+        def cancel(self):
+            pass
+
+    def submit(application, arguments=None):
+        if failures and failures.pop(0) == application:
+            raise RateLimited("429 Too Many Requests")
+        submitted.append(application)
+        return Handle(application)
+
+    batch_processor.model_registry.db_manager.initialize_database()
+    monkeypatch.setenv('FAL_KEY', 'test-key')
+    monkeypatch.setattr(fal_client, 'submit', submit)
+    monkeypatch.setattr(module.http_client, 'download_image', lambda url: Image.new('RGBA', (60, 60)))
+    batch_processor.background.lora_latency = LatencyTracker(min_samples=1, floor=0.05)
+    batch_processor.background.lora_latency.record(0.05)
+    return submitted
+
+
+def test_hedged_lora_retries_rate_limit(batch_processor, monkeypatch):
+    """429 на хеджированном запросе LoRA повторяется, а не уходит сразу в BiRefNet"""
+    submitted = fal_handles(monkeypatch, batch_processor, lora_seconds=0,
+                            failures=['fal-ai/flux-kontext-lora'])
+
+    assert batch_processor._remove_background_fal_v2(Image.new('RGB', (60, 60)), 'mug') is not None
+    assert submitted == ['fal-ai/flux-kontext-lora']
+    stats = batch_processor.get_metrics()['hedging']
+    assert stats['primary_wins'] == 1 and stats['hedged'] == 0
+
+
+def test_backup_cancelled_in_slot_queue_is_not_sent(batch_processor, monkeypatch):
+    """Резервный запрос, отменённый пока ждал слот, не отправляется"""
+    from contextlib import contextmanager
+
+    submitted = fal_handles(monkeypatch, batch_processor, lora_seconds=0.2)
+    limiter_slot = batch_processor.background.limiter.slot
+
+    @contextmanager
+    def slot(*args, **kwargs):
+        if threading.current_thread().name == f"hedge-{BACKUP}":
+            time.sleep(0.4)
+        with limiter_slot(*args, **kwargs) as call:
+            yield call
+
+    monkeypatch.setattr(batch_processor.background.limiter, 'slot', slot)
+
+    assert batch_processor._remove_background_fal_v2(Image.new('RGB', (60, 60)), 'mug') is not None
+    time.sleep(0.5)
+    assert submitted == ['fal-ai/flux-kontext-lora']
+    assert batch_processor.get_metrics()['hedging']['hedged'] == 1
@@ -0,0 +1,82 @@
+"""
+Тесты для общего HTTP-клиента с пулом соединений (HttpClient).
+"""
+
+import io
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from PIL import Image
+
+from src.utils.http_client import HttpClient, ResponseTooLarge
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Отдаёт PNG, запоминает порт клиента каждого запроса"""
+
+    protocol_version = 'HTTP/1.1'
+    client_ports = []
+
+    def do_GET(self):
+        ImageHandler.client_ports.append(self.client_address[1])
+        buffer = io.BytesIO()
+        Image.new('RGBA', (40, 40), (10, 200, 10, 255)).save(buffer, format='PNG')
+        body = buffer.getvalue()
+        self.send_response(404 if self.path == '/missing.png' else 200)
+        self.send_header('Content-Type', 'image/png')
+        if self.path != '/chunked.png':
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            # Без Content-Length: размер известен только после чтения
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(body)
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    """Локальный HTTP-сервер с keep-alive"""
+    ImageHandler.client_ports = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_connection_reused(server_url):
+    """Последовательные загрузки идут через одно keep-alive соединение"""
+    client = HttpClient(pool_size=2)
+
+    images = [client.download_image(f"{server_url}/result_{i}.png") for i in range(3)]
+
+    assert all(image.getpixel((0, 0)) == (10, 200, 10, 255) for image in images)
+    assert len(set(ImageHandler.client_ports)) == 1
+    assert client.stats()['downloads'] == 3
+
+
+def test_body_limit(server_url):
+    """Ответ больше лимита отклоняется по Content-Length и при потоковом чтении"""
+    client = HttpClient(max_body_bytes=10)
+
+    with pytest.raises(ResponseTooLarge):
+        client.download(f"{server_url}/result.png")
+    with pytest.raises(ResponseTooLarge):
+        client.download(f"{server_url}/chunked.png")
+    assert client.stats()['rejected_too_large'] == 2
+    assert client.download(f"{server_url}/result.png", max_bytes=1024 * 1024)[:4] == b'\x89PNG'
+
+
+def test_http_error_raised(server_url):
+    """Ошибочный статус не декодируется как изображение"""
+    import requests
+
+    with pytest.raises(requests.HTTPError):
+        HttpClient().download_image(f"{server_url}/missing.png")
@@ -0,0 +1,109 @@
+"""
+Тесты для подключаемых backend'ов анализа и удаления фона и офлайн mock backend'а.
+"""
+
+import pytest
+from PIL import Image, ImageDraw
+
+from src.processors.inference_backends import SegmentationBackends, FAL_PROVIDER, REMBG
+from tests.mock_backends import (
+    MockAnalyzer, MockHandle, MockInferenceError, MockProfile, MockSegmentationBackend, mock_cutout
+)
+
+
+def product_image(size=(80, 120), color=(200, 40, 40)):
+    """Изображение товара на белом фоне"""
+    image = Image.new('RGB', size, 'white')
+    ImageDraw.Draw(image).rectangle((20, 30, size[0] - 20, size[1] - 10), fill=color)
+    return image
+
+
+def test_mock_cutout_is_deterministic():
+    """Маска: фон цвета угла прозрачный, товар непрозрачный, результат повторяется"""
+    cutout = mock_cutout(product_image())
+
+    assert cutout.mode == 'RGBA'
+    assert cutout.getpixel((2, 2))[3] == 0
+    assert cutout.getpixel((40, 60))[3] == 255
+    assert cutout.tobytes() == mock_cutout(product_image()).tobytes()
+
+
+def test_mock_profile_draws_seeded_latency_and_errors():
+    """Распределение задержек и ошибок воспроизводится при одном seed"""
+    draws = [MockProfile(latency=1.0, jitter=0.5, error_rate=0.3, seed=7).draw() for _ in range(2)]
+    assert draws[0] == draws[1]
+
+    profile = MockProfile(latency=0.0, error_rate=0.3, seed=1)
+    failures = sum(profile.draw()[1] for _ in range(1000))
+    assert 200 < failures < 400
+
+
+def test_mock_handle_fails_and_cancels():
+    """Mock-запрос выбрасывает заданную ошибку и прерывается отменой"""
+    with pytest.raises(MockInferenceError):
+        MockHandle(product_image(), 0, True, 'fal-ai/birefnet').get()
+
+    handle = MockHandle(product_image(), 5, False, 'fal-ai/birefnet')
+    handle.cancel()
+    with pytest.raises(MockInferenceError, match='cancelled'):
+        handle.get()
+
+
+def test_backends_routed_by_provider(monkeypatch):
+    """Backend выбирается по provider модели, SEGMENTATION_BACKEND переопределяет все"""
+    monkeypatch.delenv('SEGMENTATION_BACKEND', raising=False)
+    backends = SegmentationBackends()
+    assert backends.get(FAL_PROVIDER).name == FAL_PROVIDER
+    with pytest.raises(ValueError):
+        backends.get('replicate')
+
+    monkeypatch.setenv('SEGMENTATION_BACKEND', 'mock')
+    assert SegmentationBackends().get('replicate').name == 'mock'
+    with pytest.raises(ValueError):
+        SegmentationBackends(override='onnx')
+
+
+def test_optional_backends_created_on_first_use(monkeypatch):
+    """Необязательные backend'ы (rembg, mock) создаются только при выборе и один раз"""
+    monkeypatch.delenv('SEGMENTATION_BACKEND', raising=False)
+    backends = SegmentationBackends()
+    assert set(backends._backends) == {FAL_PROVIDER}
+
+    backends = SegmentationBackends(override=REMBG)
+    assert REMBG not in backends._backends
+    rembg_backend = backends.get(FAL_PROVIDER)
+    assert rembg_backend.name == REMBG
+    assert backends.get('replicate') is rembg_backend
+
+
+def test_mock_analyzer_without_api_key(monkeypatch):
+    """Mock-анализ не требует ключа OpenAI и зависит только от пикселей"""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    analyzer = MockAnalyzer(profile=MockProfile())
+
+    result = analyzer.analyze_image(product_image())
+
+    assert result['success']
+    assert result['analysis'] == analyzer.analyze_image(product_image())['analysis']
+    assert result['analysis']['geometry']['orientation'] == 'vertical'
+    assert 'product' in analyzer.create_lora_prompt(result['analysis'])
+
+    failing = MockAnalyzer(profile=MockProfile(error_rate=1.0))
+    assert not failing.analyze_image(product_image())['success']
+
+
+def test_lora_through_mock_backend(batch_processor):
+    """Путь LoRA с mock backend работает без сети и учитывает ошибки в circuit breaker"""
+    batch_processor.model_registry.db_manager.initialize_database()
+    batch_processor.background.segmentation = SegmentationBackends(override='mock')
+    batch_processor.background.segmentation.register('mock', MockSegmentationBackend(MockProfile()))
+
+    result = batch_processor._remove_background_fal_v2(product_image(), 'red box')
+
+    assert result.size == (80, 120)
+    assert result.getpixel((2, 2))[3] == 0
+
+    batch_processor.background.segmentation.register('mock', MockSegmentationBackend(MockProfile(error_rate=1.0)))
+    assert batch_processor._remove_background_fal_v2(product_image(color=(0, 0, 200)), 'blue box') is None
+    breakers = batch_processor.get_metrics()['circuit_breakers']
+    assert any(breaker['failure_rate'] > 0 for breaker in breakers.values())
@@ -0,0 +1,70 @@
+"""
+Тесты для уменьшения входа до max_resolution модели и восстановления результата.
+"""
+
+import io
+
+from PIL import Image
+
+from src.utils.inference_resize import parse_resolution, fit_within, restore_resolution
+
+
+def test_fit_within_keeps_area_and_aspect():
+    """Уменьшение по площади с сохранением пропорций, маленькие изображения не меняются"""
+    image = Image.new('RGB', (2000, 4000))
+
+    small = fit_within(image, (1024, 1024))
+
+    assert small.width * small.height <= 1024 * 1024
+    assert abs(small.height / small.width - 2.0) < 0.01
+    tiny = Image.new('RGB', (300, 300))
+    assert fit_within(tiny, (1024, 1024)) is tiny
+    assert parse_resolution('768x512') == (768, 512)
+    assert parse_resolution('auto') == (1024, 1024)
+
+
+def test_restore_applies_mask_to_original_pixels():
+    """Маска результата переносится на исходные пиксели полного разрешения"""
+    original = Image.new('RGB', (400, 200), (10, 120, 250))
+    original.putpixel((399, 199), (1, 2, 3))
+    mask_result = Image.new('RGBA', (200, 100), (0, 0, 0, 255))
+    mask_result.paste((0, 0, 0, 0), (0, 0, 100, 100))
+
+    restored = restore_resolution(original, mask_result)
+
+    assert restored.size == (400, 200)
+    assert restored.getpixel((10, 10))[3] == 0
+    assert restored.getpixel((399, 199)) == (1, 2, 3, 255)
+
+
+def test_restore_upscales_opaque_result():
+    """Непрозрачный результат увеличивается до исходного размера"""
+    restored = restore_resolution(Image.new('RGB', (400, 200)), Image.new('RGB', (200, 100), (255, 255, 255)))
+
+    assert restored.size == (400, 200)
+    assert restored.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_birefnet_receives_downscaled_input(batch_processor, monkeypatch):
+    """В BiRefNet уходит уменьшенное изображение, результат возвращается в исходном размере"""
+    import fal_client
+    from src.processors import batch_processor as module
+
+    uploaded = []
+
+    def storage(data, content_type):
+        uploaded.append(Image.open(io.BytesIO(data)).size)
+        return 'https://storage.test/source.png'
+
+    batch_processor.upload_manager.uploader = storage
+    batch_processor.upload_manager.mode = 'fal'
+    monkeypatch.setattr(fal_client, 'subscribe',
+                        lambda endpoint, arguments=None, **kwargs: {'image': {'url': 'https://fal.media/r.png'}})
+    monkeypatch.setattr(module.http_client, 'download_image',
+                        lambda url: Image.new('RGBA', (1024, 1024), (0, 0, 0, 255)))
+
+    result = batch_processor._remove_background_birefnet(Image.new('RGB', (2048, 2048), (5, 6, 7)))
+
+    assert uploaded == [(1024, 1024)]
+    assert result.size == (2048, 2048)
+    assert result.getpixel((0, 0)) == (5, 6, 7, 255)
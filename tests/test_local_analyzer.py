@@ -0,0 +1,102 @@
+"""
+Тесты для локального эвристического анализа, заменяющего GPT при высокой уверенности.
+"""
+
+import random
+
+from PIL import Image
+
+from src.processors.analysis_index import AnalysisIndex
+from src.processors.local_analyzer import LocalHeuristicAnalyzer
+
+
+def product_photo(size=(400, 600), box=(150, 150, 250, 550), color=(200, 30, 30), background=(255, 255, 255)):
+    """Товар-прямоугольник на однотонном фоне"""
+    image = Image.new('RGB', size, background)
+    image.paste(color, box)
+    return image
+
+
+def test_plain_background_and_filename_hint_are_confident():
+    """Однотонный фон и товар в имени файла: анализ без GPT"""
+    analyzer = LocalHeuristicAnalyzer(threshold=0.75)
+
+    result = analyzer.analyze(product_photo(), 'SKU-1042_red_bottle.jpg')
+
+    assert result['confident'] and result['confidence'] >= 0.75
+    analysis = result['analysis']
+    assert analysis['category'] == 'fmcg'
+    assert analysis['geometry']['physical_property'] == 'stands'
+    assert analysis['geometry']['orientation'] == 'vertical'
+    assert analysis['canvas_settings']['size'] == '1600x1600'
+    # Высокий стоящий товар растягивается по высоте холста
+    assert analysis['canvas_settings']['positioning'] == 'fill_vertical'
+    assert analysis['visual_properties']['primary_color'] == 'red'
+    assert analysis['lora_optimization']['main_object_description'] == 'red bottle'
+    assert result['signals']['object_bbox'] == [150, 150, 250, 550]
+
+
+def test_transparent_cutout_uses_alpha_box():
+    """Прозрачный фон: рамка объекта берётся из альфа-канала"""
+    image = Image.new('RGBA', (300, 300), (0, 0, 0, 0))
+    image.paste((40, 80, 200, 255), (50, 100, 250, 200))
+
+    result = LocalHeuristicAnalyzer(threshold=0.75).analyze(image, 'кроссовки_синие.png')
+
+    assert result['confident']
+    assert result['signals']['box_score'] == 1.0
+    assert result['analysis']['canvas_settings']['positioning'] == 'bottom_aligned'
+    assert result['analysis']['visual_properties']['primary_color'] == 'blue'
+
+
+def test_gpt_needed_without_description_or_on_busy_background():
+    """Без подсказки в имени или на пёстром фоне нужен GPT"""
+    analyzer = LocalHeuristicAnalyzer(threshold=0.75)
+
+    no_hint = analyzer.analyze(product_photo(), 'IMG_0042.jpg')
+    assert not no_hint['confident']
+    assert no_hint['analysis']['category'] == 'unknown'
+
+    rng = random.Random(1)
+    busy = Image.new('RGB', (200, 200))
+    busy.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(200 * 200)])
+    assert not analyzer.analyze(busy, 'shoe.jpg')['confident']
+
+    stats = analyzer.stats()
+    assert stats['analyzed'] == 2 and stats['confident'] == 0 and stats['no_description'] == 1
+
+
+def test_batch_skips_gpt_for_confident_images(batch_processor, make_upload, monkeypatch):
+    """Пакет вызывает GPT только для изображений, где локальный анализ не уверен"""
+    analyze = batch_processor.gpt_analyzer.analyze_image
+    calls = []
+
+    def counting_analyze(image, *args, **kwargs):
+        calls.append(image.size)
+        return analyze(image, *args, **kwargs)
+
+    monkeypatch.setattr(batch_processor.gpt_analyzer, 'analyze_image', counting_analyze)
+
+    result = batch_processor.process_batch([
+        make_upload("SKU7_sneakers.png", image=product_photo(color=(20, 20, 20))),
+        make_upload("a.png", image=product_photo(size=(500, 400), box=(100, 100, 300, 300)))
+    ], batch_id="batch_local")
+
+    assert calls == [(500, 400)]
+    by_name = {r['filename']: r for r in result['results']}
+    assert by_name['SKU7_sneakers.png']['analysis']['category'] == 'fashion'
+    assert batch_processor.get_metrics()['local_analysis']['confident'] == 1
+
+
+def test_local_analysis_not_indexed_after_restart(batch_processor, make_upload):
+    """Локальный анализ не сохраняется с хешем и не попадает в индекс похожих после перезапуска"""
+    batch_processor.process_batch([
+        make_upload("red_shoes.png", image=product_photo()),
+        make_upload("b.png", image=product_photo(size=(500, 400), box=(100, 100, 300, 300)))
+    ], batch_id="batch_local_restart")
+
+    hashes = {row['filename']: row['image_hash'] for row in batch_processor.get_history("batch_local_restart")}
+    assert hashes['red_shoes.png'] is None and hashes['b.png']
+
+    restarted = AnalysisIndex(batch_processor.db_path)
+    assert restarted.stats()['entries'] == 1
@@ -0,0 +1,130 @@
+"""
+Тесты для пакетного GPT-анализа: объединение одновременных запросов и разбор ответа.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from src.processors.analysis_schema import COMPACT_PROMPT
+from src.utils.micro_batch import MicroBatcher
+
+
+class Response:
+    """Имитация ответа OpenAI Responses API"""
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    """GPTProductAnalyzer с тестовым ключом"""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    from src.processors.gpt_analyzer import GPTProductAnalyzer
+    return GPTProductAnalyzer()
+
+
+def test_concurrent_items_share_one_batch_call():
+    """Одновременные запросы попадают в один пакет, результаты возвращаются по порядку"""
+    batches = []
+
+    def process(items):
+        batches.append(list(items))
+        time.sleep(0.05)
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(process, max_batch=4, max_wait=0.5)
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(batcher.submit, range(4)))
+
+    assert results == [0, 10, 20, 30]
+    assert [sorted(batch) for batch in batches] == [[0, 1, 2, 3]]
+    stats = batcher.stats()
+    assert stats['batches'] == 1 and stats['items'] == 4 and stats['max_size'] == 4
+
+
+def test_lone_item_waits_at_most_max_wait():
+    """Одиночный запрос не ждёт заполнения пакета дольше max_wait"""
+    batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch=8, max_wait=0.05)
+
+    started = time.time()
+    assert batcher.submit(1) == 2
+    assert time.time() - started < 1
+
+    # max_batch <= 1 отключает пакетирование
+    assert MicroBatcher(lambda items: items, max_batch=1).submit('x') == 'x'
+
+
+def test_batch_error_reaches_every_item():
+    """Ошибка пакетного вызова передаётся каждому запросу пакета"""
+    def fail(items):
+        time.sleep(0.05)
+        raise RuntimeError('boom')
+
+    batcher = MicroBatcher(fail, max_batch=3, max_wait=0.5)
+    with ThreadPoolExecutor(3) as executor:
+        futures = [executor.submit(batcher.submit, i) for i in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match='boom'):
+                future.result()
+    assert batcher.stats()['errors'] == 1
+
+
+def test_analyze_images_sends_prompt_once_and_splits_items(analyzer, monkeypatch):
+    """Один запрос на несколько изображений; некорректный элемент анализируется отдельно"""
+    import src.processors.gpt_analyzer as module
+
+    images = [Image.new('RGB', (100, 200 + 50 * i), (30 * i, 60, 90)) for i in range(3)]
+    items = []
+    for index, category in [(2, 'diy'), (0, 'home')]:
+        item = analyzer._get_fallback_analysis(images[index])
+        item['category'] = category
+        item['geometry']['aspect_ratio'] = 0.0
+        items.append({'index': index, **item})
+    # Элемент без geometry не проходит проверку
+    items.append({'index': 1, 'category': 'fashion'})
+
+    payloads = []
+
+    def post(url, json=None, **kwargs):
+        payloads.append(json)
+        return Response({'output_text': module.json.dumps(items)})
+
+    monkeypatch.setattr(module.http_client, 'post', post)
+    single_calls = []
+    monkeypatch.setattr(analyzer, 'analyze_image',
+                        lambda image: single_calls.append(image) or {'success': True, 'analysis': {'category': 'single'}})
+
+    results = analyzer.analyze_images(images)
+
+    assert len(payloads) == 1
+    content = payloads[0]['input'][0]['content']
+    assert sum(COMPACT_PROMPT in part.get('text', '') for part in content) == 1
+    assert sum(part['type'] == 'input_image' for part in content) == 3
+
+    assert [result['analysis']['category'] for result in results] == ['home', 'single', 'diy']
+    assert single_calls == [images[1]]
+    assert results[2]['analysis']['geometry']['aspect_ratio'] == round(100 / 300, 2)
+
+
+def test_analyze_images_falls_back_when_batch_request_fails(analyzer, monkeypatch):
+    """Ошибка пакетного запроса переводит все изображения на одиночный анализ"""
+    import src.processors.gpt_analyzer as module
+
+    monkeypatch.setattr(module.http_client, 'post', lambda *args, **kwargs: Response({'error': 'bad'}, 500))
+    monkeypatch.setattr(analyzer, 'analyze_image', lambda image: {'success': True, 'analysis': {'size': image.size}})
+
+    images = [Image.new('RGB', (50 + i, 50)) for i in range(2)]
+    results = analyzer.analyze_images(images)
+
+    assert [result['analysis']['size'] for result in results] == [(50, 50), (51, 50)]
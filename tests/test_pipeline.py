@@ -0,0 +1,103 @@
+"""
+Тесты для конвейера пакетной обработки (StagedPipeline).
+"""
+
+import io
+import threading
+import time
+
+from src.processors.pipeline import StagedPipeline, PipelineStage
+
+
+def test_jobs_pass_all_stages():
+    """Каждая задача проходит все стадии по порядку"""
+    def first(job):
+        job['trace'].append('first')
+
+    def second(job):
+        job['trace'].append('second')
+
+    pipeline = StagedPipeline([
+        PipelineStage('first', first, workers=2),
+        PipelineStage('second', second, workers=3)
+    ])
+    jobs = [{'id': i, 'trace': []} for i in range(20)]
+
+    results = list(pipeline.run(jobs))
+
+    assert sorted(job['id'] for job in results) == list(range(20))
+    assert all(job['trace'] == ['first', 'second'] for job in results)
+    stats = pipeline.get_stats()
+    assert stats['first']['processed'] == 20
+    assert stats['second']['workers'] == 3
+
+
+def test_failed_job_skips_stages_except_run_on_error():
+    """Ошибка стадии пропускает следующие стадии, кроме run_on_error"""
+    def failing(job):
+        if job['id'] == 1:
+            raise ValueError("boom")
+
+    def middle(job):
+        job['middle'] = True
+
+    def sink(job):
+        job['sink'] = True
+
+    pipeline = StagedPipeline([
+        PipelineStage('failing', failing),
+        PipelineStage('middle', middle),
+        PipelineStage('sink', sink, run_on_error=True)
+    ])
+
+    results = {job['id']: job for job in pipeline.run([{'id': 0}, {'id': 1}])}
+
+    assert results[1]['status'] == 'error'
+    assert results[1]['error'] == 'boom'
+    assert results[1]['failed_stage'] == 'failing'
+    assert 'middle' not in results[1]
+    assert results[1]['sink'] is True
+    assert results[0]['middle'] is True
+    assert pipeline.get_stats()['failing']['failed'] == 1
+
+
+def test_stage_workers_run_concurrently():
+    """Медленная сетевая стадия обрабатывает задачи параллельно"""
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def network(job):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+
+    pipeline = StagedPipeline([PipelineStage('network', network, workers=8)])
+
+    started = time.time()
+    list(pipeline.run([{'id': i} for i in range(16)]))
+
+    assert max(peak) > 1
+    assert time.time() - started < 16 * 0.05
+
+
+def test_batch_processor_runs_staged_pipeline(batch_processor, make_upload):
+    """BatchProcessor обрабатывает пакет через стадии конвейера"""
+    updates = []
+    files = [make_upload(f"item_{i}.png") for i in range(4)]
+    files.append(make_upload("broken.png"))
+    files[-1].stream = io.BytesIO(b'not an image')
+
+    result = batch_processor.process_batch(files, progress_callback=updates.append,
+                                           stage_workers={'analyze': 2})
+
+    assert result['total_files'] == 5
+    assert result['successful'] == 4
+    assert result['failed'] == 1
+    assert len(updates) == 5
+    assert 'stages' in updates[-1]
+    history = batch_processor.get_history(batch_id=result['batch_id'])
+    assert len(history) == 5
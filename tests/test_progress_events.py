@@ -0,0 +1,90 @@
+"""
+Тесты для SSE-потока прогресса (ProgressEventLog, /progress_stream).
+"""
+
+import threading
+
+import pytest
+
+from src.utils.progress_events import ProgressEventLog
+
+
+def test_events_after_resumes_from_id():
+    """Клиент получает только события после последнего известного ID"""
+    log = ProgressEventLog()
+    log.open('batch_1')
+    for i in range(3):
+        log.publish('batch_1', 'file', {'index': i})
+
+    events = log.events_after('batch_1', last_event_id=1)
+
+    assert [e['id'] for e in events] == [2, 3]
+    assert events[0]['data'] == {'index': 1}
+
+
+def test_stream_ends_after_close():
+    """Поток завершается после закрытия и отдачи всех событий"""
+    log = ProgressEventLog()
+    log.open('batch_1')
+    log.publish('batch_1', 'file', {'name': 'a.png'})
+    log.publish('batch_1', 'done', {'successful': 1})
+    log.close('batch_1')
+
+    chunks = list(log.stream('batch_1'))
+
+    assert chunks[0] == "retry: 2000\n\n"
+    assert chunks[1] == 'id: 1\nevent: file\ndata: {"name": "a.png"}\n\n'
+    assert chunks[2].startswith('id: 2\nevent: done\n')
+    assert len(chunks) == 3
+
+
+def test_reader_wakes_on_publish():
+    """Ожидающий читатель получает событие сразу после публикации"""
+    log = ProgressEventLog()
+    log.open('batch_1')
+    timer = threading.Timer(0.05, log.publish, args=('batch_1', 'file', {'index': 0}))
+    timer.start()
+
+    events = log.events_after('batch_1', 0, timeout=5)
+
+    assert [e['event'] for e in events] == ['file']
+    assert log.events_after('batch_1', 1, timeout=0.01) == []
+    assert log.events_after('unknown', 0) is None
+
+
+def test_closed_streams_expire():
+    """Закрытые потоки удаляются по истечении срока хранения"""
+    log = ProgressEventLog(retention=0)
+    log.open('old')
+    log.close('old')
+
+    log.open('new')
+
+    assert not log.has_stream('old')
+    assert log.has_stream('new')
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Flask-клиент приложения пакетной обработки"""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.chdir(tmp_path)
+    import app_batch
+    import app_progress
+    return app_batch.app.test_client(), app_progress
+
+
+def test_progress_stream_endpoint(client):
+    """SSE-эндпоинт отдаёт события начиная с Last-Event-ID"""
+    test_client, app_progress = client
+    app_progress.progress_events.open('batch_42')
+    for name in ('a.png', 'b.png'):
+        app_progress.progress_events.publish('batch_42', 'file', {'name': name})
+    app_progress.progress_events.close('batch_42')
+
+    response = test_client.get('/progress_stream/batch_42', headers={'Last-Event-ID': '1'})
+
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert 'b.png' in body and 'a.png' not in body
+    assert test_client.get('/progress_stream/missing').status_code == 404
@@ -0,0 +1,155 @@
+"""
+Тесты для общего лимита запросов к провайдерам: бюджеты, приоритеты и Retry-After.
+"""
+
+import json
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+from PIL import Image
+
+from src.utils.concurrency import AdaptiveConcurrencyLimiter
+from src.utils.rate_limit import (
+    RateLimiter, parse_retry_after, request_priority, retry_rate_limited, INTERACTIVE
+)
+
+
+def test_request_budget_limits_burst():
+    """После исчерпания бюджета запрос ждёт пополнения корзины"""
+    limiter = RateLimiter('test', requests_per_minute=120)  # 2 в секунду, запас на 10 секунд
+    for _ in range(20):
+        assert limiter.acquire() < 0.05
+
+    waited = limiter.acquire()
+    assert 0.3 < waited < 1.0
+    assert limiter.stats()['queued'] == 1
+
+
+def test_token_budget_and_usage_correction():
+    """Бюджет токенов резервируется по оценке и корректируется по факту"""
+    limiter = RateLimiter('test', requests_per_minute=0, tokens_per_minute=6000)  # запас 1000 токенов
+    limiter.acquire(tokens=900)
+    limiter.adjust_tokens(-800)  # Фактически израсходовано 100 токенов
+    assert limiter.acquire(tokens=900, timeout=0.1) < 0.05
+
+    with pytest.raises(TimeoutError):
+        limiter.acquire(tokens=900, timeout=0.1)
+
+
+def test_interactive_calls_served_before_batch():
+    """Интерактивный запрос обслуживается раньше ранее вставших в очередь пакетных"""
+    limiter = RateLimiter('test', requests_per_minute=0)
+    limiter.backoff(0.3)
+    order = []
+
+    def call(name):
+        limiter.acquire()
+        order.append(name)
+
+    @request_priority(INTERACTIVE)
+    def single():
+        call('single')
+
+    threads = [threading.Thread(target=call, args=(f"batch_{i}",)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=single)
+    interactive.start()
+    for thread in threads + [interactive]:
+        thread.join()
+
+    assert order[0] == 'single'
+    assert order[1:] == ['batch_0', 'batch_1', 'batch_2']
+    assert limiter.stats()['interactive'] == 1
+
+
+def test_retry_after_parsing():
+    """Retry-After в секундах и в виде HTTP-даты"""
+    assert parse_retry_after('3') == 3.0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_429_blocks_provider_for_retry_after():
+    """429 с Retry-After приостанавливает все запросы к провайдеру"""
+    rate_limiter = RateLimiter('test', requests_per_minute=0)
+    limiter = AdaptiveConcurrencyLimiter('test', rate_limiter=rate_limiter)
+
+    with limiter.slot() as slot:
+        slot.report_status(429, {'Retry-After': '0.3'})
+
+    assert rate_limiter.stats()['blocked_for'] > 0.2
+    started = time.time()
+    with limiter.slot():
+        pass
+    assert time.time() - started >= 0.25
+
+
+def test_retry_rate_limited_repeats_only_429():
+    """Повторяются только отказы 429"""
+    class RateLimited(Exception):
+        status_code = 429
+
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return 'ok'
+
+    assert retry_rate_limited(flaky, retries=3) == 'ok'
+    with pytest.raises(ValueError):
+        retry_rate_limited(lambda: (_ for _ in ()).throw(ValueError()), retries=3)
+
+
+def test_retry_rate_limited_repeats_rejected_results():
+    """Ответ 429 без исключения повторяется, после последней попытки возвращается как есть"""
+    statuses = [429, 429, 200]
+    assert retry_rate_limited(lambda: statuses.pop(0), retries=3, rejected=lambda status: status == 429) == 200
+
+    attempts = []
+
+    def always_rejected():
+        attempts.append(1)
+        return 429
+
+    assert retry_rate_limited(always_rejected, retries=2, rejected=lambda status: status == 429) == 429
+    assert len(attempts) == 3
+
+
+def test_analyzer_retries_after_429(monkeypatch):
+    """Анализ GPT после 429 ждёт Retry-After и повторяет запрос вместо fallback"""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    from src.processors import gpt_analyzer as module
+
+    rate_limiter = RateLimiter('openai', requests_per_minute=0, tokens_per_minute=600000)
+    analyzer = module.GPTProductAnalyzer(limiter=AdaptiveConcurrencyLimiter('openai', rate_limiter=rate_limiter))
+    analysis = analyzer._get_fallback_analysis(Image.new('RGB', (60, 60)))
+    analysis['category'] = 'home'
+
+    class Response:
+        def __init__(self, status_code, body, headers=None):
+            self.status_code = status_code
+            self.headers = headers or {}
+            self.body = body
+            self.text = json.dumps(body)
+
+        def json(self):
+            return self.body
+
+    responses = [
+        Response(429, {'error': 'rate limit'}, {'Retry-After': '0.1'}),
+        Response(200, {'output_text': json.dumps(analysis), 'usage': {'total_tokens': 1200}})
+    ]
+    monkeypatch.setattr(module.http_client, 'post', lambda *args, **kwargs: responses.pop(0))
+
+    result = analyzer.analyze_image(Image.new('RGB', (60, 60)))
+
+    assert result['success'] and result['analysis']['category'] == 'home'
+    stats = rate_limiter.stats()
+    assert stats['rate_limited'] == 1 and stats['granted'] == 2
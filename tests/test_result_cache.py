@@ -0,0 +1,101 @@
+"""
+Тесты для кэша результатов удаления фона (ResultCache).
+"""
+
+import io
+
+from PIL import Image
+
+from src.utils.result_cache import ResultCache
+
+
+SETTINGS = {'model_id': 'lora-v2', 'prompt': 'white sneaker', 'lora_path': 'a.safetensors',
+            'guidance_scale': 2.5, 'num_inference_steps': 30}
+
+
+def image(color, size=(40, 40)):
+    """Тестовое RGBA-изображение"""
+    return Image.new('RGBA', size, color)
+
+
+def test_hit_returns_stored_result(tmp_path):
+    """Повторный запрос возвращает сохранённый результат"""
+    cache = ResultCache(str(tmp_path))
+    key = cache.make_key(image((255, 0, 0, 255)), SETTINGS)
+
+    assert cache.get(key) is None
+    cache.put(key, image((0, 255, 0, 128)))
+    cached = cache.get(key)
+
+    assert cached.mode == 'RGBA'
+    assert cached.getpixel((0, 0)) == (0, 255, 0, 128)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_key_depends_on_pixels_and_settings():
+    """Ключ меняется при изменении пикселей или любого параметра"""
+    source = image((255, 0, 0, 255))
+    key = ResultCache.make_key(source, SETTINGS)
+
+    assert key == ResultCache.make_key(image((255, 0, 0, 255)), dict(SETTINGS))
+    assert key != ResultCache.make_key(image((254, 0, 0, 255)), SETTINGS)
+    for name, value in [('prompt', 'black boot'), ('num_inference_steps', 50), ('guidance_scale', 3.0),
+                        ('lora_path', 'b.safetensors'), ('model_id', 'lora-v1')]:
+        assert key != ResultCache.make_key(source, dict(SETTINGS, **{name: value}))
+
+
+def test_lru_eviction_over_budget(tmp_path):
+    """При превышении бюджета удаляются давно не использованные записи"""
+    probe = io.BytesIO()
+    image((1, 2, 3, 255)).save(probe, format='PNG')
+    cache = ResultCache(str(tmp_path), max_bytes=len(probe.getvalue()) * 2 + 10)
+
+    cache.put('a', image((1, 2, 3, 255)))
+    cache.put('b', image((1, 2, 3, 255)))
+    cache.get('a')
+    cache.put('c', image((1, 2, 3, 255)))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_index_survives_restart(tmp_path):
+    """Записи, сохранённые прошлым процессом, доступны после перезапуска"""
+    ResultCache(str(tmp_path)).put('k', image((9, 9, 9, 255)))
+
+    cache = ResultCache(str(tmp_path))
+
+    assert cache.get('k') is not None
+    assert cache.stats()['entries'] == 1
+
+
+def test_repeated_upload_skips_lora_call(batch_processor, monkeypatch):
+    """Повторная загрузка того же фото не вызывает LoRA"""
+    import fal_client
+    from src.processors import batch_processor as module
+
+    batch_processor.model_registry.db_manager.initialize_database()
+    monkeypatch.setenv('FAL_KEY', 'test-key')
+    batch_processor.fal_api_key = 'test-key'
+    calls = []
+
+    def fake_subscribe(endpoint, arguments=None, **kwargs):
+        calls.append(endpoint)
+        return {'images': [{'url': 'https://fal.media/result.png'}]}
+
+    def fake_download(url, *args, **kwargs):
+        return image((0, 0, 255, 200))
+
+    monkeypatch.setattr(fal_client, 'subscribe', fake_subscribe)
+    monkeypatch.setattr(module.http_client, 'download_image', fake_download)
+    source = Image.new('RGBA', (60, 60), (200, 10, 10, 255))
+
+    first = batch_processor._remove_background_fal_v2(source, 'red mug')
+    second = batch_processor._remove_background_fal_v2(source.copy(), 'red mug')
+    batch_processor._remove_background_fal_v2(source, 'blue mug')
+
+    assert calls == ['fal-ai/flux-kontext-lora', 'fal-ai/flux-kontext-lora']
+    assert second.getpixel((0, 0)) == first.getpixel((0, 0))
+    assert batch_processor.get_metrics()['result_cache']['hits'] == 1
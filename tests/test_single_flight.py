@@ -0,0 +1,118 @@
+"""
+Тесты для объединения одинаковых одновременных запросов анализа и удаления фона.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from src.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    """Одновременные вызовы с одним ключом выполняют функцию один раз"""
+    group = SingleFlight('test')
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'result'
+
+    with ThreadPoolExecutor(5) as executor:
+        results = list(executor.map(lambda _: group.do('key', slow), range(5)))
+
+    assert calls == [1]
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == 'result' for result, _ in results)
+    assert group.stats() == {'leaders': 1, 'coalesced': 4, 'errors': 0, 'in_flight': 0}
+
+    # После завершения ключ забыт: следующий вызов выполняется заново
+    group.do('key', slow)
+    assert len(calls) == 2
+
+
+def test_error_reaches_every_waiting_caller():
+    """Ошибка ведущего вызова передаётся всем ожидающим"""
+    group = SingleFlight('test')
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("provider down")
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(group.do, 'key', failing)
+        started.wait()
+        follower = executor.submit(group.do, 'key', failing)
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+    assert group.stats()['errors'] == 1
+
+
+def test_attach_shares_queued_future():
+    """Запрос в очереди с тем же ключом не отправляется повторно"""
+    group = SingleFlight('test')
+    pending = Future()
+    starts = []
+
+    def start():
+        starts.append(1)
+        return pending
+
+    first, shared_first = group.attach('key', start)
+    second, shared_second = group.attach('key', start)
+
+    assert first is second and (shared_first, shared_second) == (False, True)
+    assert starts == [1]
+
+    pending.set_result({'image': {}})
+    assert group.stats()['in_flight'] == 0
+
+
+def test_concurrent_attach_starts_once():
+    """Одновременные attach с одним ключом отправляют запрос один раз, пока ведущий его запускает"""
+    group = SingleFlight('test')
+    pending = Future()
+    starts = []
+
+    def slow_start():
+        starts.append(1)
+        time.sleep(0.05)
+        return pending
+
+    with ThreadPoolExecutor(4) as executor:
+        attached = list(executor.map(lambda _: group.attach('key', slow_start), range(4)))
+
+    assert starts == [1]
+    assert sorted(shared for _, shared in attached) == [False, True, True, True]
+    assert len({id(future) for future, _ in attached}) == 1
+
+    pending.set_result('done')
+    assert attached[0][0].result() == 'done'
+    assert group.stats()['in_flight'] == 0
+
+
+def test_duplicate_uploads_analyzed_once(batch_processor, make_upload):
+    """Одинаковые изображения пакета анализируются одним запросом"""
+    analyze = batch_processor.gpt_analyzer.analyze_image
+    calls = []
+
+    def slow_analyze(image):
+        calls.append(1)
+        time.sleep(0.2)
+        return analyze(image)
+
+    batch_processor.gpt_analyzer.analyze_image = slow_analyze
+    files = [make_upload(f"copy_{i}.png") for i in range(3)]
+
+    result = batch_processor.process_batch(files)
+
+    assert result['successful'] == 3
+    assert calls == [1]
+    assert batch_processor.get_metrics()['single_flight']['analysis']['coalesced'] == 2
@@ -0,0 +1,116 @@
+"""
+Тесты для спекулятивного удаления фона параллельно с GPT-анализом.
+"""
+
+import threading
+import time
+
+from src.utils.speculation import Speculator, on_discard
+
+
+def test_resolve_keeps_good_guess_and_reissues_bad_one():
+    """Результат угадавшего вызова используется, неугадавшего — отбрасывается"""
+    speculator = Speculator('test', max_workers=2)
+
+    kept = speculator.start(lambda: 'guessed')
+    assert speculator.resolve(kept, guess_ok=True) == 'guessed'
+
+    wasted = speculator.start(lambda: 'guessed')
+    assert speculator.resolve(wasted, guess_ok=False) is None
+
+    def fail():
+        raise RuntimeError('boom')
+
+    assert speculator.resolve(speculator.start(fail), guess_ok=True) is None
+    assert speculator.resolve(speculator.start(lambda: None), guess_ok=True) is None
+
+    assert speculator.stats() == {'started': 4, 'kept': 1, 'reissued': 1, 'failed': 2, 'discarded': 0}
+
+
+def run_single(batch_processor, make_upload, monkeypatch, gpt_analysis):
+    """Обрабатывает одно изображение через _process_single_image, возвращает промпты вызовов LoRA"""
+    prompts = []
+
+    def fake_remove_background(image, prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return image.convert('RGBA')
+
+    def slow_analyze(image, *args, **kwargs):
+        # LoRA уже запущен, пока GPT анализирует
+        time.sleep(0.05)
+        analysis = batch_processor.gpt_analyzer._get_fallback_analysis(image)
+        analysis.update(gpt_analysis)
+        return {'success': True, 'analysis': analysis}
+
+    monkeypatch.setattr(batch_processor, '_remove_background_fal', fake_remove_background)
+    monkeypatch.setattr(batch_processor.gpt_analyzer, 'analyze_image', slow_analyze)
+
+    upload = make_upload("IMG_1.png", size=(200, 200))
+    batch_dir = batch_processor._start_batch([upload], batch_id="batch_speculative")
+    result = batch_processor._process_single_image(upload, batch_dir)
+    assert result['status'] == 'success', result
+    return prompts
+
+
+def test_speculation_kept_when_prompt_does_not_differ(batch_processor, make_upload, monkeypatch):
+    """Та же категория без особых инструкций: повторного вызова нет"""
+    prompts = run_single(batch_processor, make_upload, monkeypatch, {'category': 'unknown'})
+
+    assert len(prompts) == 1
+    assert batch_processor.get_metrics()['speculative_background']['kept'] == 1
+
+
+def test_speculation_reissued_when_prompt_differs(batch_processor, make_upload, monkeypatch):
+    """Другая категория и особые инструкции: удаление фона с настоящим промптом"""
+    prompts = run_single(batch_processor, make_upload, monkeypatch, {
+        'category': 'electronics',
+        'lora_optimization': {'main_object_description': 'glossy phone', 'special_instructions': 'handle reflections'}
+    })
+
+    assert len(prompts) == 2
+    assert 'glossy phone' in prompts[1] and 'handle reflections' in prompts[1]
+    assert batch_processor.get_metrics()['speculative_background']['reissued'] == 1
+
+
+def test_discarded_job_cancels_speculative_request(batch_processor, make_upload, monkeypatch):
+    """Ошибка анализа: спекулятивный запрос LoRA отменяется, индекс похожих не считает подсказку"""
+    cancelled = threading.Event()
+
+    def remote_remove_background(image, prompt, *args, **kwargs):
+        # Запрос к провайдеру, который можно отменить
+        on_discard(cancelled.set)
+        cancelled.wait(5)
+        return None
+
+    def failing_analyze(image, *args, **kwargs):
+        time.sleep(0.05)
+        raise RuntimeError("analysis crashed")
+
+    monkeypatch.setattr(batch_processor, '_remove_background_fal', remote_remove_background)
+    monkeypatch.setattr(batch_processor.gpt_analyzer, 'analyze_image', failing_analyze)
+
+    upload = make_upload("IMG_2.png", size=(200, 200))
+    batch_dir = batch_processor._start_batch([upload], batch_id="batch_discard")
+    result = batch_processor._process_single_image(upload, batch_dir)
+
+    assert result['status'] == 'error'
+    assert cancelled.wait(1)
+    metrics = batch_processor.get_metrics()
+    assert metrics['speculative_background']['discarded'] == 1
+    # Поиск похожего анализа для подсказки не меняет счётчики индекса
+    assert metrics['analysis_index']['hits'] + metrics['analysis_index']['misses'] == 1
+
+
+def test_final_prompt_not_queued_behind_speculation(batch_processor):
+    """Удаление фона с готовым промптом не ждёт занятый пул спекулятивных вызовов"""
+    from PIL import Image
+
+    release = threading.Event()
+    batch_processor.speculation.speculator = Speculator('background', max_workers=1)
+    blocked = batch_processor.speculation.speculator.start(lambda: release.wait(5))
+    try:
+        future = batch_processor.speculation.start_background(Image.new('RGB', (20, 20)), 'custom prompt')
+        assert future.result(timeout=1) is not None
+    finally:
+        release.set()
+    assert blocked.result(timeout=1)
@@ -0,0 +1,151 @@
+"""
+Тесты для загрузки исходных изображений один раз (UploadManager).
+"""
+
+import threading
+import time
+
+from PIL import Image
+
+from src.utils.upload_manager import UploadManager
+
+
+class FakeStorage:
+    """Хранилище-заглушка, считает загрузки"""
+
+    def __init__(self, delay=0.0):
+        self.uploads = []
+        self.delay = delay
+
+    def __call__(self, data, content_type):
+        time.sleep(self.delay)
+        self.uploads.append(data)
+        return f"https://storage.test/{len(self.uploads)}.png"
+
+
+def test_same_image_uploaded_once():
+    """Одинаковые пиксели получают один и тот же URL без повторной загрузки"""
+    storage = FakeStorage()
+    manager = UploadManager(uploader=storage, mode='fal')
+    image = Image.new('RGB', (50, 50), (10, 20, 30))
+
+    first = manager.url_for(image)
+    second = manager.url_for(image.copy())
+    other = manager.url_for(Image.new('RGB', (50, 50), (30, 20, 10)))
+
+    assert first == second != other
+    assert len(storage.uploads) == 2
+    assert manager.stats()['hits'] == 1
+
+
+def test_concurrent_requests_share_upload():
+    """Параллельные запросы одного изображения ждут одну загрузку"""
+    storage = FakeStorage(delay=0.05)
+    manager = UploadManager(uploader=storage, mode='fal')
+    image = Image.new('RGB', (50, 50), (10, 20, 30))
+    urls = []
+
+    threads = [threading.Thread(target=lambda: urls.append(manager.url_for(image))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(storage.uploads) == 1
+    assert len(set(urls)) == 1
+
+
+def test_key_locks_shared_and_released():
+    """Пока кто-то ждёт загрузку, блокировка ключа одна на всех; после загрузок таблица пуста"""
+    storage = FakeStorage(delay=0.02)
+    manager = UploadManager(uploader=storage, mode='fal', max_entries=1)
+    image = Image.new('RGB', (50, 50), (10, 20, 30))
+    others = [Image.new('RGB', (50, 50), (i, 0, 0)) for i in range(6)]
+
+    targets = [lambda: manager.url_for(image) for _ in range(4)]
+    targets += [lambda other=other: manager.url_for(other) for other in others]
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(storage.uploads) == 1 + len(others)
+    assert manager._key_locks == {}
+
+
+def test_expired_entry_uploaded_again():
+    """Устаревший URL не переиспользуется"""
+    storage = FakeStorage()
+    manager = UploadManager(uploader=storage, mode='fal', ttl=0)
+    image = Image.new('RGB', (50, 50))
+
+    manager.url_for(image)
+    time.sleep(0.01)
+    manager.url_for(image)
+
+    assert len(storage.uploads) == 2
+    assert manager.stats()['expired'] == 1
+
+
+def test_upload_failure_falls_back_to_data_url():
+    """При ошибке хранилища используется data URL"""
+    def failing(data, content_type):
+        raise RuntimeError("storage unavailable")
+
+    manager = UploadManager(uploader=failing, mode='fal')
+
+    assert manager.url_for(Image.new('RGB', (8, 8))).startswith('data:image/png;base64,')
+    assert UploadManager(mode='inline').url_for(Image.new('RGB', (8, 8))).startswith('data:image/png')
+    assert manager.stats()['failed'] == 1
+
+
+def test_fallback_and_retry_reuse_url(batch_processor, monkeypatch):
+    """BiRefNet и повторные попытки используют уже загруженный URL"""
+    import fal_client
+    from src.processors import batch_processor as module
+
+    storage = FakeStorage()
+    batch_processor.upload_manager.uploader = storage
+    batch_processor.upload_manager.mode = 'fal'
+    sent = []
+
+    def fake_subscribe(endpoint, arguments=None, **kwargs):
+        sent.append(arguments['image_url'])
+        return {'image': {'url': 'https://fal.media/result.png'}}
+
+    monkeypatch.setattr(fal_client, 'subscribe', fake_subscribe)
+    monkeypatch.setattr(module.http_client, 'download_image', lambda url: Image.new('RGBA', (8, 8)))
+    image = Image.new('RGB', (40, 40), (5, 5, 5))
+
+    batch_processor._remove_background_birefnet(image)
+    batch_processor._remove_background_birefnet(image)
+
+    assert sent == ['https://storage.test/1.png'] * 2
+    assert len(storage.uploads) == 1
+
+
+def test_repeated_upload_skips_resize(batch_processor, monkeypatch):
+    """Повторный запрос URL большого изображения не пересчитывает уменьшение"""
+    from src.processors import background_removal as module
+
+    storage = FakeStorage()
+    batch_processor.upload_manager.uploader = storage
+    batch_processor.upload_manager.mode = 'fal'
+    resized = []
+    fit_within = module.fit_within
+
+    def counting_fit_within(image, max_size):
+        resized.append(max_size)
+        return fit_within(image, max_size)
+
+    monkeypatch.setattr(module, 'fit_within', counting_fit_within)
+    image = Image.new('RGB', (400, 300), (5, 5, 5))
+
+    first = batch_processor.background.image_url(image, (100, 100))
+    second = batch_processor.background.image_url(image.copy(), (100, 100))
+    other_limit = batch_processor.background.image_url(image, (200, 200))
+
+    assert first == second != other_limit
+    assert resized == [(100, 100), (200, 200)]
+    assert len(storage.uploads) == 2